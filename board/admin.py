@@ -1,6 +1,8 @@
 from .models import FamilyToDoItem, SamsTodoItem
 from django.contrib import admin
-from .models import Post, User, PrivateMessage, UserProfile
+from django.utils import timezone
+from .models import Post, User, PrivateMessage, UserProfile, BannedWord, Job, SearchTerm
+from .search import match, query_words
 
 
 # Customizing the UserAdmin for the custom User model
@@ -33,6 +35,13 @@ class PostAdmin(admin.ModelAdmin):
     # Filtering posts by author and creation date
     list_filter = ['created_at', 'author']
 
+    def get_search_results(self, request, queryset, search_term):
+        # The full-text index rather than an ILIKE scan over every post
+        terms = query_words(search_term)
+        if not terms:
+            return queryset, False
+        return match(queryset, SearchTerm.POST, terms), False
+
 
 # Registering PrivateMessage model
 @admin.register(PrivateMessage)
@@ -67,3 +76,23 @@ class SamsTodoItemAdmin(admin.ModelAdmin):
     list_display = ('task_name', 'assigned_to', 'due_date', 'completed')
     list_filter = ('completed', 'due_date', 'assigned_to')
     search_fields = ('task_name', 'assigned_to__username')
+
+
+@admin.register(BannedWord)
+class BannedWordAdmin(admin.ModelAdmin):
+    list_display = ('word', 'added_at')
+    search_fields = ('word',)
+
+
+@admin.register(Job)
+class JobAdmin(admin.ModelAdmin):
+    list_display = ('task', 'status', 'priority', 'attempts', 'run_at', 'created_at')
+    list_filter = ('status', 'task')
+    search_fields = ('task', 'last_error')
+    actions = ['retry_jobs']
+
+    @admin.action(description='Retry selected jobs')
+    def retry_jobs(self, request, queryset):
+        count = queryset.update(status=Job.QUEUED, attempts=0, locked_at=None,
+                                run_at=timezone.now())
+        self.message_user(request, f'{count} jobs queued again.')
@@ -0,0 +1,278 @@
+"""
+JSON API for the PWA: posts, private messages, habits and family to-dos.
+
+Every endpoint needs a signed-in session, and writes also need the CSRF
+token in an X-CSRFToken header. Bodies are JSON objects, validated with the
+same forms as the HTML pages. Lists load only the columns they serialize
+and are cursor-paginated where they can grow without bound.
+
+Each GET carries a strong ETag made from the ``(id, updated_at)`` of the
+rows it returns. A client revalidating with If-None-Match gets a 304 before
+anything is serialized.
+"""
+import hashlib
+import json
+from functools import wraps
+
+from django.db.models import Q
+from django.http import HttpResponse, HttpResponseNotAllowed, JsonResponse
+from django.shortcuts import get_object_or_404
+from django.utils.cache import get_conditional_response, patch_cache_control
+from django.utils.http import quote_etag
+
+from .forms import FamilyTodoForm, HabitForm, PostForm, PrivateMessageForm
+from .habits import reset_if_due
+from .models import FamilyToDoItem, Habit, Post, PrivateMessage
+from .pagination import CursorPaginator
+from .throttling import throttle
+from .views import publish_post, send_private_message
+
+API_PAGE_SIZE = 20
+
+POST_FIELDS = ['id', 'title', 'content', 'created_at', 'updated_at', 'author__username']
+MESSAGE_FIELDS = ['id', 'conversation', 'content', 'timestamp', 'read_at', 'updated_at',
+                  'sender__username', 'recipient__username']
+HABIT_FIELDS = ['id', 'user', 'name', 'frequency', 'current_count', 'target_count',
+                'completed', 'reset_at', 'updated_at']
+TODO_FIELDS = ['id', 'task_name', 'due_date', 'completed', 'updated_at',
+               'assigned_to__username']
+
+
+def error(message, status=400, **extra):
+    return JsonResponse({'status': 'error', 'message': message, **extra}, status=status)
+
+
+def api_view(*methods):
+    """
+    Allow ``methods`` from signed-in users only, answering others with JSON
+    errors rather than a login redirect. JSON bodies are parsed into
+    ``request.data``.
+    """
+    def decorator(view_func):
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            if not request.user.is_authenticated:
+                return error('Authentication required', status=401)
+            if request.method not in methods:
+                return HttpResponseNotAllowed(methods)
+            request.data = {}
+            if request.method in ('POST', 'PATCH'):
+                try:
+                    request.data = json.loads(request.body or b'{}')
+                except ValueError:
+                    return error('Body must be JSON')
+                if not isinstance(request.data, dict):
+                    return error('Body must be a JSON object')
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
+
+
+def rows_etag(rows, *extra):
+    # Every row rather than just the newest, so a deleted row changes it too
+    digest = hashlib.sha256()
+    for row in rows:
+        digest.update(f'{row.pk}:{row.updated_at.isoformat()};'.encode())
+    digest.update(repr(extra).encode())
+    return quote_etag(digest.hexdigest()[:32])
+
+
+def conditional_json(request, etag, build):
+    """
+    A 304 if the client already has ``etag``, otherwise ``build()``
+    serialized to JSON. Either way the client must revalidate next time.
+    """
+    response = get_conditional_response(request, etag=etag)
+    if response is None:
+        response = JsonResponse(build())
+    response['ETag'] = etag
+    patch_cache_control(response, private=True, no_cache=True)
+    return response
+
+
+def page_json(request, page, serialize):
+    etag = rows_etag(page, page.next_cursor, page.previous_cursor)
+    return conditional_json(request, etag, lambda: {
+        'results': [serialize(row) for row in page],
+        'next': page.next_cursor,
+        'previous': page.previous_cursor,
+    })
+
+
+def list_json(request, rows, serialize):
+    return conditional_json(request, rows_etag(rows), lambda: {
+        'results': [serialize(row) for row in rows],
+    })
+
+
+def form_errors(form):
+    return error('Invalid data', errors=form.errors.get_json_data())
+
+
+def serialize_post(post):
+    return {
+        'id': post.id,
+        'title': post.title,
+        'content': post.content,
+        'author': post.author.username if post.author else None,
+        'created_at': post.created_at,
+        'updated_at': post.updated_at,
+    }
+
+
+def serialize_message(message):
+    return {
+        'id': message.id,
+        'conversation': message.conversation_id,
+        'sender': message.sender.username,
+        'recipient': message.recipient.username,
+        'content': message.content,
+        'timestamp': message.timestamp,
+        'read': message.read_at is not None,
+        'updated_at': message.updated_at,
+    }
+
+
+def serialize_habit(habit):
+    return {
+        'id': habit.id,
+        'name': habit.name,
+        'frequency': habit.frequency,
+        'current_count': habit.current_count,
+        'target_count': habit.target_count,
+        'completed': habit.completed,
+        'reset_at': habit.reset_at,
+        'updated_at': habit.updated_at,
+    }
+
+
+def serialize_todo(todo):
+    return {
+        'id': todo.id,
+        'task_name': todo.task_name,
+        'due_date': todo.due_date,
+        'assigned_to': todo.assigned_to.username if todo.assigned_to else None,
+        'completed': todo.completed,
+        'updated_at': todo.updated_at,
+    }
+
+
+def visible_posts(user):
+    """Unflagged posts, plus the user's own posts waiting for moderation."""
+    return Post.objects.filter(Q(is_flagged=False) | Q(author=user)) \
+        .select_related('author').only(*POST_FIELDS)
+
+
+@api_view('GET', 'POST')
+@throttle('post', key='user')
+def posts(request):
+    if request.method == 'POST':
+        form = PostForm(request.data)
+        if not form.is_valid():
+            return form_errors(form)
+        post = form.save(commit=False)
+        post.author = request.user
+        banned_word = publish_post(post)
+        return JsonResponse({**serialize_post(post), 'flagged': bool(banned_word)}, status=201)
+
+    feed = Post.objects.filter(is_flagged=False).select_related('author').only(*POST_FIELDS)
+    page = CursorPaginator(feed, API_PAGE_SIZE).get_page(request.GET.get('cursor'))
+    return page_json(request, page, serialize_post)
+
+
+@api_view('GET', 'PATCH', 'DELETE')
+def post_detail(request, post_id):
+    post = get_object_or_404(visible_posts(request.user), id=post_id)
+    if request.method == 'GET':
+        return conditional_json(request, rows_etag([post]), lambda: serialize_post(post))
+
+    if post.author_id != request.user.id:
+        return error('Only the author can change this post', status=403)
+    if request.method == 'DELETE':
+        post.delete()
+        return HttpResponse(status=204)
+
+    # Fields left out of the body keep their current values
+    form = PostForm({**serialize_post(post), **request.data}, instance=post)
+    if not form.is_valid():
+        return form_errors(form)
+    form.save()
+    return JsonResponse(serialize_post(post))
+
+
+@api_view('GET', 'POST')
+@throttle('message', key='user')
+def messages(request):
+    if request.method == 'POST':
+        form = PrivateMessageForm(request.data)
+        if not form.is_valid():
+            return form_errors(form)
+        message = form.save(commit=False)
+        message.sender = request.user
+        send_private_message(message)
+        return JsonResponse(serialize_message(message), status=201)
+
+    mine = PrivateMessage.objects.filter(Q(sender=request.user) | Q(recipient=request.user))
+    if 'conversation' in request.GET:
+        try:
+            mine = mine.filter(conversation_id=int(request.GET['conversation']))
+        except ValueError:
+            return error('conversation must be an id')
+    mine = mine.select_related('sender', 'recipient').only(*MESSAGE_FIELDS)
+    page = CursorPaginator(mine, API_PAGE_SIZE, field='timestamp') \
+        .get_page(request.GET.get('cursor'))
+    return page_json(request, page, serialize_message)
+
+
+@api_view('GET', 'POST')
+def habits(request):
+    if request.method == 'POST':
+        form = HabitForm(request.data)
+        if not form.is_valid():
+            return form_errors(form)
+        habit = form.save(commit=False)
+        habit.user = request.user
+        habit.save()
+        return JsonResponse(serialize_habit(habit), status=201)
+
+    rows = list(Habit.objects.filter(user=request.user).only(*HABIT_FIELDS).order_by('id'))
+    reset_if_due(request.user, rows)
+    return list_json(request, rows, serialize_habit)
+
+
+@api_view('POST')
+def increment_habit(request, habit_id):
+    habit = get_object_or_404(Habit, id=habit_id, user=request.user)
+    # Retries from the PWA send the same key, so they're only counted once
+    key = request.headers.get('Idempotency-Key') or request.data.get('idempotency_key')
+    counted = habit.increment_count(idempotency_key=str(key)[:64] if key else None)
+    return JsonResponse({**serialize_habit(habit), 'counted': counted})
+
+
+def my_todos(user):
+    """To-dos assigned to ``user`` or to everyone."""
+    return FamilyToDoItem.objects.filter(Q(assigned_to=user) | Q(assigned_to__isnull=True))
+
+
+@api_view('GET', 'POST')
+def todos(request):
+    if request.method == 'POST':
+        form = FamilyTodoForm(request.data)
+        if not form.is_valid():
+            return form_errors(form)
+        todo = form.save()
+        return JsonResponse(serialize_todo(todo), status=201)
+
+    rows = list(my_todos(request.user).select_related('assigned_to')
+                .only(*TODO_FIELDS).order_by('due_date', 'id'))
+    return list_json(request, rows, serialize_todo)
+
+
+@api_view('PATCH')
+def todo_detail(request, todo_id):
+    todo = get_object_or_404(my_todos(request.user).select_related('assigned_to'), id=todo_id)
+    if not isinstance(request.data.get('completed'), bool):
+        return error('completed must be true or false')
+    todo.completed = request.data['completed']
+    todo.save(update_fields=['completed', 'updated_at'])
+    return JsonResponse(serialize_todo(todo))
@@ -7,3 +7,6 @@ class BoardConfig(AppConfig):
 
     def ready(self):
         import board.signals  # Import your signals module here
+        from board.throttling import check_shared_cache
+
+        check_shared_cache()
@@ -1,15 +1,61 @@
+import copy
+import threading
+import time
+
+from django.conf import settings
 from django.contrib.auth.backends import ModelBackend
 from django.contrib.auth import get_user_model
+from django.core.exceptions import PermissionDenied
 
 UserModel = get_user_model()
 
+# Users loaded for recent requests, by id: {user_id: (expires_at, user)}.
+# Saves in this process evict an entry straight away; other processes see
+# the change once AUTH_USER_CACHE_TTL runs out.
+_user_cache = {}
+_user_cache_lock = threading.Lock()
+USER_CACHE_SIZE = 1000
+
+
+def get_cached_user(user_id):
+    """Return the user with their profile joined in, or None if there is no such user."""
+    now = time.monotonic()
+    entry = _user_cache.get(user_id)
+    if entry is None or entry[0] <= now:
+        try:
+            user = UserModel._default_manager.select_related('userprofile').get(pk=user_id)
+        except UserModel.DoesNotExist:
+            return None
+        entry = (now + settings.AUTH_USER_CACHE_TTL, user)
+        with _user_cache_lock:
+            if len(_user_cache) >= USER_CACHE_SIZE:
+                _user_cache.clear()
+            _user_cache[user_id] = entry
+    # Each request gets its own copy, so a view changing request.user
+    # can't leak into another request.
+    return copy.deepcopy(entry[1])
+
+
+def forget_user(user_id):
+    with _user_cache_lock:
+        _user_cache.pop(user_id, None)
+
 
 class ApprovedUserBackend(ModelBackend):
     def authenticate(self, request, username=None, password=None, **kwargs):
         try:
             user = UserModel.objects.get(username=username)
-            if user.check_password(password) and user.is_approved:
-                return user
         except UserModel.DoesNotExist:
             return None
+        if not user.check_password(password):
+            # Stop here rather than let ModelBackend hash the same wrong
+            # password a second time.
+            raise PermissionDenied
+        if user.is_approved:
+            return user
         return None
+
+    def get_user(self, user_id):
+        # Called by AuthenticationMiddleware on every request
+        user = get_cached_user(user_id)
+        return user if self.user_can_authenticate(user) else None
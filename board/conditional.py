@@ -0,0 +1,116 @@
+"""
+Conditional GET for the HTML pages.
+
+A page's ETag is built from version stamps: counters in the cache that are
+bumped, once the change commits, whenever the rows the page shows change.
+``posts`` covers the feed and ``todos`` the family to-do list.
+``habits.<id>`` covers one user's habits, and ``user.<id>`` covers what
+base.html shows about the signed-in user, such as the unread badge.
+Reading them is one cache ``get_many`` and no query, so a reload where
+nothing changed ends in a 304 before the view runs or a template renders.
+
+The ETag also covers who is signed in, their CSRF cookie (forms embed a
+token made from it) and the release, so a deploy re-renders every page.
+There is no Last-Modified, as a date can't say whose page was rendered.
+Pages with flash messages waiting are always rendered, so they get shown.
+"""
+import hashlib
+import time
+from functools import partial, wraps
+
+from django.conf import settings
+from django.contrib.messages import get_messages
+from django.core.cache import cache
+from django.db import transaction
+from django.utils.cache import patch_cache_control, patch_vary_headers
+from django.views.decorators.http import condition
+
+VERSION_KEY = 'board:version:{name}'
+POSTS = 'posts'
+TODOS = 'todos'
+
+
+def user_stamp(user_id):
+    return f'user.{user_id}'
+
+
+def habits_stamp(user_id):
+    return f'habits.{user_id}'
+
+
+def get_versions(names):
+    keys = [VERSION_KEY.format(name=name) for name in names]
+    found = cache.get_many(keys)
+    for key in keys:
+        if key not in found:
+            # Start from the clock rather than 1, so a stamp that was evicted
+            # never comes back with a value an old ETag was built from.
+            cache.add(key, time.time_ns(), None)
+            found[key] = cache.get(key)
+    return [found[key] for key in keys]
+
+
+def bump(*names):
+    for name in names:
+        key = VERSION_KEY.format(name=name)
+        try:
+            cache.incr(key)
+        except ValueError:
+            cache.set(key, time.time_ns(), None)
+
+
+def bump_on_commit(*names):
+    """
+    Bump once the current transaction commits. A page rendered from the
+    old rows under the new stamp would be answered with 304 until the next bump.
+    """
+    transaction.on_commit(partial(bump, *names))
+
+
+def has_messages(request):
+    # len() loads the messages without marking them as shown
+    return bool(len(get_messages(request)))
+
+
+def page_etag(request, stamps, period):
+    if not settings.CONDITIONAL_PAGES or has_messages(request):
+        return None
+    user = request.user
+    names = [stamp(user.pk) if callable(stamp) else stamp for stamp in stamps]
+    if user.is_authenticated:
+        names.append(user_stamp(user.pk))
+    parts = [settings.RELEASE_VERSION, user.pk, request.META.get('CSRF_COOKIE', ''),
+             *get_versions(names)]
+    if period:
+        parts.append(int(time.time() // period))
+    return hashlib.sha256(repr(parts).encode()).hexdigest()[:32]
+
+
+def conditional_page(*stamps, period=None, anonymous_max_age=None):
+    """
+    Give a page an ETag from ``stamps`` and answer a GET that already has
+    it with a 304. A stamp is a name or a function taking the user's id.
+    ``period`` (in seconds) changes the ETag at every boundary, for pages
+    showing state that changes with time alone.
+
+    Responses vary on Cookie and browsers must revalidate them. With
+    ``anonymous_max_age``, pages for anonymous visitors may instead be
+    reused by any cache for that many seconds.
+    """
+    def decorator(view_func):
+        view = condition(etag_func=lambda request, *args, **kwargs:
+                         page_etag(request, stamps, period))(view_func)
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            shareable = (anonymous_max_age and not request.user.is_authenticated
+                         and not has_messages(request))
+            response = view(request, *args, **kwargs)
+            if shareable and not response.cookies:
+                patch_cache_control(response, public=True, max_age=anonymous_max_age)
+            else:
+                patch_cache_control(response, private=True, no_cache=True)
+            patch_vary_headers(response, ['Cookie'])
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,209 @@
+"""
+Real-time events for the feed, inbox and moderation queue.
+
+Writes publish small JSON events on named channels once their transaction
+commits: ``posts`` for everyone signed in, ``moderators`` for staff, and
+``user.<id>`` for one user. Browsers listen over Server-Sent Events from
+``event_stream``, an async view. Each open stream is a queue on the event
+loop, not a thread, so one ASGI worker can hold thousands of idle
+connections.
+
+``EVENTS_BROKER`` picks the pub/sub layer. ``InProcessBroker`` only reaches
+streams in the process that published, which is enough for a single
+worker. ``RedisBroker`` publishes through Redis, and each process keeps one
+pattern subscription that fans events out to its own streams, so every
+worker and dyno sees every event.
+"""
+import asyncio
+import json
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import partial
+
+from django.conf import settings
+from django.db import transaction
+from django.http import HttpResponse, StreamingHttpResponse
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+POSTS = 'posts'
+MODERATORS = 'moderators'
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def user_channel(user_id):
+    return f'user.{user_id}'
+
+
+class Subscription:
+    """The events waiting for one stream. Full queues drop the stream, not the publisher."""
+
+    def __init__(self, loop, channels):
+        self.loop = loop
+        self.channels = channels
+        self.queue = asyncio.Queue(maxsize=settings.EVENTS_QUEUE_SIZE)
+        self.overflowed = False
+
+    def deliver(self, message):
+        # Publishers may run in any thread; queues belong to the event loop.
+        self.loop.call_soon_threadsafe(self._put, message)
+
+    def _put(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            self.overflowed = True
+
+    async def get(self, timeout):
+        """Return the next message, or None if none arrives within ``timeout`` seconds."""
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class InProcessBroker:
+    """Delivers events to streams in this process only."""
+
+    def __init__(self):
+        self._subscriptions = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, message):
+        self.deliver(channel, message)
+
+    def deliver(self, channel, message):
+        with self._lock:
+            subscriptions = list(self._subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.deliver(message)
+
+    @asynccontextmanager
+    async def subscribe(self, channels):
+        subscription = Subscription(asyncio.get_running_loop(), channels)
+        with self._lock:
+            for channel in channels:
+                self._subscriptions[channel].add(subscription)
+        try:
+            yield subscription
+        finally:
+            with self._lock:
+                for channel in channels:
+                    self._subscriptions[channel].discard(subscription)
+                    if not self._subscriptions[channel]:
+                        del self._subscriptions[channel]
+
+
+class RedisBroker(InProcessBroker):
+    """Publishes through Redis so streams on every process get the event."""
+
+    prefix = 'board:events:'
+
+    def __init__(self):
+        super().__init__()
+        import redis
+
+        self._redis = redis.Redis.from_url(settings.REDIS_URL)
+        self._listener = None
+
+    def publish(self, channel, message):
+        self._redis.publish(self.prefix + channel, message)
+
+    @asynccontextmanager
+    async def subscribe(self, channels):
+        # One Redis connection per process, started by the first stream.
+        if self._listener is None or self._listener.done():
+            self._listener = asyncio.create_task(self.listen())
+        async with super().subscribe(channels) as subscription:
+            yield subscription
+
+    async def listen(self):
+        import redis.asyncio
+
+        while True:
+            client = redis.asyncio.Redis.from_url(settings.REDIS_URL)
+            try:
+                async with client.pubsub() as pubsub:
+                    await pubsub.psubscribe(self.prefix + '*')
+                    async for item in pubsub.listen():
+                        if item['type'] == 'pmessage':
+                            channel = item['channel'].decode()[len(self.prefix):]
+                            self.deliver(channel, item['data'].decode())
+            except asyncio.CancelledError:
+                raise
+            except Exception:
+                logger.exception("Lost the Redis event subscription, reconnecting.")
+                await asyncio.sleep(1)
+            finally:
+                await client.aclose()
+
+
+def get_broker():
+    global _broker
+    if _broker is None:
+        with _broker_lock:
+            if _broker is None:
+                _broker = import_string(settings.EVENTS_BROKER)()
+    return _broker
+
+
+def publish(channel, event, data):
+    """Send ``event`` to every stream listening on ``channel``."""
+    message = json.dumps({'event': event, 'data': data})
+    try:
+        get_broker().publish(channel, message)
+    except Exception:
+        # Live updates are a nicety; never fail the write that caused them.
+        logger.exception(f"Could not publish {event} on {channel}.")
+
+
+def publish_on_commit(channel, event, data):
+    """Publish once the surrounding transaction commits, so readers can see the change."""
+    transaction.on_commit(partial(publish, channel, event, data))
+
+
+def format_event(message):
+    """Frame a published message as a Server-Sent Event."""
+    parsed = json.loads(message)
+    return f"event: {parsed['event']}\ndata: {json.dumps(parsed['data'])}\n\n"
+
+
+async def stream(subscription):
+    # Tell the browser how long to wait before reconnecting.
+    yield 'retry: 3000\n\n'
+    deadline = time.monotonic() + settings.EVENTS_MAX_STREAM
+    while time.monotonic() < deadline and not subscription.overflowed:
+        message = await subscription.get(settings.EVENTS_HEARTBEAT)
+        if message is None:
+            # A comment keeps proxies from closing an idle connection.
+            yield ': keep-alive\n\n'
+        else:
+            yield format_event(message)
+
+
+async def event_stream(request):
+    """Server-Sent Events for the signed-in user. Serve under ASGI."""
+    user = await request.auser()
+    if not user.is_authenticated:
+        return HttpResponse(status=401)
+
+    channels = [POSTS, user_channel(user.id)]
+    if user.is_staff:
+        channels.append(MODERATORS)
+
+    async def events():
+        async with get_broker().subscribe(channels) as subscription:
+            async for chunk in stream(subscription):
+                yield chunk
+
+    response = StreamingHttpResponse(events(), content_type='text/event-stream')
+    response['Cache-Control'] = 'no-cache'
+    # Stop nginx-style proxies from buffering the stream
+    response['X-Accel-Buffering'] = 'no'
+    return response
@@ -0,0 +1,144 @@
+"""
+Cached rendering of the message board feed.
+
+Each post card is rendered once and cached under its post id, and each feed
+page caches the list of post ids on it. A page hit therefore needs no
+database query and no template render. Per-user parts, such as the
+edit/delete buttons for the author, are left out of the cached HTML and
+drawn by ``message_board.html``.
+
+Saving or deleting a post drops its card and starts a new feed generation,
+once the change commits, so page lists are rebuilt while the other cards
+stay cached. Cards show the author's name, so saving a user drops the cards
+of their posts. Hit and miss counters are kept in the cache too.
+
+With ``FEED_CACHE`` off every page is read and rendered afresh.
+"""
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.template.loader import render_to_string
+
+from .models import Post
+from .pagination import CursorPage, CursorPaginator
+
+FEED_PAGE_SIZE = 5
+GENERATION_KEY = 'board:feed:generation'
+PAGE_KEY = 'board:feed:{generation}:{cursor}'
+CARD_KEY = 'board:feed:card:{post_id}'
+STATS_KEY = 'board:feed:stats:{name}'
+STATS = ('page_hits', 'page_misses', 'card_hits', 'card_misses')
+
+
+def feed_queryset():
+    return Post.objects.filter(is_flagged=False).select_related('author')
+
+
+def get_feed_page(cursor=None):
+    """
+    Return the feed page at ``cursor`` as a ``CursorPage`` of cards.
+
+    Each card is a dict with the post ``id``, its ``author_id`` and the
+    rendered ``html``.
+    """
+    if not settings.FEED_CACHE:
+        page = CursorPaginator(feed_queryset(), FEED_PAGE_SIZE).get_page(cursor)
+        return CursorPage([render_card(post) for post in page],
+                          page.next_cursor, page.previous_cursor)
+
+    generation = cache.get_or_set(GENERATION_KEY, 1, None)
+    page_key = PAGE_KEY.format(generation=generation, cursor=cursor or 'first')
+    entry = cache.get(page_key)
+    posts = {}
+
+    if entry is None:
+        _count('page_misses')
+        page = CursorPaginator(feed_queryset(), FEED_PAGE_SIZE).get_page(cursor)
+        posts = {post.id: post for post in page}
+        entry = {
+            'ids': list(posts),
+            'next': page.next_cursor,
+            'previous': page.previous_cursor,
+        }
+        cache.set(page_key, entry, settings.FEED_CACHE_TIMEOUT)
+    else:
+        _count('page_hits')
+
+    card_keys = {post_id: CARD_KEY.format(post_id=post_id) for post_id in entry['ids']}
+    found = cache.get_many(card_keys.values())
+    missing = [post_id for post_id, key in card_keys.items() if key not in found]
+    if found:
+        _count('card_hits', len(found))
+
+    if missing:
+        _count('card_misses', len(missing))
+        if any(post_id not in posts for post_id in missing):
+            posts.update(feed_queryset().in_bulk(missing))
+        rendered = {}
+        for post_id in missing:
+            post = posts.get(post_id)
+            if post is None:
+                continue  # Deleted since the page was cached
+            rendered[card_keys[post_id]] = render_card(post)
+        cache.set_many(rendered, settings.FEED_CACHE_TIMEOUT)
+        found.update(rendered)
+
+    cards = [found[key] for key in card_keys.values() if key in found]
+    return CursorPage(cards, entry['next'], entry['previous'])
+
+
+def render_card(post):
+    return {
+        'id': post.id,
+        'author_id': post.author_id,
+        'html': render_to_string('board/post_card.html', {'post': post}),
+    }
+
+
+def invalidate_post(post_id):
+    """Forget a post's card and every cached page list."""
+    cache.delete(CARD_KEY.format(post_id=post_id))
+    invalidate_feed()
+
+
+def invalidate_feed():
+    """Forget every cached page list, e.g. after a bulk update that skipped signals."""
+    try:
+        cache.incr(GENERATION_KEY)
+    except ValueError:
+        cache.set(GENERATION_KEY, 1, None)
+
+
+def invalidate_post_on_commit(post_id):
+    transaction.on_commit(partial(invalidate_post, post_id))
+
+
+def invalidate_author(user_id):
+    """Forget the cards of every post by a user."""
+    if settings.FEED_CACHE:
+        post_ids = Post.objects.filter(author_id=user_id).values_list('id', flat=True)
+        cache.delete_many([CARD_KEY.format(post_id=post_id) for post_id in post_ids])
+
+
+def invalidate_author_on_commit(user_id):
+    transaction.on_commit(partial(invalidate_author, user_id))
+
+
+def get_stats():
+    values = cache.get_many([STATS_KEY.format(name=name) for name in STATS])
+    stats = {name: values.get(STATS_KEY.format(name=name), 0) for name in STATS}
+    for kind in ('page', 'card'):
+        lookups = stats[f'{kind}_hits'] + stats[f'{kind}_misses']
+        stats[f'{kind}_hit_rate'] = stats[f'{kind}_hits'] / lookups if lookups else None
+    return stats
+
+
+def _count(name, amount=1):
+    key = STATS_KEY.format(name=name)
+    try:
+        cache.incr(key, amount)
+    except ValueError:
+        cache.add(key, 0, None)
+        cache.incr(key, amount)
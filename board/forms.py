@@ -1,3 +1,5 @@
+import zoneinfo
+
 from .models import Habit
 from django import forms
 from .models import Post, UserProfile, User, PrivateMessage, SamsTodoItem, FamilyToDoItem
@@ -33,6 +35,18 @@ class PrivateMessageForm(forms.ModelForm):
         fields = ['recipient', 'content']
 
 
+class ReplyForm(forms.ModelForm):
+    """A message in an existing conversation, where the recipient is already known."""
+    content = forms.CharField(
+        widget=forms.Textarea(attrs={'class': 'form-control', 'rows': 3}),
+        label="Reply"
+    )
+
+    class Meta:
+        model = PrivateMessage
+        fields = ['content']
+
+
 class PostForm(forms.ModelForm):
     class Meta:
         model = Post
@@ -59,13 +73,22 @@ class UserProfileForm(forms.ModelForm):
         label="Select Theme",
         widget=forms.Select(attrs={'class': 'form-control'})
     )
+    timezone = forms.ChoiceField(
+        required=False,
+        label='Time Zone',
+        help_text='Habits reset at midnight in this time zone.',
+        choices=lambda: [('', 'Site default')] + [
+            (name, name) for name in sorted(zoneinfo.available_timezones())],
+        widget=forms.Select(attrs={'class': 'form-control'})
+    )
 
     class Meta:
         model = UserProfile
         fields = ['email_notifications', 'privacy_mode', 'selected_theme',
                   'message_preview', 'auto_logout', 'location_sharing',
-                  'profile_visibility']
+                  'profile_visibility', 'notification_delivery', 'timezone']
         widgets = {
+            'notification_delivery': forms.Select(attrs={'class': 'form-control'}),
             'message_preview': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'auto_logout': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
             'location_sharing': forms.CheckboxInput(attrs={'class': 'form-check-input'}),
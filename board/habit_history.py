@@ -0,0 +1,103 @@
+"""
+Day-by-day habit history for charts.
+
+The progress in a range is read in one query and bucketed into days with
+NumPy, so years of history take milliseconds. Results are cached per
+habit and range. Each habit has its own cache generation, which new
+progress bumps once it commits, to drop every cached range at once.
+
+With ``HABIT_HISTORY_CACHE`` off every chart is built afresh.
+"""
+from datetime import timedelta
+from functools import partial
+
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Sum
+
+from .models import HabitProgress
+
+GENERATION_KEY = 'board:habit_history:{habit_id}:generation'
+HISTORY_KEY = 'board:habit_history:{habit_id}:{generation}:{start}:{end}'
+# Heatmap levels, as on a contributions calendar: 0 is no progress.
+HEATMAP_LEVELS = 4
+
+
+def get_history(habit, start, end):
+    """Return the cached series and heatmap for ``habit`` from ``start`` to ``end`` inclusive."""
+    if not settings.HABIT_HISTORY_CACHE:
+        return build_history(habit, start, end)
+    generation = cache.get_or_set(GENERATION_KEY.format(habit_id=habit.id), 1, None)
+    key = HISTORY_KEY.format(habit_id=habit.id, generation=generation,
+                             start=start.isoformat(), end=end.isoformat())
+    history = cache.get(key)
+    if history is None:
+        history = build_history(habit, start, end)
+        cache.set(key, history, settings.HABIT_HISTORY_CACHE_TIMEOUT)
+    return history
+
+
+def build_history(habit, start, end):
+    days = (end - start).days + 1
+    # Summing per day in the database cuts the rows to at most one a day.
+    rows = HabitProgress.objects.filter(habit=habit, date__range=(start, end)) \
+        .values_list('date').annotate(total=Sum('count')).order_by()
+    dates, counts = zip(*rows) if rows else ((), ())
+
+    offsets = np.fromiter((day.toordinal() for day in dates), dtype=np.int64,
+                          count=len(dates)) - start.toordinal()
+    totals = np.bincount(offsets, weights=np.array(counts, dtype=np.int64),
+                         minlength=days).astype(np.int64)
+
+    return {
+        'habit': {'id': habit.id, 'name': habit.name,
+                  'target_count': habit.target_count},
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'series': totals.tolist(),
+        'heatmap': heatmap(totals, start),
+        'summary': {
+            'total': int(totals.sum()),
+            'active_days': int(np.count_nonzero(totals)),
+            'best_day': int(totals.max()) if days else 0,
+            'target_met_days': int(np.count_nonzero(totals >= habit.target_count)),
+        },
+    }
+
+
+def heatmap(totals, start):
+    """
+    Lay the daily totals out as calendar weeks starting on Monday.
+
+    Each week has seven levels from 0 to ``HEATMAP_LEVELS``, scaled to the
+    best day. Days outside the range are ``None``.
+    """
+    lead = start.weekday()
+    weeks = -(-(lead + len(totals)) // 7)
+    peak = totals.max() if len(totals) else 0
+    levels = np.ceil(totals * HEATMAP_LEVELS / peak).astype(np.int64) if peak \
+        else np.zeros_like(totals)
+
+    grid = np.full(weeks * 7, -1, dtype=np.int64)
+    grid[lead:lead + len(totals)] = levels
+    first_monday = start - timedelta(days=lead)
+    return [
+        {'week_of': (first_monday + timedelta(weeks=i)).isoformat(),
+         'levels': [level if level >= 0 else None for level in week]}
+        for i, week in enumerate(grid.reshape(weeks, 7).tolist())
+    ]
+
+
+def invalidate_history(habit_id):
+    """Forget every cached range for a habit."""
+    key = GENERATION_KEY.format(habit_id=habit_id)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def invalidate_history_on_commit(habit_id):
+    transaction.on_commit(partial(invalidate_history, habit_id))
@@ -0,0 +1,103 @@
+"""
+Resets habit counts when their period ends.
+
+A period ends at the start of the next hour, day, week (Monday), month or
+year in the owner's time zone, as set on their profile. Due habits are reset
+with one UPDATE per frequency: for everyone by the ``reset_habits`` command,
+or for one user as their habits are read. Reading habits that are not due
+writes nothing.
+"""
+import logging
+import zoneinfo
+from datetime import datetime, time, timedelta, timezone as dt_timezone
+
+from django.conf import settings
+from django.utils import timezone
+
+from .conditional import bump_on_commit, habits_stamp
+
+logger = logging.getLogger(__name__)
+
+# Every period starts on a quarter hour in UTC, whatever the time zone
+PERIOD_STEP = 15 * 60
+
+
+def user_timezone(user):
+    profile = getattr(user, 'userprofile', None)
+    return get_timezone(profile.timezone if profile else None)
+
+
+def get_timezone(name):
+    try:
+        return zoneinfo.ZoneInfo(name or settings.TIME_ZONE)
+    except (zoneinfo.ZoneInfoNotFoundError, ValueError):
+        logger.warning(f"Unknown time zone {name!r}, using {settings.TIME_ZONE}.")
+        return zoneinfo.ZoneInfo(settings.TIME_ZONE)
+
+
+def next_reset(frequency, now, tz):
+    """Return when the period containing ``now`` ends for a habit of ``frequency``."""
+    local = timezone.localtime(now, tz)
+    if frequency == 'hourly':
+        # Step in UTC so the hour after a DST change is not skipped or repeated.
+        hour = local.replace(minute=0, second=0, microsecond=0)
+        return hour.astimezone(dt_timezone.utc) + timedelta(hours=1)
+
+    today = local.date()
+    if frequency == 'weekly':
+        day = today + timedelta(days=7 - today.weekday())
+    elif frequency == 'monthly':
+        day = (today.replace(day=28) + timedelta(days=4)).replace(day=1)
+    elif frequency == 'yearly':
+        day = today.replace(year=today.year + 1, month=1, day=1)
+    else:
+        day = today + timedelta(days=1)
+    return datetime.combine(day, time.min, tzinfo=tz)
+
+
+def reset_due_habits(now=None):
+    """Reset every due habit. Returns how many were reset."""
+    from .models import Habit
+
+    now = now or timezone.now()
+    due = Habit.objects.filter(reset_at__lte=now)
+    buckets = due.values_list('frequency', 'user__userprofile__timezone').distinct()
+    users = set(due.values_list('user_id', flat=True))
+
+    reset = 0
+    for frequency, tz_name in buckets:
+        reset += due.filter(
+            frequency=frequency, user__userprofile__timezone=tz_name,
+        ).update(
+            current_count=0, completed=False,
+            reset_at=next_reset(frequency, now, get_timezone(tz_name)), updated_at=now,
+        )
+    # update() sends no post_save, so tell the owners' pages by hand
+    bump_on_commit(*(habits_stamp(user_id) for user_id in users))
+    return reset
+
+
+def reset_if_due(user, habits, now=None):
+    """
+    Reset whichever of ``user``'s ``habits`` are due, in the database and on
+    the instances. Makes no query when none are.
+    """
+    from .models import Habit
+
+    now = now or timezone.now()
+    due = [habit for habit in habits if habit.reset_at <= now]
+    if not due:
+        return
+
+    tz = user_timezone(user)
+    for frequency in {habit.frequency for habit in due}:
+        bucket = [habit for habit in due if habit.frequency == frequency]
+        reset_at = next_reset(frequency, now, tz)
+        Habit.objects.filter(id__in=[habit.id for habit in bucket], reset_at__lte=now) \
+            .update(current_count=0, completed=False, reset_at=reset_at, updated_at=now)
+        for habit in bucket:
+            habit.current_count = 0
+            habit.completed = False
+            habit.reset_at = reset_at
+            habit.updated_at = now
+    bump_on_commit(habits_stamp(user.pk))
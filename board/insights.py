@@ -0,0 +1,63 @@
+"""
+Progress totals for a user's habits.
+
+Every period is a conditional ``Sum`` over the same join, so all of a
+user's habits are summarised in one grouped query however many there are.
+"""
+from datetime import timedelta
+
+from django.db.models import Q, Sum, Value
+from django.db.models.functions import Coalesce
+from django.utils import timezone
+
+from .habits import user_timezone
+from .models import Habit
+
+PERIODS = ('daily', 'weekly', 'monthly', 'annual')
+
+
+def period_starts(today):
+    return {
+        'daily': today,
+        'weekly': today - timedelta(weeks=1),
+        'monthly': today.replace(day=1),
+        'annual': today.replace(month=1, day=1),
+    }
+
+
+def habit_insights(user, today=None):
+    """
+    Return one dict per habit with its progress for each period and how far
+    through today's target it is, as ``daily_progress_percentage``. Periods
+    start in the user's time zone, like the habit resets.
+    """
+    today = today or timezone.localdate(timezone=user_timezone(user))
+    totals = {
+        f'{period}_progress': Coalesce(
+            Sum('progress__count', filter=Q(progress__date__gte=start)), Value(0))
+        for period, start in period_starts(today).items()
+    }
+    habits = Habit.objects.filter(user=user).annotate(**totals).order_by('id')
+
+    insights = []
+    for habit in habits:
+        insight = {'habit': habit}
+        insight.update((key, getattr(habit, key)) for key in totals)
+        if habit.target_count > 0:
+            insight['daily_progress_percentage'] = (
+                habit.daily_progress / habit.target_count) * 100
+        else:
+            insight['daily_progress_percentage'] = 0
+        insights.append(insight)
+    return insights
+
+
+def serialize_insight(insight):
+    habit = insight['habit']
+    return {
+        'id': habit.id,
+        'name': habit.name,
+        'frequency': habit.frequency,
+        'target_count': habit.target_count,
+        **{key: value for key, value in insight.items() if key != 'habit'},
+    }
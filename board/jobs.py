@@ -0,0 +1,128 @@
+import logging
+import random
+from datetime import timedelta
+from functools import partial
+
+from django.conf import settings
+from django.db import close_old_connections, transaction
+from django.db.models import F
+from django.utils import timezone
+from django.utils.module_loading import import_string
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+PRIORITY_HIGH = 10
+PRIORITY_NORMAL = 0
+PRIORITY_LOW = -10
+
+
+def job(func):
+    """Mark a function as safe to run from the job queue."""
+    func.is_job = True
+    return func
+
+
+def enqueue(func, *args, priority=PRIORITY_NORMAL, delay=None, unique=False, **kwargs):
+    """
+    Queue ``func(*args, **kwargs)`` to run in the background worker.
+
+    The job row is written once the surrounding transaction commits (or
+    straight away outside one), so a worker never picks up a job for data
+    that was rolled back. Arguments must be JSON serializable; pass ids
+    rather than model instances.
+
+    With ``unique``, nothing is queued if the same call is already queued.
+    """
+    run_at = timezone.now() + (delay or timedelta())
+    transaction.on_commit(partial(
+        _create_job,
+        unique=unique,
+        task=f'{func.__module__}.{func.__qualname__}',
+        args=list(args),
+        kwargs=kwargs,
+        priority=priority,
+        run_at=run_at,
+        max_attempts=settings.JOB_MAX_ATTEMPTS,
+    ))
+
+
+def _create_job(unique, task, args, kwargs, **fields):
+    if unique and Job.objects.filter(
+            status=Job.QUEUED, task=task, args=args, kwargs=kwargs).exists():
+        return
+    Job.objects.create(task=task, args=args, kwargs=kwargs, **fields)
+
+
+def claim_jobs(limit):
+    """Mark up to ``limit`` due jobs as running and return them, highest priority first."""
+    now = timezone.now()
+    with transaction.atomic():
+        jobs = list(
+            Job.objects.select_for_update(skip_locked=True)
+            .filter(status=Job.QUEUED, run_at__lte=now)
+            .order_by('-priority', 'run_at', 'id')[:limit]
+        )
+        if jobs:
+            Job.objects.filter(id__in=[job.id for job in jobs]).update(
+                status=Job.RUNNING, locked_at=now, attempts=F('attempts') + 1)
+    for job in jobs:
+        job.status = Job.RUNNING
+        job.locked_at = now
+        job.attempts += 1
+    return jobs
+
+
+def heartbeat(job_ids):
+    """
+    Renew the lock on jobs this worker is still running, so that
+    ``release_stale_jobs`` only requeues jobs whose worker has died, never
+    a job that is merely slow.
+    """
+    if job_ids:
+        Job.objects.filter(id__in=job_ids, status=Job.RUNNING).update(locked_at=timezone.now())
+
+
+def release_stale_jobs():
+    """Requeue jobs left running by a worker that died mid-job."""
+    cutoff = timezone.now() - timedelta(seconds=settings.JOB_LOCK_TIMEOUT)
+    released = Job.objects.filter(status=Job.RUNNING, locked_at__lt=cutoff).update(
+        status=Job.QUEUED, locked_at=None)
+    if released:
+        logger.warning(f"Requeued {released} stale jobs.")
+    return released
+
+
+def retry_delay(attempts):
+    """Exponential backoff with a little jitter so retries do not arrive in lockstep."""
+    delay = min(settings.JOB_RETRY_BACKOFF * 2 ** (attempts - 1),
+                settings.JOB_RETRY_BACKOFF_MAX)
+    return timedelta(seconds=delay * random.uniform(1, 1.1))
+
+
+def run_job(job):
+    """Run a claimed job, then delete it, reschedule it or move it to the dead letters."""
+    try:
+        func = import_string(job.task)
+        if not getattr(func, 'is_job', False):
+            raise ValueError(f"{job.task} is not a registered job")
+        func(*job.args, **job.kwargs)
+    except Exception as e:
+        error = f"{type(e).__name__}: {e}"
+        if job.attempts >= job.max_attempts:
+            logger.error(f"Job {job.id} ({job.task}) failed for good: {error}")
+            Job.objects.filter(id=job.id).update(
+                status=Job.DEAD, locked_at=None, last_error=error)
+        else:
+            logger.warning(
+                f"Job {job.id} ({job.task}) failed, attempt {job.attempts}: {error}")
+            Job.objects.filter(id=job.id).update(
+                status=Job.QUEUED, locked_at=None, last_error=error,
+                run_at=timezone.now() + retry_delay(job.attempts))
+        return False
+    else:
+        Job.objects.filter(id=job.id).delete()
+        return True
+    finally:
+        close_old_connections()
@@ -0,0 +1,139 @@
+import asyncio
+import json
+import statistics
+import threading
+import time
+import tracemalloc
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connection, connections
+from django.db.backends.signals import connection_created
+from django.test import AsyncClient, Client, override_settings
+from django.urls import reverse
+from django.utils import timezone
+from board.models import Post, User
+
+
+class Command(BaseCommand):
+    help = ('Load test create_post and subscribe under WSGI with a fixed number of '
+            'sync workers and under ASGI in one event loop, and compare throughput, '
+            'latency, threads and memory')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=400)
+        parser.add_argument('--workers', type=int, default=2,
+                            help='Sync workers for the WSGI run, like gunicorn --workers')
+        parser.add_argument('--concurrency', type=int, default=50,
+                            help='Requests in flight at once for the ASGI run')
+        parser.add_argument('--latency', type=float, default=0.002,
+                            help='Seconds added to each query to stand in for a '
+                                 'network round trip to the database')
+
+    def handle(self, *args, **options):
+        stamp = timezone.now().strftime('%Y%m%d%H%M%S%f')
+        user = User.objects.create_user(
+            username=f'async-{stamp}', email=f'async-{stamp}@example.com')
+
+        def delay(execute, sql, params, many, context):
+            time.sleep(options['latency'])
+            return execute(sql, params, many, context)
+
+        def add_delay(sender, connection, **kwargs):
+            connection.execute_wrappers.append(delay)
+
+        connection_created.connect(add_delay)
+        connection.execute_wrappers.append(delay)
+        try:
+            with override_settings(ALLOWED_HOSTS=['testserver'], THROTTLE_RATES={},
+                                   SESSION_ENGINE='board.sessions'):
+                results = [
+                    (f"WSGI, {options['workers']} workers",
+                     self.measure(lambda: self.run_wsgi(user, options))),
+                    (f"ASGI, {options['concurrency']} in flight",
+                     self.measure(lambda: asyncio.run(self.run_asgi(user, options)))),
+                ]
+        finally:
+            connection.execute_wrappers.remove(delay)
+            connection_created.disconnect(add_delay)
+            Post.objects.filter(author=user).delete()
+            user.delete()
+
+        for name, (elapsed, latencies, threads, peak) in results:
+            latencies.sort()
+            self.stdout.write(self.style.SUCCESS(
+                f"{name}: {len(latencies) / elapsed:.0f} requests/s, "
+                f"median {statistics.median(latencies) * 1000:.1f} ms, "
+                f"p95 {latencies[int(len(latencies) * 0.95)] * 1000:.1f} ms, "
+                f"{threads} threads, {peak / 1e6:.1f} MB allocated at peak"))
+
+    def requests(self, count):
+        """Alternate between publishing a post and subscribing to push."""
+        for i in range(count):
+            if i % 2:
+                yield reverse('board:create_post'), {'title': f'Load {i}', 'content': 'Load test'}, None
+            else:
+                yield reverse('board:subscribe'), json.dumps({'token': f'load-{i}'}), 'application/json'
+
+    def measure(self, run):
+        threads = threading.active_count()
+        sampling = True
+
+        def sample():
+            nonlocal threads
+            while sampling:
+                threads = max(threads, threading.active_count())
+                time.sleep(0.01)
+
+        sampler = threading.Thread(target=sample)
+        sampler.start()
+        tracemalloc.start()
+        started = time.perf_counter()
+        try:
+            latencies = run()
+        finally:
+            elapsed = time.perf_counter() - started
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+            sampling = False
+            sampler.join()
+        # Leave out the sampler itself
+        return elapsed, latencies, threads - 1, peak
+
+    def run_wsgi(self, user, options):
+        local = threading.local()
+
+        def send(request):
+            if not hasattr(local, 'client'):
+                local.client = Client()
+                local.client.force_login(user)
+            url, data, content_type = request
+            started = time.perf_counter()
+            if content_type:
+                local.client.post(url, data, content_type=content_type)
+            else:
+                local.client.post(url, data)
+            return time.perf_counter() - started
+
+        try:
+            with ThreadPoolExecutor(options['workers']) as pool:
+                return list(pool.map(send, self.requests(options['requests'])))
+        finally:
+            connections.close_all()
+
+    async def run_asgi(self, user, options):
+        client = AsyncClient()
+        await client.aforce_login(user)
+        in_flight = asyncio.Semaphore(options['concurrency'])
+
+        async def send(request):
+            url, data, content_type = request
+            async with in_flight:
+                started = time.perf_counter()
+                if content_type:
+                    await client.post(url, data, content_type=content_type)
+                else:
+                    await client.post(url, data)
+                return time.perf_counter() - started
+
+        return await asyncio.gather(*(send(request) for request in self.requests(options['requests'])))
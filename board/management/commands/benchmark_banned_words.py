@@ -0,0 +1,68 @@
+import random
+import time
+
+from django.core.management.base import BaseCommand
+from board.moderation import BannedWordMatcher, load_banned_words
+
+# Everyday words used to build clean filler text for the benchmark posts.
+FILLER_WORDS = [
+    'today', 'we', 'went', 'to', 'the', 'park', 'and', 'had', 'a', 'picnic',
+    'family', 'dinner', 'was', 'great', 'message', 'board', 'habit', 'tracker',
+    'weekend', 'school', 'homework', 'garden', 'walk', 'dog', 'movie', 'night',
+]
+
+
+def linear_scan(content, words):
+    """The original per-word substring scan, kept here for comparison."""
+    content_lower = content.lower()
+    return next((word for word in words if word in content_lower), None)
+
+
+class Command(BaseCommand):
+    help = 'Benchmark the compiled banned-word matcher against the linear scan'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--size', type=int, default=10 * 1024,
+                            help='Size of each generated post in bytes')
+        parser.add_argument('--posts', type=int, default=200,
+                            help='Number of posts to scan')
+        parser.add_argument('--seed', type=int, default=0)
+
+    def handle(self, *args, **options):
+        words = load_banned_words()
+        rng = random.Random(options['seed'])
+        posts = [self.make_post(rng, options['size'])
+                 for _ in range(options['posts'])]
+
+        started = time.perf_counter()
+        matcher = BannedWordMatcher(words)
+        compile_time = time.perf_counter() - started
+        self.stdout.write(
+            f"Compiled {len(matcher)} words from {len(words)} entries "
+            f"in {compile_time * 1000:.1f} ms")
+
+        linear = self.time_scans(
+            posts, lambda post: linear_scan(post, words))
+        compiled = self.time_scans(posts, matcher.find_all)
+
+        self.stdout.write(f"Linear scan:      {linear * 1000:.3f} ms/post")
+        self.stdout.write(f"Compiled matcher: {compiled * 1000:.3f} ms/post")
+        self.stdout.write(self.style.SUCCESS(
+            f"Speed-up: {linear / compiled:.1f}x"))
+
+    @staticmethod
+    def make_post(rng, size):
+        words = []
+        length = 0
+        while length < size:
+            word = rng.choice(FILLER_WORDS)
+            words.append(word)
+            length += len(word) + 1
+        return ' '.join(words)[:size]
+
+    @staticmethod
+    def time_scans(posts, scan):
+        started = time.perf_counter()
+        for post in posts:
+            scan(post)
+        return (time.perf_counter() - started) / len(posts)
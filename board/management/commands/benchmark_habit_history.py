@@ -0,0 +1,66 @@
+import random
+import time
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.test.utils import override_settings
+from django.utils import timezone
+from board.habit_history import build_history, get_history
+from board.models import Habit, HabitProgress, User
+
+
+class Rollback(Exception):
+    """Raised to throw away the generated history."""
+
+
+class Command(BaseCommand):
+    help = 'Time the habit history chart for a habit with years of progress'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--years', type=int, default=5)
+        parser.add_argument('--per-day', type=int, default=3,
+                            help='Progress rows logged on an active day')
+        parser.add_argument('--runs', type=int, default=20)
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                self.benchmark(options)
+                raise Rollback
+        except Rollback:
+            pass
+
+    def benchmark(self, options):
+        stamp = timezone.now().strftime('%Y%m%d%H%M%S%f')
+        user = User.objects.create_user(
+            username=f'history-{stamp}', email=f'history-{stamp}@example.com')
+        habit = Habit.objects.create(user=user, name='Benchmark', target_count=3)
+
+        end = timezone.localdate()
+        start = end - timedelta(days=365 * options['years'] - 1)
+        rng = random.Random(0)
+        dates = [
+            start + timedelta(days=day)
+            for day in range((end - start).days + 1) if rng.random() < 0.7
+            for _ in range(rng.randint(1, options['per_day']))
+        ]
+        rows = HabitProgress.objects.bulk_create(
+            [HabitProgress(habit=habit, date=day, count=1) for day in dates], batch_size=1000)
+        self.stdout.write(f"{len(rows)} progress rows over {options['years']} years")
+
+        started = time.perf_counter()
+        for _ in range(options['runs']):
+            history = build_history(habit, start, end)
+        built = (time.perf_counter() - started) / options['runs']
+
+        with override_settings(HABIT_HISTORY_CACHE=True):
+            get_history(habit, start, end)
+            started = time.perf_counter()
+            for _ in range(options['runs']):
+                get_history(habit, start, end)
+            cached = (time.perf_counter() - started) / options['runs']
+
+        self.stdout.write(f"Total progress: {history['summary']['total']}")
+        self.stdout.write(f"Built:  {built * 1000:.1f} ms")
+        self.stdout.write(self.style.SUCCESS(f"Cached: {cached * 1000:.2f} ms"))
@@ -0,0 +1,69 @@
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+from django.core.management.base import BaseCommand
+from django.test.utils import override_settings
+from board.push import send_push
+
+
+class FCMStubHandler(BaseHTTPRequestHandler):
+    """Answers like the legacy FCM endpoint; tokens starting with "dead" are unregistered."""
+
+    protocol_version = 'HTTP/1.1'
+    latency = 0
+
+    def do_POST(self):
+        payload = json.loads(self.rfile.read(int(self.headers['Content-Length'])))
+        tokens = payload.get('registration_ids') or [payload.get('to')]
+        results = [{'error': 'NotRegistered'} if token.startswith('dead')
+                   else {'message_id': f'0:{token}'} for token in tokens]
+        time.sleep(self.latency)
+
+        body = json.dumps({'success': len(tokens), 'results': results}).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class Command(BaseCommand):
+    help = 'Benchmark push delivery against a local FCM stub server'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--tokens', type=int, default=2000)
+        parser.add_argument('--latency', type=float, default=0.005,
+                            help='Seconds the stub waits before answering')
+
+    def handle(self, *args, **options):
+        FCMStubHandler.latency = options['latency']
+        server = ThreadingHTTPServer(('127.0.0.1', 0), FCMStubHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        url = f'http://127.0.0.1:{server.server_address[1]}/fcm/send'
+        tokens = [f'token-{i}' for i in range(options['tokens'])]
+
+        try:
+            started = time.perf_counter()
+            for token in tokens:
+                # What each private message used to do: a fresh connection per push
+                requests.post(url, json={'to': token, 'notification': {}}, timeout=10)
+            single = time.perf_counter() - started
+
+            with override_settings(FCM_URL=url):
+                started = time.perf_counter()
+                result = send_push(tokens, title='Benchmark', body='Hello')
+                batched = time.perf_counter() - started
+        finally:
+            server.shutdown()
+
+        self.stdout.write(
+            f"One request per token: {len(tokens) / single:,.0f} pushes/s")
+        self.stdout.write(
+            f"Pooled multicast:      {result.sent / batched:,.0f} pushes/s")
+        self.stdout.write(self.style.SUCCESS(f"Speed-up: {single / batched:.1f}x"))
@@ -0,0 +1,64 @@
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+from django.test import Client, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from board.models import User
+
+ENGINES = {
+    'Database sessions': 'django.contrib.sessions.backends.db',
+    'Coalescing sessions': 'board.sessions',
+}
+
+
+class Rollback(Exception):
+    """Raised to throw away the benchmark user and sessions."""
+
+
+class Command(BaseCommand):
+    help = 'Compare requests per second and session writes across session engines'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=500)
+        parser.add_argument('--cache', default='default',
+                            help='Cache alias the coalescing engine uses')
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                stamp = timezone.now().strftime('%Y%m%d%H%M%S%f')
+                user = User.objects.create_user(
+                    username=f'sessions-{stamp}', email=f'sessions-{stamp}@example.com')
+                for name, engine in ENGINES.items():
+                    with override_settings(SESSION_ENGINE=engine,
+                                           SESSION_CACHE_ALIAS=options['cache'],
+                                           ALLOWED_HOSTS=['testserver']):
+                        self.benchmark(name, user, options['requests'])
+                raise Rollback
+        except Rollback:
+            pass
+
+    def benchmark(self, name, user, requests):
+        client = Client()
+        client.force_login(user)
+        url = reverse('board:habit_tracker')
+        client.get(url)
+
+        with CaptureQueriesContext(connection) as queries:
+            started = time.perf_counter()
+            for _ in range(requests):
+                client.get(url)
+            elapsed = time.perf_counter() - started
+
+        writes = sum(1 for query in queries.captured_queries
+                     if 'django_session' in query['sql']
+                     and query['sql'].lstrip().startswith(('UPDATE', 'INSERT')))
+        reads = sum(1 for query in queries.captured_queries
+                    if 'django_session' in query['sql']
+                    and query['sql'].lstrip().startswith('SELECT'))
+        self.stdout.write(self.style.SUCCESS(
+            f"{name}: {requests / elapsed:.0f} requests/s, "
+            f"{writes} session writes and {reads} reads in {requests} requests"))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+from board.unread import reconcile_unread_counts
+
+
+class Command(BaseCommand):
+    help = 'Recount unread private messages and correct any counters that have drifted'
+
+    def handle(self, *args, **options):
+        members, profiles = reconcile_unread_counts()
+        self.stdout.write(self.style.SUCCESS(
+            f"Corrected {members} conversation and {profiles} user unread counts."))
@@ -0,0 +1,157 @@
+import os
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.utils import timezone
+from board.conditional import POSTS, bump
+from board.feed_cache import invalidate_feed
+from board.models import Post
+from board.moderation import get_banned_word_matcher
+
+# Set in each pool process by _init_worker so the matcher is only sent once.
+_worker_matcher = None
+
+
+def _init_worker(matcher):
+    global _worker_matcher
+    _worker_matcher = matcher
+
+
+def _score_batch(batch, matcher=None):
+    """Return ``(post_id, banned_word)`` for every post in the batch that needs flagging."""
+    matcher = matcher or _worker_matcher
+    hits = []
+    for post_id, title, content in batch:
+        match = matcher.search(content) or matcher.search(title)
+        if match:
+            hits.append((post_id, match.word))
+    return hits
+
+
+class Command(BaseCommand):
+    help = 'Rescan existing posts against the current banned word list'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--batch-size', type=int, default=2000,
+                            help='Posts read per database chunk and scored per task')
+        parser.add_argument('--workers', type=int, default=os.cpu_count(),
+                            help='Scoring processes; 1 scores in this process')
+        parser.add_argument('--start-after', type=int, default=None,
+                            help='Only scan posts with an id greater than this')
+        parser.add_argument('--checkpoint', default=None,
+                            help='File that records the last processed id; '
+                                 'an existing checkpoint is resumed from')
+        parser.add_argument('--include-moderated', action='store_true',
+                            help='Also rescan posts already approved or posted by trusted users')
+        parser.add_argument('--dry-run', action='store_true',
+                            help='Report posts that would be flagged without saving')
+
+    def handle(self, *args, **options):
+        self.batch_size = options['batch_size']
+        self.checkpoint = options['checkpoint']
+        self.dry_run = options['dry_run']
+        self.verbosity = options['verbosity']
+
+        start_after = options['start_after']
+        if start_after is None:
+            start_after = self.read_checkpoint()
+
+        posts = Post.objects.filter(is_flagged=False, id__gt=start_after or 0)
+        if not options['include_moderated']:
+            posts = posts.filter(is_moderated=False)
+        rows = posts.order_by('id').values_list(
+            'id', 'title', 'content').iterator(chunk_size=self.batch_size)
+
+        matcher = get_banned_word_matcher()
+        self.scanned = 0
+        self.flagged = 0
+        self.started = time.perf_counter()
+
+        if options['workers'] <= 1:
+            for batch in self.batches(rows):
+                self.apply(batch[-1][0], len(batch), _score_batch(batch, matcher))
+        else:
+            connections.close_all()
+            with ProcessPoolExecutor(max_workers=options['workers'],
+                                     initializer=_init_worker,
+                                     initargs=(matcher,)) as pool:
+                self.run_pool(pool, rows, options['workers'])
+
+        elapsed = time.perf_counter() - self.started
+        action = 'Would flag' if self.dry_run else 'Flagged'
+        self.stdout.write(self.style.SUCCESS(
+            f"Scanned {self.scanned} posts in {elapsed:.1f}s "
+            f"({self.scanned / elapsed if elapsed else 0:.0f} posts/s). "
+            f"{action} {self.flagged}."))
+
+    def batches(self, rows):
+        batch = []
+        for row in rows:
+            batch.append(row)
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    def run_pool(self, pool, rows, workers):
+        # Start the workers before the query opens a cursor, so no forked
+        # process inherits a live database connection.
+        pool.submit(int).result()
+
+        # Results are applied in submission order so the checkpoint never
+        # skips past a batch that has not been written yet. Only a few
+        # batches are in flight at once to keep memory flat.
+        pending = deque()
+        for batch in self.batches(rows):
+            pending.append((batch[-1][0], len(batch), pool.submit(_score_batch, batch)))
+            if len(pending) >= workers * 2:
+                last_id, size, future = pending.popleft()
+                self.apply(last_id, size, future.result())
+        while pending:
+            last_id, size, future = pending.popleft()
+            self.apply(last_id, size, future.result())
+
+    def apply(self, last_id, size, hits):
+        if hits and not self.dry_run:
+            Post.objects.filter(id__in=[post_id for post_id, _ in hits]).update(
+                is_flagged=True, is_moderated=False, updated_at=timezone.now())
+            # update() sends no post_save, so drop the cached feed by hand
+            invalidate_feed()
+            bump(POSTS)
+
+        if self.verbosity > 1:
+            for post_id, word in hits:
+                self.stdout.write(f"Post {post_id}: {word}")
+
+        self.scanned += size
+        self.flagged += len(hits)
+        if not self.dry_run:
+            self.write_checkpoint(last_id)
+
+        elapsed = time.perf_counter() - self.started
+        self.stdout.write(
+            f"Up to id {last_id}: {self.scanned} scanned, {self.flagged} flagged, "
+            f"{self.scanned / elapsed if elapsed else 0:.0f} posts/s")
+
+    def read_checkpoint(self):
+        if not self.checkpoint:
+            return None
+        try:
+            with open(self.checkpoint, 'r') as file:
+                last_id = int(file.read().strip())
+        except (FileNotFoundError, ValueError):
+            return None
+        self.stdout.write(f"Resuming after post {last_id}")
+        return last_id
+
+    def write_checkpoint(self, last_id):
+        if not self.checkpoint:
+            return
+        tmp_path = f'{self.checkpoint}.tmp'
+        with open(tmp_path, 'w') as file:
+            file.write(str(last_id))
+        os.replace(tmp_path, self.checkpoint)
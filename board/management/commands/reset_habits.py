@@ -0,0 +1,10 @@
+from django.core.management.base import BaseCommand
+from board.habits import reset_due_habits
+
+
+class Command(BaseCommand):
+    help = 'Reset the counts of habits whose hour, day, week, month or year has ended'
+
+    def handle(self, *args, **options):
+        reset = reset_due_habits()
+        self.stdout.write(self.style.SUCCESS(f"Reset {reset} habits."))
@@ -0,0 +1,69 @@
+import signal
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from board.jobs import claim_jobs, heartbeat, release_stale_jobs, run_job
+
+
+class Command(BaseCommand):
+    help = 'Run queued background jobs (emails, push notifications)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--threads', type=int, default=4,
+                            help='Jobs run at the same time')
+        parser.add_argument('--poll-interval', type=float, default=1.0,
+                            help='Seconds to wait when the queue is empty')
+        parser.add_argument('--burst', action='store_true',
+                            help='Exit once no jobs are due instead of polling')
+
+    def handle(self, *args, **options):
+        threads = options['threads']
+        poll_interval = options['poll_interval']
+        self.stopping = False
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        self.stdout.write(f"Worker started with {threads} threads.")
+        succeeded = failed = 0
+        last_sweep = last_heartbeat = time.monotonic()
+        release_stale_jobs()
+        # The id of the job each future is running
+        running = {}
+
+        with ThreadPoolExecutor(max_workers=threads) as pool:
+            # Once stopping, let running jobs finish rather than leaving them to go stale.
+            while not self.stopping or running:
+                if time.monotonic() - last_sweep > 60:
+                    release_stale_jobs()
+                    last_sweep = time.monotonic()
+                if time.monotonic() - last_heartbeat > settings.JOB_LOCK_TIMEOUT / 3:
+                    heartbeat(list(running.values()))
+                    last_heartbeat = time.monotonic()
+
+                if not self.stopping and len(running) < threads:
+                    for job in claim_jobs(threads - len(running)):
+                        running[pool.submit(run_job, job)] = job.id
+
+                if not running:
+                    if options['burst']:
+                        break
+                    time.sleep(poll_interval)
+                    continue
+
+                # Wake up as soon as a slot frees, or after the poll interval
+                # to look for higher priority work.
+                done, _ = wait(running, timeout=poll_interval, return_when=FIRST_COMPLETED)
+                for future in done:
+                    del running[future]
+                    if future.result():
+                        succeeded += 1
+                    else:
+                        failed += 1
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Worker stopped: {succeeded} jobs succeeded, {failed} failed."))
+
+    def stop(self, signum, frame):
+        self.stopping = True
@@ -0,0 +1,46 @@
+# Generated by Django 5.1 on 2026-10-18 13:39
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("board", "0012_habit_reset_date_habitprogress"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="BannedWord",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("word", models.CharField(max_length=100, unique=True)),
+                ("added_at", models.DateTimeField(auto_now_add=True)),
+            ],
+            options={
+                "ordering": ["word"],
+            },
+        ),
+        migrations.CreateModel(
+            name="BannedWordVersion",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("created_at", models.DateTimeField(auto_now_add=True)),
+            ],
+        ),
+    ]
@@ -0,0 +1,34 @@
+import os
+
+from django.db import migrations
+
+WORDS_FILE = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "bad_words.txt"
+)
+
+
+def seed_banned_words(apps, schema_editor):
+    BannedWord = apps.get_model("board", "BannedWord")
+    BannedWordVersion = apps.get_model("board", "BannedWordVersion")
+
+    with open(WORDS_FILE, "r") as file:
+        words = {word.strip().lower() for word in file if word.strip()}
+
+    BannedWord.objects.bulk_create(
+        [BannedWord(word=word) for word in sorted(words)], ignore_conflicts=True
+    )
+    BannedWordVersion.objects.create()
+
+
+def unseed_banned_words(apps, schema_editor):
+    apps.get_model("board", "BannedWord").objects.all().delete()
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("board", "0013_bannedword"),
+    ]
+
+    operations = [
+        migrations.RunPython(seed_banned_words, unseed_banned_words),
+    ]
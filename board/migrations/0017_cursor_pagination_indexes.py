@@ -0,0 +1,30 @@
+# Generated by Django 5.1 on 2026-10-18 13:45
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("board", "0016_pendingnotification"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["is_flagged", "-created_at", "-id"], name="board_post_feed_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                fields=["author", "-created_at", "-id"], name="board_post_author_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="privatemessage",
+            index=models.Index(
+                fields=["recipient", "-timestamp", "-id"], name="board_pm_inbox_idx"
+            ),
+        ),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 5.1 on 2026-10-18 13:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("board", "0017_cursor_pagination_indexes"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(
+            model_name="post",
+            name="board_post_feed_idx",
+        ),
+        migrations.AddIndex(
+            model_name="familytodoitem",
+            index=models.Index(
+                fields=["assigned_to", "due_date"], name="board_familytodo_assignee_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="habitprogress",
+            index=models.Index(
+                fields=["habit", "date"], name="board_progress_habit_date_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_flagged", False)),
+                fields=["-created_at", "-id"],
+                name="board_post_visible_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="post",
+            index=models.Index(
+                condition=models.Q(("is_flagged", True), ("is_moderated", False)),
+                fields=["-created_at", "-id"],
+                name="board_post_modqueue_idx",
+            ),
+        ),
+    ]
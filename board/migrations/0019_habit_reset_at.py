@@ -0,0 +1,28 @@
+# Generated by Django 5.1 on 2026-10-18 13:50
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("board", "0018_hot_query_indexes"),
+    ]
+
+    operations = [
+        migrations.RenameField(
+            model_name="habit",
+            old_name="reset_date",
+            new_name="reset_at",
+        ),
+        migrations.AlterField(
+            model_name="habit",
+            name="reset_at",
+            field=models.DateTimeField(default=django.utils.timezone.now),
+        ),
+        migrations.AddField(
+            model_name="userprofile",
+            name="timezone",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 5.1 on 2026-10-18 13:53
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("board", "0019_habit_reset_at"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="habitprogress",
+            name="idempotency_key",
+            field=models.CharField(blank=True, max_length=64, null=True),
+        ),
+        migrations.AddConstraint(
+            model_name="habitprogress",
+            constraint=models.UniqueConstraint(
+                fields=("habit", "idempotency_key"),
+                name="board_progress_idempotency_key",
+            ),
+        ),
+    ]
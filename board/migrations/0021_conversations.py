@@ -0,0 +1,188 @@
+# Generated by Django 5.1 on 2026-10-18 14:00
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+def file_messages(apps, schema_editor):
+    """Group existing messages into conversations and fill in their snapshots."""
+    Conversation = apps.get_model("board", "Conversation")
+    ConversationMember = apps.get_model("board", "ConversationMember")
+    PrivateMessage = apps.get_model("board", "PrivateMessage")
+
+    conversations = {}
+    for sender_id, recipient_id in PrivateMessage.objects.values_list(
+        "sender_id", "recipient_id"
+    ).distinct():
+        low, high = sorted([sender_id, recipient_id])
+        pair_key = f"{low}:{high}"
+        if pair_key in conversations:
+            continue
+        conversation = Conversation.objects.create(pair_key=pair_key)
+        conversations[pair_key] = conversation
+        ConversationMember.objects.bulk_create(
+            [
+                ConversationMember(
+                    conversation=conversation, user_id=low, other_user_id=high
+                ),
+            ]
+            + (
+                [
+                    ConversationMember(
+                        conversation=conversation, user_id=high, other_user_id=low
+                    ),
+                ]
+                if low != high
+                else []
+            )
+        )
+        PrivateMessage.objects.filter(
+            models.Q(sender_id=low, recipient_id=high)
+            | models.Q(sender_id=high, recipient_id=low)
+        ).update(conversation=conversation)
+
+    for conversation in conversations.values():
+        latest = (
+            PrivateMessage.objects.filter(conversation=conversation)
+            .order_by("-timestamp", "-id")
+            .first()
+        )
+        Conversation.objects.filter(id=conversation.id).update(
+            last_message=latest,
+            last_sender_id=latest.sender_id,
+            last_message_preview=latest.content[:150],
+            last_message_at=latest.timestamp,
+        )
+        ConversationMember.objects.filter(conversation=conversation).update(
+            last_message_at=latest.timestamp
+        )
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("board", "0020_habitprogress_idempotency_key"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ConversationMember",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("last_message_at", models.DateTimeField(blank=True, null=True)),
+            ],
+        ),
+        migrations.CreateModel(
+            name="Conversation",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                ("pair_key", models.CharField(max_length=50, unique=True)),
+                ("last_message_preview", models.CharField(blank=True, max_length=150)),
+                ("last_message_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "last_message",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to="board.privatemessage",
+                    ),
+                ),
+                (
+                    "last_sender",
+                    models.ForeignKey(
+                        blank=True,
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="+",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddField(
+            model_name="privatemessage",
+            name="conversation",
+            field=models.ForeignKey(
+                blank=True,
+                null=True,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="messages",
+                to="board.conversation",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="privatemessage",
+            index=models.Index(
+                fields=["conversation", "-timestamp", "-id"],
+                name="board_pm_conversation_idx",
+            ),
+        ),
+        migrations.AddField(
+            model_name="conversationmember",
+            name="conversation",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="members",
+                to="board.conversation",
+            ),
+        ),
+        migrations.AddField(
+            model_name="conversationmember",
+            name="other_user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="+",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name="conversationmember",
+            name="user",
+            field=models.ForeignKey(
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="conversation_memberships",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddField(
+            model_name="conversation",
+            name="participants",
+            field=models.ManyToManyField(
+                related_name="conversations",
+                through="board.ConversationMember",
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="conversationmember",
+            index=models.Index(
+                fields=["user", "-last_message_at", "-id"],
+                name="board_conversation_inbox_idx",
+            ),
+        ),
+        migrations.AddConstraint(
+            model_name="conversationmember",
+            constraint=models.UniqueConstraint(
+                fields=("conversation", "user"), name="board_conversation_member"
+            ),
+        ),
+        migrations.RunPython(file_messages, migrations.RunPython.noop),
+    ]
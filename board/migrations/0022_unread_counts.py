@@ -0,0 +1,42 @@
+# Generated by Django 5.1 on 2026-10-18 14:03
+
+from django.db import migrations, models
+
+
+def mark_existing_read(apps, schema_editor):
+    # There was no read state before, so start everyone with an empty badge
+    PrivateMessage = apps.get_model("board", "PrivateMessage")
+    PrivateMessage.objects.update(read_at=models.F("timestamp"))
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("board", "0021_conversations"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="conversationmember",
+            name="unread_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="privatemessage",
+            name="read_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddField(
+            model_name="userprofile",
+            name="unread_messages",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddIndex(
+            model_name="privatemessage",
+            index=models.Index(
+                condition=models.Q(("read_at__isnull", True)),
+                fields=["recipient", "conversation"],
+                name="board_pm_unread_idx",
+            ),
+        ),
+        migrations.RunPython(mark_existing_read, migrations.RunPython.noop),
+    ]
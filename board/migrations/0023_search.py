@@ -0,0 +1,98 @@
+# Generated by Django 5.1 on 2026-10-18 14:22
+
+import django.contrib.postgres.search
+from django.conf import settings
+from django.db import migrations, models
+
+
+def add_search_indexes(apps, schema_editor):
+    # Other databases search SearchTerm instead; see board/search.py
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    config = settings.SEARCH_CONFIG
+    schema_editor.execute(
+        "CREATE INDEX board_post_search_idx ON board_post USING gin (search_vector)"
+    )
+    schema_editor.execute(
+        "CREATE INDEX board_pm_search_idx ON board_privatemessage USING gin (search_vector)"
+    )
+    schema_editor.execute(
+        "UPDATE board_post SET search_vector = "
+        "setweight(to_tsvector(%s::regconfig, title), 'A') || "
+        "setweight(to_tsvector(%s::regconfig, content), 'B')",
+        [config, config],
+    )
+    schema_editor.execute(
+        "UPDATE board_privatemessage SET search_vector = "
+        "to_tsvector(%s::regconfig, content)",
+        [config],
+    )
+
+
+def remove_search_indexes(apps, schema_editor):
+    if schema_editor.connection.vendor != "postgresql":
+        return
+    schema_editor.execute("DROP INDEX IF EXISTS board_post_search_idx")
+    schema_editor.execute("DROP INDEX IF EXISTS board_pm_search_idx")
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("board", "0022_unread_counts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="post",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.AddField(
+            model_name="privatemessage",
+            name="search_vector",
+            field=django.contrib.postgres.search.SearchVectorField(
+                editable=False, null=True
+            ),
+        ),
+        migrations.CreateModel(
+            name="SearchTerm",
+            fields=[
+                (
+                    "id",
+                    models.BigAutoField(
+                        auto_created=True,
+                        primary_key=True,
+                        serialize=False,
+                        verbose_name="ID",
+                    ),
+                ),
+                (
+                    "kind",
+                    models.CharField(
+                        choices=[("post", "Post"), ("message", "Private message")],
+                        max_length=10,
+                    ),
+                ),
+                ("object_id", models.BigIntegerField()),
+                ("term", models.CharField(max_length=64)),
+                ("weight", models.PositiveIntegerField()),
+            ],
+            options={
+                "indexes": [
+                    models.Index(
+                        fields=["kind", "term", "object_id"],
+                        name="board_search_term_idx",
+                    )
+                ],
+                "constraints": [
+                    models.UniqueConstraint(
+                        fields=("kind", "object_id", "term"),
+                        name="board_search_term_unique",
+                    )
+                ],
+            },
+        ),
+        migrations.RunPython(add_search_indexes, remove_search_indexes),
+    ]
@@ -0,0 +1,18 @@
+# Generated by Django 5.1 on 2026-10-18 15:00
+
+import django.utils.timezone
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    dependencies = [
+        ("board", "0024_updated_at"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="habitprogress",
+            name="date",
+            field=models.DateField(default=django.utils.timezone.localdate),
+        ),
+    ]
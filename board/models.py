@@ -1,11 +1,15 @@
-from datetime import timedelta
-from .utils import send_to_moderator  # Assuming you have a utility for this
+import logging
+from smtplib import SMTPRecipientsRefused
+
 from django.contrib.auth.models import AbstractBaseUser, BaseUserManager, PermissionsMixin
-from django.db import models
+from django.contrib.postgres.search import SearchVectorField
+from django.db import IntegrityError, models, transaction
 from django.utils import timezone
-from django.core.mail import send_mail
+from django.core.mail import EmailMessage, get_connection
 from django.conf import settings
 
+logger = logging.getLogger(__name__)
+
 
 def get_default_user():
     """Returns the first user in the database as the default."""
@@ -36,6 +40,13 @@ class UserManager(BaseUserManager):
         return user
 
 
+class SearchableManager(models.Manager):
+    """Leaves the search vector out of ordinary queries; only search reads it."""
+
+    def get_queryset(self):
+        return super().get_queryset().defer('search_vector')
+
+
 class User(AbstractBaseUser, PermissionsMixin):
     """Custom user model."""
 
@@ -66,47 +77,311 @@ class PrivateMessage(models.Model):
         User, related_name='sent_messages', on_delete=models.CASCADE)
     recipient = models.ForeignKey(
         User, related_name='received_messages', on_delete=models.CASCADE)
+    conversation = models.ForeignKey(
+        'Conversation', related_name='messages', on_delete=models.CASCADE,
+        null=True, blank=True)
     content = models.TextField()
     timestamp = models.DateTimeField(auto_now_add=True)
+    # Bumped by every change the API serializes, for its ETags
+    updated_at = models.DateTimeField(auto_now=True)
+    # Set when the recipient opens the conversation
+    read_at = models.DateTimeField(null=True, blank=True)
+    # Maintained by board.search on PostgreSQL
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = SearchableManager()
+
+    class Meta:
+        indexes = [
+            # Keyset pagination of the inbox (see board.pagination)
+            models.Index(fields=['recipient', '-timestamp', '-id'],
+                         name='board_pm_inbox_idx'),
+            # Keyset pagination of a conversation's history
+            models.Index(fields=['conversation', '-timestamp', '-id'],
+                         name='board_pm_conversation_idx'),
+            # Marking a conversation read and recounting unread messages
+            models.Index(fields=['recipient', 'conversation'],
+                         condition=models.Q(read_at__isnull=True),
+                         name='board_pm_unread_idx'),
+        ]
+
+    def save(self, *args, **kwargs):
+        """
+        File new messages under their conversation, keep its last-message
+        snapshot current and count them as unread for the recipient.
+        """
+        from .unread import message_sent
+
+        adding = self._state.adding
+        if adding and self.sender_id == self.recipient_id:
+            # A note to yourself has already been read
+            self.read_at = timezone.now()
+        with transaction.atomic():
+            if adding and self.conversation_id is None:
+                self.conversation = Conversation.between(self.sender, self.recipient)
+            super().save(*args, **kwargs)
+            if self.conversation_id:
+                self.conversation.record(self)
+                if adding:
+                    message_sent(self)
 
     def __str__(self):
         return f'Message from {self.sender} to {self.recipient}'
 
 
+class Conversation(models.Model):
+    """
+    The thread of private messages between two users.
+
+    A snapshot of the latest message is kept here, and its time is copied to
+    each member's row, so the inbox is one index range scan over
+    ``ConversationMember`` however many messages there are.
+    """
+
+    # "<lower user id>:<higher user id>", so each pair has one conversation
+    pair_key = models.CharField(max_length=50, unique=True)
+    participants = models.ManyToManyField(
+        User, through='ConversationMember',
+        through_fields=('conversation', 'user'), related_name='conversations')
+    last_message = models.ForeignKey(
+        PrivateMessage, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    last_sender = models.ForeignKey(
+        User, related_name='+', on_delete=models.SET_NULL, null=True, blank=True)
+    last_message_preview = models.CharField(max_length=150, blank=True)
+    last_message_at = models.DateTimeField(null=True, blank=True)
+
+    @staticmethod
+    def pair_key_for(user, other):
+        low, high = sorted([user.pk, other.pk])
+        return f'{low}:{high}'
+
+    @classmethod
+    def between(cls, user, other):
+        """Return the conversation between two users, creating it on their first message."""
+        pair_key = cls.pair_key_for(user, other)
+        conversation = cls.objects.filter(pair_key=pair_key).first()
+        if conversation is not None:
+            return conversation
+        try:
+            with transaction.atomic():
+                conversation = cls.objects.create(pair_key=pair_key)
+                ConversationMember.objects.bulk_create([
+                    ConversationMember(conversation=conversation, user=user, other_user=other),
+                    ConversationMember(conversation=conversation, user=other, other_user=user),
+                ] if user.pk != other.pk else [
+                    ConversationMember(conversation=conversation, user=user, other_user=user),
+                ])
+                return conversation
+        except IntegrityError:
+            # Both users wrote their first message at the same moment.
+            return cls.objects.get(pair_key=pair_key)
+
+    def record(self, message):
+        """Make ``message`` the snapshot if it is the latest one (or is the snapshot and was edited)."""
+        updated = Conversation.objects.filter(id=self.id).filter(
+            models.Q(last_message_at__isnull=True) |
+            models.Q(last_message_at__lte=message.timestamp) |
+            models.Q(last_message=message.id)
+        ).update(
+            last_message=message, last_sender=message.sender_id,
+            last_message_preview=message.content[:150],
+            last_message_at=message.timestamp,
+        )
+        if updated:
+            self.members.filter(
+                models.Q(last_message_at__isnull=True) |
+                models.Q(last_message_at__lte=message.timestamp)
+            ).update(last_message_at=message.timestamp)
+
+    def refresh_last_message(self):
+        """Rebuild the snapshot from the newest message, e.g. after the last one was deleted."""
+        latest = self.messages.order_by('-timestamp', '-id').first()
+        Conversation.objects.filter(id=self.id).update(
+            last_message=latest,
+            last_sender=latest.sender_id if latest else None,
+            last_message_preview=latest.content[:150] if latest else '',
+            last_message_at=latest.timestamp if latest else None,
+        )
+        self.members.update(last_message_at=latest.timestamp if latest else None)
+
+    def __str__(self):
+        return f'Conversation {self.pair_key}'
+
+
+class ConversationMember(models.Model):
+    """One user's entry for a conversation in their inbox."""
+
+    conversation = models.ForeignKey(
+        Conversation, related_name='members', on_delete=models.CASCADE)
+    user = models.ForeignKey(
+        User, related_name='conversation_memberships', on_delete=models.CASCADE)
+    # The person on the other end, so the inbox can show them without a join
+    # through the participants
+    other_user = models.ForeignKey(User, related_name='+', on_delete=models.CASCADE)
+    # Copy of Conversation.last_message_at to order the inbox by
+    last_message_at = models.DateTimeField(null=True, blank=True)
+    # Messages to this user not yet read (see board.unread)
+    unread_count = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['conversation', 'user'],
+                                    name='board_conversation_member'),
+        ]
+        indexes = [
+            models.Index(fields=['user', '-last_message_at', '-id'],
+                         name='board_conversation_inbox_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.user} in {self.conversation}'
+
+
+class SearchTerm(models.Model):
+    """
+    How often a word appears in a post or private message: the inverted
+    index board.search uses on databases without full-text search, such
+    as SQLite in development.
+    """
+
+    POST = 'post'
+    MESSAGE = 'message'
+    KIND_CHOICES = [(POST, 'Post'), (MESSAGE, 'Private message')]
+
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    object_id = models.BigIntegerField()
+    term = models.CharField(max_length=64)
+    # Occurrences, with title words counted more than once
+    weight = models.PositiveIntegerField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['kind', 'object_id', 'term'],
+                                    name='board_search_term_unique'),
+        ]
+        indexes = [
+            # Looking words and prefixes up
+            models.Index(fields=['kind', 'term', 'object_id'], name='board_search_term_idx'),
+        ]
+
+    def __str__(self):
+        return f'{self.term} in {self.kind} {self.object_id}'
+
+
 class Post(models.Model):
     """Model for posts in the message board."""
     title = models.CharField(max_length=100)
     author = models.ForeignKey(User, on_delete=models.SET_NULL, null=True)
     content = models.TextField()
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
     is_flagged = models.BooleanField(default=False)
     is_moderated = models.BooleanField(default=False)
+    # Maintained by board.search on PostgreSQL
+    search_vector = SearchVectorField(null=True, editable=False)
+
+    objects = SearchableManager()
+
+    class Meta:
+        indexes = [
+            # The feed only ever shows unflagged posts
+            models.Index(fields=['-created_at', '-id'],
+                         condition=models.Q(is_flagged=False),
+                         name='board_post_visible_idx'),
+            # The moderation queue
+            models.Index(fields=['-created_at', '-id'],
+                         condition=models.Q(is_flagged=True, is_moderated=False),
+                         name='board_post_modqueue_idx'),
+            models.Index(fields=['author', '-created_at', '-id'],
+                         name='board_post_author_idx'),
+        ]
 
     def flag_for_moderation(self, banned_word):
         """Flags the post for moderation and notifies moderators."""
+        from .notifications import notify_flagged_post
+
         self.is_flagged = True
         self.is_moderated = False  # Needs review by a moderator
         self.save()
 
         # Notify moderators with information about the banned word
-        send_to_moderator(self, reason=f"Flagged due to banned word: {banned_word}")
-
-    def send_creation_notification(self):
-        """Send email notification to all users except the author."""
-        all_user_emails = User.objects.exclude(id=self.author.id).exclude(email='').values_list('email', flat=True)
-
-        send_mail(
-            subject='New Post Created',
-            message=f"A new post has been created by {self.author.username}.",
-            from_email=settings.DEFAULT_FROM_EMAIL,
-            recipient_list=list(all_user_emails),
-            fail_silently=False,
-        )
+        notify_flagged_post(self, reason=f"Flagged due to banned word: {banned_word}")
+
+    def notification_recipients(self):
+        """Users who should be emailed about this post, in id order."""
+        recipients = User.objects.filter(is_active=True, email_notifications=True) \
+            .exclude(userprofile__email_notifications=False).exclude(email='')
+        if self.author_id:
+            recipients = recipients.exclude(id=self.author_id)
+        return recipients.order_by('id')
+
+    def send_creation_notification(self, after_id=0, batch_size=None):
+        """
+        Email the next batch of users about this post.
+
+        Each user gets their own message, and the whole batch goes out over one
+        SMTP connection. A recipient the server refuses is logged and skipped.
+        Recipients are read in id order after ``after_id``.
+        Returns the last id emailed if the batch was full, so the caller can
+        continue from there, or ``None`` once everyone has been notified.
+        """
+        batch_size = batch_size or settings.NOTIFICATION_BATCH_SIZE
+        recipients = self.notification_recipients().filter(id__gt=after_id) \
+            .values_list('id', 'email')[:batch_size]
+        author = self.author.username if self.author else 'Unknown'
+
+        last_id = None
+        emails = []
+        for last_id, email in recipients.iterator(chunk_size=batch_size):
+            emails.append(EmailMessage(
+                subject='New Post Created',
+                body=f"A new post has been created by {author}.",
+                from_email=settings.DEFAULT_FROM_EMAIL,
+                to=[email],
+            ))
+
+        if emails:
+            with get_connection(fail_silently=False) as connection:
+                for message in emails:
+                    # Raising here would retry the job and email everyone
+                    # before this recipient a second time.
+                    try:
+                        connection.send_messages([message])
+                    except (SMTPRecipientsRefused, ValueError) as e:
+                        logger.warning(f"Skipped post notification to {message.to[0]}: {e}")
+        # A short batch was the last one
+        return last_id if len(emails) == batch_size else None
 
     def __str__(self):
         return f"Post: {self.title} by {self.author.username if self.author else 'Unknown'}"
 
 
+class BannedWord(models.Model):
+    """A word that gets posts flagged for moderation."""
+
+    word = models.CharField(max_length=100, unique=True)
+    added_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        ordering = ['word']
+
+    def save(self, *args, **kwargs):
+        self.word = self.word.strip().lower()
+        super().save(*args, **kwargs)
+
+    def __str__(self):
+        return self.word
+
+
+class BannedWordVersion(models.Model):
+    """One row per change to the banned word list; the latest id is the current version."""
+
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"Banned word list v{self.id}"
+
+
 class UserProfile(models.Model):
     """Extended user profile model."""
 
@@ -130,6 +405,18 @@ class UserProfile(models.Model):
     location_sharing = models.BooleanField(default=False)
     profile_visibility = models.BooleanField(default=True)
     is_trusted_user = models.BooleanField(default=False)
+    notification_delivery = models.CharField(
+        max_length=10,
+        choices=[
+            ('immediate', 'Immediately'),
+            ('digest', 'Grouped into a digest')
+        ],
+        default='immediate'
+    )
+    # IANA name such as 'Australia/Sydney'; blank means settings.TIME_ZONE
+    timezone = models.CharField(max_length=64, blank=True)
+    # Total of the user's ConversationMember.unread_count, for the inbox badge
+    unread_messages = models.PositiveIntegerField(default=0)
     
     def __str__(self):
         return f'Profile of {self.user.username}'
@@ -152,81 +439,79 @@ class Habit(models.Model):
         max_length=20, choices=FREQUENCY_CHOICES, default='daily')
     current_count = models.IntegerField(default=0)
     target_count = models.IntegerField(default=1)
-    # Correctly set as a date field with default
-    reset_date = models.DateField(default=timezone.now)
+    # When the current period ends and current_count goes back to zero
+    reset_at = models.DateTimeField(default=timezone.now)
+    updated_at = models.DateTimeField(auto_now=True)
 
     def save(self, *args, **kwargs):
-        """Override save to set reset_date based on frequency if not already set."""
-        if not self.reset_date:
-            self.reset_date = self.calculate_reset_date()
+        """Start a new habit's first period in its owner's time zone."""
+        if self._state.adding:
+            from .habits import next_reset, user_timezone
+            self.reset_at = next_reset(self.frequency, timezone.now(),
+                                       user_timezone(self.user))
         super().save(*args, **kwargs)
 
-    def calculate_reset_date(self):
-        """Calculate the next reset date based on the frequency."""
-        now = timezone.now()
-
-        if self.frequency == 'hourly':
-            return now + timedelta(hours=1)
-        elif self.frequency == 'daily':
-            return now + timedelta(days=1)
-        elif self.frequency == 'weekly':
-            return now + timedelta(weeks=1)
-        elif self.frequency == 'monthly':
-            # This will never fail
-            next_month = now.replace(day=28) + timedelta(days=4)
-            # Get the first day of the next month
-            return next_month.replace(day=1).date()
-        elif self.frequency == 'yearly':
-            return now.replace(year=now.year + 1).date()
-        return now.date()  # Default to today if no valid frequency
-
-    def increment_count(self):
-        """Increments the current count and checks if the habit is completed."""
-        self.reset_if_needed()
-
-        if self.current_count < self.target_count:
-            self.current_count += 1
-            self.save()
-
-        if self.current_count >= self.target_count:
-            self.completed = True
-            self.save()
-
-    def reset_if_needed(self):
-        """Resets the habit's count based on the frequency."""
-        now = timezone.now()
-
-        if self.frequency == 'hourly' and now >= self.reset_date:
-            self.current_count = 0
-            self.reset_date = now + timedelta(hours=1)
-
-        elif self.frequency == 'daily' and now.date() >= self.reset_date:
-            self.current_count = 0
-            self.reset_date = now.date() + timedelta(days=1)
-
-        elif self.frequency == 'weekly' and now.date() >= self.reset_date:
-            self.current_count = 0
-            self.reset_date = now.date() + timedelta(weeks=1)
-
-        elif self.frequency == 'monthly' and now.date() >= self.reset_date:
-            self.current_count = 0
-            next_month = now.replace(day=28) + timedelta(days=4)
-            self.reset_date = next_month.replace(day=1).date()
-
-        elif self.frequency == 'yearly' and now.date() >= self.reset_date:
-            self.current_count = 0
-            self.reset_date = now.replace(year=now.year + 1).date()
-
-        self.completed = False
-        self.save()
+    def increment_count(self, idempotency_key=None):
+        """
+        Count one more completion and log it, unless the target is already
+        met or ``idempotency_key`` has been counted before.
+
+        The count is bumped by a single conditional UPDATE, so concurrent
+        clicks can't lose an increment or go past the target. Returns True
+        if this call counted.
+        """
+        from .conditional import bump_on_commit, habits_stamp
+        from .habits import reset_if_due, user_timezone
+
+        try:
+            with transaction.atomic():
+                reset_if_due(self.user, [self])
+                if idempotency_key and self.progress.filter(
+                        idempotency_key=idempotency_key).exists():
+                    counted = False
+                else:
+                    counted = bool(Habit.objects.filter(
+                        id=self.id, current_count__lt=models.F('target_count'),
+                    ).update(
+                        current_count=models.F('current_count') + 1,
+                        updated_at=timezone.now(),
+                        completed=models.Case(
+                            models.When(current_count__gte=models.F('target_count') - 1,
+                                        then=models.Value(True)),
+                            default=models.F('completed'),
+                        ),
+                    ))
+                    if counted:
+                        HabitProgress.objects.create(
+                            habit=self, count=1, idempotency_key=idempotency_key,
+                            date=timezone.localdate(timezone=user_timezone(self.user)))
+                        bump_on_commit(habits_stamp(self.user_id))
+        except IntegrityError:
+            # A concurrent retry with the same key got there first.
+            counted = False
+
+        self.refresh_from_db(fields=['current_count', 'completed', 'reset_at', 'updated_at'])
+        return counted
 
 
 class HabitProgress(models.Model):
     habit = models.ForeignKey(
             Habit, on_delete=models.CASCADE, related_name='progress')
             
-    date = models.DateField(auto_now_add=True)
+    # The day in the owner's time zone, set by Habit.increment_count
+    date = models.DateField(default=timezone.localdate)
     count = models.PositiveIntegerField()
+    # Sent by the client so a retried increment is only counted once
+    idempotency_key = models.CharField(max_length=64, blank=True, null=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['habit', 'date'], name='board_progress_habit_date_idx'),
+        ]
+        constraints = [
+            models.UniqueConstraint(fields=['habit', 'idempotency_key'],
+                                    name='board_progress_idempotency_key'),
+        ]
 
     def __str__(self):
         return f"{self.habit.name} progress on {self.date}"
@@ -238,6 +523,13 @@ class FamilyToDoItem(models.Model):
          User, on_delete=models.CASCADE, related_name='family_todos', blank=True, null=True)
     due_date = models.DateField()
     completed = models.BooleanField(default=False)
+    updated_at = models.DateTimeField(auto_now=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['assigned_to', 'due_date'],
+                         name='board_familytodo_assignee_idx'),
+        ]
 
     def __str__(self):
         return self.task_name
@@ -252,3 +544,62 @@ class SamsTodoItem(models.Model):
 
     def __str__(self):
         return self.task_name
+
+
+class Job(models.Model):
+    """A unit of background work, run by the ``run_worker`` command."""
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DEAD = 'dead'
+    STATUS_CHOICES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DEAD, 'Dead'),
+    ]
+
+    task = models.CharField(max_length=255)
+    args = models.JSONField(default=list, blank=True)
+    kwargs = models.JSONField(default=dict, blank=True)
+    priority = models.SmallIntegerField(default=0)
+    status = models.CharField(
+        max_length=10, choices=STATUS_CHOICES, default=QUEUED)
+    attempts = models.PositiveIntegerField(default=0)
+    max_attempts = models.PositiveIntegerField(default=5)
+    run_at = models.DateTimeField(default=timezone.now)
+    locked_at = models.DateTimeField(blank=True, null=True)
+    last_error = models.TextField(blank=True)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        indexes = [
+            models.Index(fields=['status', 'priority', 'run_at'],
+                         name='board_job_claim_idx'),
+        ]
+
+    def __str__(self):
+        return f"{self.task} ({self.status})"
+
+
+class PendingNotification(models.Model):
+    """A notification held back to be sent as part of a digest."""
+
+    MESSAGE = 'message'
+    FLAGGED_POST = 'flagged_post'
+    KIND_CHOICES = [
+        (MESSAGE, 'Private message'),
+        (FLAGGED_POST, 'Flagged post'),
+    ]
+
+    # Left empty for moderator alerts, which go to MODERATOR_EMAIL
+    recipient = models.ForeignKey(
+        User, on_delete=models.CASCADE, related_name='pending_notifications',
+        blank=True, null=True)
+    kind = models.CharField(max_length=20, choices=KIND_CHOICES)
+    sender = models.ForeignKey(
+        User, on_delete=models.SET_NULL, related_name='+', blank=True, null=True)
+    summary = models.CharField(max_length=255)
+    created_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return f"{self.get_kind_display()} for {self.recipient or 'moderators'}"
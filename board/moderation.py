@@ -0,0 +1,287 @@
+import functools
+import heapq
+import logging
+import os
+import re
+import unicodedata
+from typing import NamedTuple
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+
+logger = logging.getLogger(__name__)
+
+VERSION_CACHE_KEY = 'board:banned_words:version'
+
+# Digits and symbols commonly used in place of letters ("5h1t", "a$$").
+LEETSPEAK = {
+    '0': 'o',
+    '1': 'i',
+    '3': 'e',
+    '4': 'a',
+    '5': 's',
+    '7': 't',
+    '@': 'a',
+    '$': 's',
+    '+': 't',
+}
+
+# Cyrillic and Greek letters that render the same as a Latin letter.
+CONFUSABLES = {
+    'а': 'a', 'в': 'b', 'е': 'e', 'ё': 'e', 'к': 'k', 'м': 'm', 'н': 'h',
+    'о': 'o', 'р': 'p', 'с': 'c', 'т': 't', 'у': 'y', 'х': 'x', 'і': 'i',
+    'ј': 'j', 'ѕ': 's', 'ԁ': 'd', 'ɡ': 'g', 'ı': 'i',
+    'α': 'a', 'β': 'b', 'ε': 'e', 'η': 'n', 'ι': 'i', 'κ': 'k', 'ν': 'v',
+    'ο': 'o', 'ρ': 'p', 'τ': 't', 'υ': 'u', 'χ': 'x',
+}
+
+_TRANSLATION = str.maketrans({**LEETSPEAK, **CONFUSABLES})
+_NON_ASCII = re.compile(r'[^\x00-\x7f]+')
+
+
+class Match(NamedTuple):
+    """A banned word found in a piece of text."""
+    word: str
+    start: int
+    end: int
+
+
+@functools.lru_cache(maxsize=4096)
+def _fold(char, deobfuscate):
+    """Normalize a single non-ASCII character; may return zero or more characters."""
+    decomposed = unicodedata.normalize('NFKD', char)
+    stripped = ''.join(c for c in decomposed if not unicodedata.combining(c)).lower()
+    return stripped.translate(_TRANSLATION) if deobfuscate else stripped
+
+
+def normalize(text, deobfuscate=True):
+    """
+    Fold case, accents, confusable letters and leetspeak out of ``text``.
+    With ``deobfuscate`` off only case and accents are folded.
+
+    Returns the normalized string and a list mapping each of its characters
+    back to an index in the original text, or ``None`` when the two line up
+    one to one.
+    """
+    table = _TRANSLATION if deobfuscate else {}
+    if text.isascii():
+        # ASCII lowercasing and the translation table are both one character
+        # in, one character out, so offsets are unchanged.
+        return text.lower().translate(table), None
+
+    chunks = []
+    offsets = []
+    position = 0
+    for run in _NON_ASCII.finditer(text):
+        start, end = run.span()
+        chunks.append(text[position:start].lower().translate(table))
+        offsets.extend(range(position, start))
+        for index in range(start, end):
+            folded = _fold(text[index], deobfuscate)
+            chunks.append(folded)
+            offsets.extend([index] * len(folded))
+        position = end
+    chunks.append(text[position:].lower().translate(table))
+    offsets.extend(range(position, len(text)))
+    return ''.join(chunks), offsets
+
+
+def _trie_pattern(node):
+    """Turn a character trie into a regex of nested alternations sharing prefixes."""
+    if '' in node and len(node) == 1:
+        return ''
+
+    branches = []
+    single_chars = []
+    optional = False
+    for char, child in sorted(node.items()):
+        if char == '':
+            optional = True
+            continue
+        rest = _trie_pattern(child)
+        if rest:
+            branches.append(re.escape(char) + rest)
+        else:
+            single_chars.append(re.escape(char))
+
+    if single_chars:
+        branches.append(single_chars[0] if len(single_chars) == 1
+                        else '[' + ''.join(single_chars) + ']')
+
+    pattern = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    if optional:
+        pattern = '(?:' + pattern + ')?'
+    return pattern
+
+
+class BannedWordMatcher:
+    """
+    Finds banned words in a single pass over the text.
+
+    The word list is normalized and compiled into one trie-shaped regex, so
+    the cost of a scan depends on the length of the text rather than on the
+    number of banned words. With ``whole_words`` enabled, a word only
+    matches when it is not part of a longer word ("class" does not hit "ass").
+
+    Only the text is deobfuscated: a plain entry ("ass") also catches "a$$"
+    and "аss" with a Cyrillic "а". An entry that is itself spelled with
+    digits or symbols ("a54") is looked for as written, since folding it
+    would turn it into an ordinary word ("asa").
+    """
+
+    def __init__(self, words, whole_words=True):
+        self.words = {}
+        self.literals = {}
+        for word in words:
+            word = word.strip()
+            if not word:
+                continue
+            spelling, _ = normalize(word, deobfuscate=False)
+            if spelling.translate(_TRANSLATION) == spelling:
+                self.words[spelling] = word.lower()
+            else:
+                self.literals[spelling] = word.lower()
+        # An obfuscated variant of a plain entry is already caught by it.
+        for spelling in [s for s in self.literals if normalize(s)[0] in self.words]:
+            del self.literals[spelling]
+
+        self.whole_words = whole_words
+        self.pattern = self._compile(self.words, whole_words)
+        self.literal_pattern = self._compile(self.literals, whole_words)
+
+    def __len__(self):
+        return len(self.words) + len(self.literals)
+
+    @staticmethod
+    def _compile(words, whole_words):
+        if not words:
+            return None
+
+        trie = {}
+        for word in words:
+            node = trie
+            for char in word:
+                node = node.setdefault(char, {})
+            node[''] = {}
+
+        pattern = _trie_pattern(trie)
+        if whole_words:
+            pattern = r'(?<!\w)' + pattern + r'(?!\w)'
+        else:
+            pattern = '(?=(' + pattern + '))'
+        return re.compile(pattern)
+
+    def _scan(self, pattern, words, text, deobfuscate):
+        if pattern is None:
+            return
+
+        normalized, offsets = normalize(text, deobfuscate)
+        for found in pattern.finditer(normalized):
+            if self.whole_words:
+                start, end = found.span()
+            else:
+                start, end = found.span(1)
+            word = words[normalized[start:end]]
+            if offsets is not None:
+                start, end = offsets[start], offsets[end - 1] + 1
+            yield Match(word, start, end)
+
+    def _iter_matches(self, text):
+        if not text:
+            return iter(())
+        if self.literal_pattern is None:
+            return self._scan(self.pattern, self.words, text, True)
+        return heapq.merge(
+            self._scan(self.pattern, self.words, text, True),
+            self._scan(self.literal_pattern, self.literals, text, False),
+            key=lambda match: match.start,
+        )
+
+    def find_all(self, text):
+        """Return every banned word in ``text`` with its offsets."""
+        return list(self._iter_matches(text))
+
+    def search(self, text):
+        """Return the first banned word in ``text``, or ``None``."""
+        return next(self._iter_matches(text), None)
+
+
+def load_banned_words(file_path=None):
+    """Read the bundled word list that seeds the ``BannedWord`` table."""
+    if not file_path:
+        file_path = os.path.join(settings.BASE_DIR, 'board', 'bad_words.txt')
+
+    try:
+        with open(file_path, "r") as file:
+            words = [word.strip().lower() for word in file.readlines()]
+            logger.info("Banned words loaded successfully.")
+            return words
+    except FileNotFoundError:
+        logger.error("Banned words file not found.")
+        return []
+
+
+# The matcher this worker last built, and the list version it was built from.
+_matcher = None
+_matcher_version = None
+
+
+def current_version():
+    """
+    Return the version number of the banned word list.
+
+    The number is kept in the cache so the per-request check is a single
+    cache hit. With a per-process cache it is re-read from the database at
+    most every ``BANNED_WORDS_VERSION_TTL`` seconds; with a shared cache
+    every worker sees a bump as soon as it is made.
+    """
+    version = cache.get(VERSION_CACHE_KEY)
+    if version is None:
+        from .models import BannedWordVersion
+
+        latest = BannedWordVersion.objects.order_by('-id').first()
+        version = latest.id if latest else 0
+        cache.set(VERSION_CACHE_KEY, version, settings.BANNED_WORDS_VERSION_TTL)
+    return version
+
+
+def bump_version():
+    """Record a change to the banned word list so every worker rebuilds its matcher."""
+    from .models import BannedWordVersion
+
+    version = BannedWordVersion.objects.create().id
+    cache.set(VERSION_CACHE_KEY, version, settings.BANNED_WORDS_VERSION_TTL)
+    return version
+
+
+def bump_version_on_commit():
+    """
+    Bump the version when the current transaction commits, once however
+    many words it changed, so a bulk delete in the admin makes one version.
+    """
+    connection = transaction.get_connection()
+    if connection.in_atomic_block and any(
+            func is bump_version for _, func, _ in connection.run_on_commit):
+        return
+    transaction.on_commit(bump_version)
+
+
+def build_matcher():
+    from .models import BannedWord
+
+    return BannedWordMatcher(BannedWord.objects.values_list('word', flat=True).iterator())
+
+
+def get_banned_word_matcher():
+    """Return a matcher for the current banned word list, rebuilding it when the list changes."""
+    global _matcher, _matcher_version
+
+    version = current_version()
+    if _matcher is None or version != _matcher_version:
+        # Compiling the list takes about as long as unpickling a compiled
+        # matcher would, since a pickled pattern is recompiled on load.
+        _matcher = build_matcher()
+        _matcher_version = version
+        logger.info(f"Built banned word matcher v{version} ({len(_matcher)} words).")
+    return _matcher
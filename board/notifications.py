@@ -0,0 +1,151 @@
+"""
+Decides how notifications go out: straight away, or buffered per recipient
+and sent as one digest at the end of ``NOTIFICATION_DIGEST_WINDOW``.
+"""
+import asyncio
+import logging
+from collections import Counter
+from datetime import timedelta
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core.mail import send_mail
+from django.db import transaction
+
+from .jobs import PRIORITY_HIGH, enqueue
+from .models import PendingNotification, User
+from .push import asend_push
+
+logger = logging.getLogger(__name__)
+
+# There is no async SMTP client, so a pool thread does the waiting instead
+# of the event loop (or the request thread).
+asend_mail = sync_to_async(send_mail, thread_sensitive=False)
+
+
+async def deliver(*sends):
+    """Wait for independent email and push sends at the same time."""
+    await asyncio.gather(*sends)
+
+
+def wants_digest(user):
+    profile = getattr(user, 'userprofile', None)
+    return profile is not None and profile.notification_delivery == 'digest'
+
+
+def notify_new_message(message):
+    """Email and push the recipient about a private message, now or in their next digest."""
+    from .tasks import send_message_email, send_message_push
+
+    recipient = message.recipient
+    if wants_digest(recipient):
+        buffer_notification(
+            PendingNotification.MESSAGE, recipient=recipient, sender=message.sender,
+            summary=f"From {message.sender.username}")
+        return
+
+    if recipient.email_notifications:
+        enqueue(send_message_email, message.id, priority=PRIORITY_HIGH)
+    if recipient.fcm_token:
+        enqueue(send_message_push, message.id, priority=PRIORITY_HIGH)
+
+
+def notify_flagged_post(post, reason):
+    """Tell the moderators about a flagged post, now or in their next digest."""
+    from .tasks import notify_moderator
+
+    if settings.MODERATOR_ALERT_DIGEST:
+        buffer_notification(
+            PendingNotification.FLAGGED_POST, sender=post.author,
+            summary=f'"{post.title[:100]}" ({reason})'[:255])
+    else:
+        enqueue(notify_moderator, post.id, reason=reason)
+
+
+def buffer_notification(kind, recipient=None, sender=None, summary=''):
+    """
+    Hold a notification for the recipient's next digest.
+
+    Every notification asks for a digest, but only one can be queued per
+    kind and recipient, so the first notification in a window sets when it
+    goes out. Asking every time means a notification is never left behind
+    by a digest job that died or one that was finishing as it arrived.
+    """
+    PendingNotification.objects.create(
+        kind=kind, recipient=recipient, sender=sender, summary=summary)
+    schedule_digest(kind, recipient.id if recipient else None)
+
+
+def schedule_digest(kind, recipient_id):
+    from .tasks import send_notification_digest
+
+    enqueue(send_notification_digest, kind, recipient_id=recipient_id, unique=True,
+            delay=timedelta(seconds=settings.NOTIFICATION_DIGEST_WINDOW))
+
+
+def pending(kind, recipient_id):
+    return PendingNotification.objects.filter(kind=kind, recipient=recipient_id)
+
+
+def send_digest(kind, recipient_id=None):
+    """Send one email (and push) covering every buffered notification for the recipient."""
+    # Rows stay locked until the digest is out, so a failed send puts them
+    # back for the job's retry and a concurrent digest skips them.
+    with transaction.atomic():
+        notifications = list(
+            pending(kind, recipient_id).select_for_update(skip_locked=True)
+            .select_related('sender').order_by('created_at'))
+        if not notifications:
+            return
+
+        if kind == PendingNotification.FLAGGED_POST:
+            _send_moderator_digest(notifications)
+        else:
+            _send_message_digest(User.objects.get(id=recipient_id), notifications)
+        PendingNotification.objects.filter(
+            id__in=[n.id for n in notifications]).delete()
+
+    # Anything that arrived while the digest was going out starts a new window.
+    if pending(kind, recipient_id).exists():
+        schedule_digest(kind, recipient_id)
+
+
+def _send_message_digest(recipient, notifications):
+    senders = Counter(n.sender.username if n.sender else 'Unknown'
+                      for n in notifications)
+    count = len(notifications)
+    title = (f"{count} new message{'s' if count != 1 else ''} from "
+             f"{len(senders)} {'people' if len(senders) != 1 else 'person'}")
+
+    sends = []
+    if recipient.email_notifications:
+        lines = [f"{username}: {n} message{'s' if n != 1 else ''}"
+                 for username, n in senders.most_common()]
+        sends.append(asend_mail(
+            subject=title,
+            message="You have new private messages.\n\n" + "\n".join(lines),
+            from_email=settings.DEFAULT_FROM_EMAIL,
+            recipient_list=[recipient.email],
+            fail_silently=False,
+        ))
+    if recipient.fcm_token:
+        sends.append(asend_push([recipient.fcm_token], title=title,
+                                body=', '.join(senders), data={'message': title}))
+    async_to_sync(deliver)(*sends)
+
+
+def _send_moderator_digest(notifications):
+    if not settings.MODERATOR_EMAIL:
+        logger.error("Moderator email is not set in settings.")
+        return
+
+    count = len(notifications)
+    minutes = max(round(settings.NOTIFICATION_DIGEST_WINDOW / 60), 1)
+    send_mail(
+        subject=f"{count} post{'s' if count != 1 else ''} flagged in the last {minutes} minutes",
+        message="These posts need review:\n\n" + "\n".join(
+            f"- {n.summary}" for n in notifications),
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[settings.MODERATOR_EMAIL],
+        fail_silently=False,
+    )
@@ -0,0 +1,110 @@
+import base64
+import binascii
+import datetime
+import json
+
+from django.core.exceptions import ValidationError
+from django.db.models import Q
+
+
+class CursorPage:
+    """One page of a ``CursorPaginator``; iterates like a Django ``Page``."""
+
+    def __init__(self, object_list, next_cursor=None, previous_cursor=None):
+        self.object_list = object_list
+        self.next_cursor = next_cursor
+        self.previous_cursor = previous_cursor
+
+    @property
+    def has_next(self):
+        return self.next_cursor is not None
+
+    @property
+    def has_previous(self):
+        return self.previous_cursor is not None
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    def __getitem__(self, index):
+        return self.object_list[index]
+
+
+class CursorPaginator:
+    """
+    Keyset pagination over a queryset, newest first.
+
+    Rows are ordered by ``(field, id)`` descending and each page starts from
+    the position encoded in an opaque cursor, so there is no COUNT query and
+    no OFFSET scan: page 1000 costs the same index range scan as page 1.
+    The queryset's model should have an index ending in ``(field, id)``.
+    """
+
+    def __init__(self, queryset, per_page, field='created_at'):
+        self.queryset = queryset
+        self.per_page = per_page
+        self.field = field
+
+    def get_page(self, cursor=None):
+        """Return the page at ``cursor``; a missing or garbled cursor gives the first page."""
+        direction, position = self.decode(cursor)
+        queryset = self.queryset
+        field = self.field
+
+        if direction == 'prev':
+            if position:
+                value, pk = position
+                queryset = queryset.filter(
+                    Q(**{f'{field}__gt': value}) | Q(**{field: value, 'pk__gt': pk}))
+            queryset = queryset.order_by(field, 'pk')
+        else:
+            if position:
+                value, pk = position
+                queryset = queryset.filter(
+                    Q(**{f'{field}__lt': value}) | Q(**{field: value, 'pk__lt': pk}))
+            queryset = queryset.order_by(f'-{field}', '-pk')
+
+        rows = list(queryset[:self.per_page + 1])
+        has_more = len(rows) > self.per_page
+        rows = rows[:self.per_page]
+
+        if direction == 'prev':
+            rows.reverse()
+            next_cursor = self.encode('next', rows[-1]) if rows else None
+            previous_cursor = self.encode('prev', rows[0]) if has_more else None
+        else:
+            next_cursor = self.encode('next', rows[-1]) if has_more else None
+            previous_cursor = self.encode('prev', rows[0]) if position and rows else None
+        return CursorPage(rows, next_cursor, previous_cursor)
+
+    def encode(self, direction, obj):
+        value = getattr(obj, self.field)
+        # Keep full microsecond precision; DjangoJSONEncoder rounds to milliseconds.
+        if isinstance(value, (datetime.date, datetime.time)):
+            value = value.isoformat()
+        data = json.dumps([direction, value, obj.pk])
+        return base64.urlsafe_b64encode(data.encode()).decode().rstrip('=')
+
+    def field_type(self):
+        """The model field or annotation (such as a search rank) pages are ordered by."""
+        annotation = self.queryset.query.annotations.get(self.field)
+        if annotation is not None:
+            return annotation.output_field
+        return self.queryset.model._meta.get_field(self.field)
+
+    def decode(self, cursor):
+        if not cursor:
+            return 'next', None
+        try:
+            padded = cursor + '=' * (-len(cursor) % 4)
+            direction, value, pk = json.loads(base64.urlsafe_b64decode(padded))
+            value = self.field_type().to_python(value)
+            pk = int(pk)
+        except (binascii.Error, ValueError, TypeError, ValidationError):
+            return 'next', None
+        if direction not in ('next', 'prev') or value is None:
+            return 'next', None
+        return direction, (value, pk)
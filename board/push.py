@@ -0,0 +1,209 @@
+import asyncio
+import logging
+import threading
+import time
+from dataclasses import dataclass, field
+
+import httpx
+import requests
+from asgiref.sync import sync_to_async
+from requests.adapters import HTTPAdapter
+from django.conf import settings
+
+logger = logging.getLogger(__name__)
+
+# The legacy FCM HTTP API accepts at most this many registration_ids per request.
+MAX_TOKENS_PER_REQUEST = 1000
+
+# Per-token errors meaning the token will never work again.
+INVALID_TOKEN_ERRORS = {'NotRegistered', 'InvalidRegistration', 'MismatchSenderId'}
+# Per-token errors worth retrying.
+TRANSIENT_ERRORS = {'Unavailable', 'InternalServerError'}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+class PushError(Exception):
+    """Raised when some tokens could not be reached after all retries."""
+
+
+@dataclass
+class PushResult:
+    sent: int = 0
+    failed: int = 0
+    invalid_tokens: list = field(default_factory=list)
+    # Tokens FCM told us to replace, as {old_token: new_token}.
+    canonical_tokens: dict = field(default_factory=dict)
+    # Tokens still failing with transient errors once retries ran out.
+    unsent_tokens: list = field(default_factory=list)
+
+
+def get_session():
+    """Return the process-wide FCM session, so TLS connections are reused between sends."""
+    global _session
+    if _session is None:
+        with _session_lock:
+            if _session is None:
+                session = requests.Session()
+                adapter = HTTPAdapter(pool_connections=1,
+                                      pool_maxsize=settings.FCM_POOL_SIZE)
+                session.mount('https://', adapter)
+                session.mount('http://', adapter)
+                session.headers.update({
+                    'Content-Type': 'application/json',
+                    'Authorization': f'key={settings.FCM_SERVER_KEY}',
+                })
+                _session = session
+    return _session
+
+
+def send_push(tokens, title, body, data=None):
+    """
+    Send one notification to many devices.
+
+    Tokens are sent in multicast batches over a pooled connection. Transient
+    failures are retried with exponential backoff, and tokens FCM reports as
+    dead or replaced are cleaned off ``User.fcm_token`` so later sends skip them.
+    """
+    tokens = list(dict.fromkeys(token for token in tokens if token))
+    result = PushResult()
+    payload = _payload(title, body, data)
+
+    for start in range(0, len(tokens), MAX_TOKENS_PER_REQUEST):
+        _send_multicast(tokens[start:start + MAX_TOKENS_PER_REQUEST], payload, result)
+
+    _clean_up_tokens(result)
+    return result
+
+
+def async_client():
+    """
+    Return a new FCM client for one ``asend_push`` call. httpx connections
+    belong to the event loop that opened them, and callers like
+    ``async_to_sync`` run each call in a fresh loop, so it is not kept.
+    """
+    return httpx.AsyncClient(
+        headers={'Authorization': f'key={settings.FCM_SERVER_KEY}'},
+        limits=httpx.Limits(max_connections=settings.FCM_POOL_SIZE),
+        timeout=settings.FCM_TIMEOUT,
+    )
+
+
+async def asend_push(tokens, title, body, data=None):
+    """
+    ``send_push`` for async code. Batches go out concurrently over one
+    client, closed when they are done, and waiting on FCM holds no thread.
+    """
+    tokens = list(dict.fromkeys(token for token in tokens if token))
+    result = PushResult()
+    payload = _payload(title, body, data)
+
+    async with async_client() as client:
+        await asyncio.gather(*(
+            _asend_multicast(client, tokens[start:start + MAX_TOKENS_PER_REQUEST],
+                             payload, result)
+            for start in range(0, len(tokens), MAX_TOKENS_PER_REQUEST)
+        ))
+
+    await sync_to_async(_clean_up_tokens)(result)
+    return result
+
+
+def _payload(title, body, data):
+    return {
+        'notification': {'title': title, 'body': body},
+        'data': data or {},
+    }
+
+
+def _send_multicast(tokens, payload, result):
+    pending = tokens
+    for attempt in range(settings.FCM_MAX_RETRIES + 1):
+        if attempt:
+            time.sleep(settings.FCM_RETRY_BACKOFF * 2 ** (attempt - 1))
+
+        try:
+            response = get_session().post(
+                settings.FCM_URL,
+                json={**payload, 'registration_ids': pending},
+                timeout=settings.FCM_TIMEOUT,
+            )
+        except (requests.ConnectionError, requests.Timeout) as e:
+            logger.warning(f"FCM request failed, attempt {attempt + 1}: {e}")
+            continue
+
+        if response.status_code == 429 or response.status_code >= 500:
+            logger.warning(f"FCM returned {response.status_code}, attempt {attempt + 1}")
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                time.sleep(min(int(retry_after), settings.FCM_TIMEOUT))
+            continue
+        # Anything else in the 4xx range is a configuration problem; retrying won't help.
+        response.raise_for_status()
+
+        pending = _record_results(pending, response.json(), result)
+        if not pending:
+            return
+
+    result.failed += len(pending)
+    result.unsent_tokens.extend(pending)
+
+
+async def _asend_multicast(client, tokens, payload, result):
+    pending = tokens
+    for attempt in range(settings.FCM_MAX_RETRIES + 1):
+        if attempt:
+            await asyncio.sleep(settings.FCM_RETRY_BACKOFF * 2 ** (attempt - 1))
+
+        try:
+            response = await client.post(
+                settings.FCM_URL, json={**payload, 'registration_ids': pending})
+        except httpx.TransportError as e:
+            logger.warning(f"FCM request failed, attempt {attempt + 1}: {e}")
+            continue
+
+        if response.status_code == 429 or response.status_code >= 500:
+            logger.warning(f"FCM returned {response.status_code}, attempt {attempt + 1}")
+            retry_after = response.headers.get('Retry-After', '')
+            if retry_after.isdigit():
+                await asyncio.sleep(min(int(retry_after), settings.FCM_TIMEOUT))
+            continue
+        response.raise_for_status()
+
+        pending = _record_results(pending, response.json(), result)
+        if not pending:
+            return
+
+    result.failed += len(pending)
+    result.unsent_tokens.extend(pending)
+
+
+def _record_results(tokens, body, result):
+    """Add one FCM response to ``result`` and return the tokens worth retrying."""
+    retry = []
+    for token, item in zip(tokens, body.get('results', [])):
+        error = item.get('error')
+        if error is None:
+            result.sent += 1
+            if item.get('registration_id'):
+                result.canonical_tokens[token] = item['registration_id']
+        elif error in INVALID_TOKEN_ERRORS:
+            result.invalid_tokens.append(token)
+        elif error in TRANSIENT_ERRORS:
+            retry.append(token)
+        else:
+            logger.error(f"FCM rejected a token: {error}")
+            result.failed += 1
+    return retry
+
+
+def _clean_up_tokens(result):
+    from .models import User
+
+    if result.invalid_tokens:
+        removed = User.objects.filter(fcm_token__in=result.invalid_tokens) \
+            .update(fcm_token=None)
+        logger.info(f"Removed {removed} invalid FCM tokens.")
+    for old_token, new_token in result.canonical_tokens.items():
+        User.objects.filter(fcm_token=old_token).update(fcm_token=new_token)
@@ -0,0 +1,221 @@
+"""
+Full-text search over posts and private messages.
+
+On PostgreSQL each post and message keeps a ``search_vector`` (post titles
+weigh more than content) behind a GIN index, and queries are ranked with
+``ts_rank`` and highlighted with ``ts_headline``. Other databases, such as
+SQLite in development, use ``SearchTerm``: an inverted index of the words
+in each row, ranked by how often the query words appear.
+
+Both are kept up to date from post_save signals, one row at a time;
+``rebuild_search_index`` rebuilds them after bulk changes. Every query word
+must match, as a prefix, and results are cursor-paginated by rank.
+"""
+import re
+from collections import Counter
+
+from django.conf import settings
+from django.contrib.postgres.search import SearchHeadline, SearchQuery, SearchRank, SearchVector
+from django.db import connection, transaction
+from django.db.models import F, OuterRef, Q, Subquery, Sum
+from django.db.models.functions import Coalesce
+from django.utils.html import escape
+from django.utils.safestring import mark_safe
+
+from .models import Post, PrivateMessage, SearchTerm
+from .pagination import CursorPaginator
+
+WORD_RE = re.compile(r'\w+')
+# Splits text into alternating separators and words: ['', 'Hello', ', ', 'world', '!']
+SPLIT_RE = re.compile(r'(\w+)')
+MAX_TERM_LENGTH = 64
+MAX_QUERY_WORDS = 8
+# A title word counts as much as this many content words
+TITLE_WEIGHT = 4
+# Words shown around the first match
+EXCERPT_WORDS = 30
+# Marks matches in ts_headline output until it has been escaped
+START_MARK, STOP_MARK = '\x02', '\x03'
+
+
+def uses_postgres():
+    return connection.vendor == 'postgresql'
+
+
+def words(text):
+    return [word[:MAX_TERM_LENGTH] for word in WORD_RE.findall(text.casefold())]
+
+
+def query_words(query):
+    """The distinct words of a search, in order."""
+    return list(dict.fromkeys(words(query)))[:MAX_QUERY_WORDS]
+
+
+def post_vector():
+    return (SearchVector('title', weight='A', config=settings.SEARCH_CONFIG) +
+            SearchVector('content', weight='B', config=settings.SEARCH_CONFIG))
+
+
+def message_vector():
+    return SearchVector('content', config=settings.SEARCH_CONFIG)
+
+
+def index_post(post):
+    if uses_postgres():
+        Post.objects.filter(id=post.id).update(search_vector=post_vector())
+    else:
+        index_terms(SearchTerm.POST, post.id, [(post.title, TITLE_WEIGHT), (post.content, 1)])
+
+
+def index_message(message):
+    if uses_postgres():
+        PrivateMessage.objects.filter(id=message.id).update(search_vector=message_vector())
+    else:
+        index_terms(SearchTerm.MESSAGE, message.id, [(message.content, 1)])
+
+
+def unindex(kind, object_id):
+    if not uses_postgres():
+        SearchTerm.objects.filter(kind=kind, object_id=object_id).delete()
+
+
+def term_rows(kind, object_id, fields):
+    weights = Counter()
+    for text, weight in fields:
+        for word in words(text):
+            weights[word] += weight
+    return [SearchTerm(kind=kind, object_id=object_id, term=term, weight=weight)
+            for term, weight in weights.items()]
+
+
+def index_terms(kind, object_id, fields):
+    with transaction.atomic():
+        SearchTerm.objects.filter(kind=kind, object_id=object_id).delete()
+        SearchTerm.objects.bulk_create(term_rows(kind, object_id, fields))
+
+
+def rebuild_index(batch_size=1000):
+    """Reindex every post and message. Returns how many rows were indexed."""
+    if uses_postgres():
+        return (Post.objects.update(search_vector=post_vector()) +
+                PrivateMessage.objects.update(search_vector=message_vector()))
+
+    documents = [
+        (SearchTerm.POST, ((row_id, [(title, TITLE_WEIGHT), (content, 1)]) for row_id, title, content in
+                           Post.objects.values_list('id', 'title', 'content').iterator(batch_size))),
+        (SearchTerm.MESSAGE, ((row_id, [(content, 1)]) for row_id, content in
+                              PrivateMessage.objects.values_list('id', 'content').iterator(batch_size))),
+    ]
+    indexed = 0
+    with transaction.atomic():
+        SearchTerm.objects.all().delete()
+        batch = []
+        for kind, rows in documents:
+            for object_id, fields in rows:
+                batch.extend(term_rows(kind, object_id, fields))
+                indexed += 1
+                if len(batch) >= batch_size:
+                    SearchTerm.objects.bulk_create(batch)
+                    batch = []
+        SearchTerm.objects.bulk_create(batch)
+    return indexed
+
+
+def prefix(term):
+    """Match words starting with ``term`` as an index range rather than a LIKE."""
+    return Q(term__gte=term, term__lt=term + '\U0010ffff')
+
+
+def tsquery(terms):
+    # Only \w+ words reach the raw query, so users can't inject operators.
+    return SearchQuery(' & '.join(f'{term}:*' for term in terms),
+                       search_type='raw', config=settings.SEARCH_CONFIG)
+
+
+def match(queryset, kind, terms):
+    """Narrow ``queryset`` to rows containing every term (as a prefix)."""
+    if uses_postgres():
+        return queryset.filter(search_vector=tsquery(terms))
+    for term in terms:
+        queryset = queryset.filter(id__in=SearchTerm.objects.filter(
+            prefix(term), kind=kind).values('object_id'))
+    return queryset
+
+
+def ranked(queryset, kind, terms, headline_field):
+    queryset = match(queryset, kind, terms)
+    if uses_postgres():
+        query = tsquery(terms)
+        return queryset.annotate(
+            rank=SearchRank(F('search_vector'), query),
+            headline=SearchHeadline(
+                headline_field, query, config=settings.SEARCH_CONFIG,
+                start_sel=START_MARK, stop_sel=STOP_MARK,
+                max_words=EXCERPT_WORDS, min_words=EXCERPT_WORDS // 2),
+        )
+    any_term = Q()
+    for term in terms:
+        any_term |= prefix(term)
+    return queryset.annotate(rank=Coalesce(Subquery(
+        SearchTerm.objects.filter(any_term, kind=kind, object_id=OuterRef('id'))
+        .values('object_id').annotate(total=Sum('weight')).values('total')
+    ), 0))
+
+
+def highlight(text, terms):
+    """
+    Escape ``text`` and mark the words starting with any of ``terms``,
+    cut down to ``EXCERPT_WORDS`` words around the first match.
+    """
+    pieces = SPLIT_RE.split(text)
+    terms = tuple(terms)
+    is_match = [i % 2 == 1 and pieces[i].casefold().startswith(terms)
+                for i in range(len(pieces))]
+    first = next((i for i, matched in enumerate(is_match) if matched), 0)
+    # Each word is two pieces, counting the separator before it
+    start = max(first - EXCERPT_WORDS, 0)
+    end = min(start + EXCERPT_WORDS * 2, len(pieces))
+
+    html = ''.join(
+        f'<mark>{escape(pieces[i])}</mark>' if is_match[i] else escape(pieces[i])
+        for i in range(start, end))
+    if start > 0:
+        html = '&hellip;' + html
+    if end < len(pieces):
+        html += '&hellip;'
+    return mark_safe(html)
+
+
+def finish_headline(headline):
+    return mark_safe(escape(headline).replace(START_MARK, '<mark>').replace(STOP_MARK, '</mark>'))
+
+
+def search(queryset, kind, query, cursor, per_page, headline_field='content'):
+    terms = query_words(query)
+    if not terms:
+        return None
+    page = CursorPaginator(
+        ranked(queryset, kind, terms, headline_field), per_page, field='rank'
+    ).get_page(cursor)
+    for row in page:
+        if uses_postgres():
+            row.headline = finish_headline(row.headline)
+        else:
+            row.headline = highlight(getattr(row, headline_field), terms)
+        if kind == SearchTerm.POST:
+            row.title_headline = highlight(row.title, terms)
+    return page
+
+
+def search_posts(query, cursor=None, per_page=10):
+    """Visible posts matching ``query``, best first, or None for an empty query."""
+    return search(Post.objects.filter(is_flagged=False).select_related('author'),
+                  SearchTerm.POST, query, cursor, per_page)
+
+
+def search_messages(user, query, cursor=None, per_page=10):
+    """The private messages ``user`` sent or received that match ``query``."""
+    return search(
+        PrivateMessage.objects.filter(Q(sender=user) | Q(recipient=user))
+        .select_related('sender', 'recipient'),
+        SearchTerm.MESSAGE, query, cursor, per_page)
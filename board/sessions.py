@@ -0,0 +1,45 @@
+"""
+Session engine that keeps sessions in the cache, writes them through to the
+database, and skips the write when nothing has changed.
+
+With ``SESSION_SAVE_EVERY_REQUEST`` the stock engines write the session on
+every request just to push its expiry back. Here an unchanged session is
+only rewritten once ``SESSION_REFRESH_FRACTION`` of ``SESSION_COOKIE_AGE``
+has passed since its last write. The cookie still gets a fresh max-age on
+every response, so the browser enforces the idle timeout. The stored
+expiry gets the same margin on top, so the server copy can't run out
+before the cookie does.
+
+``SESSION_CACHE_ALIAS`` must name a cache every worker shares, or a
+worker can read a stale session.
+"""
+import time
+from datetime import timedelta
+
+from django.conf import settings
+from django.contrib.sessions.backends.cached_db import SessionStore as CachedDBStore
+
+REFRESHED_KEY = '_session_refreshed_at'
+
+
+class SessionStore(CachedDBStore):
+    cache_key_prefix = 'board.sessions'
+
+    def refresh_interval(self):
+        return self.get_session_cookie_age() * settings.SESSION_REFRESH_FRACTION
+
+    def needs_saving(self):
+        if self.modified or self.session_key is None:
+            return True
+        refreshed_at = self._get_session().get(REFRESHED_KEY)
+        return refreshed_at is None or time.time() - refreshed_at >= self.refresh_interval()
+
+    def save(self, must_create=False):
+        if must_create or self.needs_saving():
+            self[REFRESHED_KEY] = int(time.time())
+            super().save(must_create)
+
+    def create_model_instance(self, data):
+        session = super().create_model_instance(data)
+        session.expire_date += timedelta(seconds=self.refresh_interval())
+        return session
@@ -1,7 +1,16 @@
-from django.db.models.signals import post_save
+from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.contrib.auth import get_user_model
-from .models import UserProfile
+from .authentication import forget_user
+from .conditional import POSTS, TODOS, bump_on_commit, habits_stamp, user_stamp
+from .events import MODERATORS, POSTS as POSTS_CHANNEL, publish_on_commit, user_channel
+from .feed_cache import invalidate_author_on_commit, invalidate_post_on_commit
+from .habit_history import invalidate_history_on_commit
+from .models import (BannedWord, Conversation, FamilyToDoItem, Habit, HabitProgress, Post,
+                     PrivateMessage, SearchTerm, UserProfile)
+from .moderation import bump_version_on_commit
+from .search import index_message, index_post, unindex
+from .unread import message_deleted
 
 User = get_user_model()
 
@@ -17,3 +26,121 @@ def save_user_profile(sender, instance, **kwargs):
     # Ensure the profile exists before saving
     if hasattr(instance, 'userprofile'):
         instance.userprofile.save()
+
+
+@receiver(post_save, sender=BannedWord)
+@receiver(post_delete, sender=BannedWord)
+def banned_words_changed(sender, **kwargs):
+    # Publish the new list once the change is committed
+    bump_version_on_commit()
+
+
+@receiver(post_save, sender=Post)
+@receiver(post_delete, sender=Post)
+def post_changed(sender, instance, **kwargs):
+    # Covers edits, deletes, flagging and approval
+    invalidate_post_on_commit(instance.id)
+    bump_on_commit(POSTS)
+
+
+@receiver(post_save, sender=Post)
+def publish_post(sender, instance, created, **kwargs):
+    if instance.is_flagged:
+        publish_on_commit(POSTS_CHANNEL, 'post.removed', {'id': instance.id})
+        if not instance.is_moderated:
+            publish_on_commit(MODERATORS, 'post.flagged',
+                              {'id': instance.id, 'title': instance.title})
+    else:
+        # An approved post reappears just like an edited one
+        publish_on_commit(POSTS_CHANNEL, 'post.created' if created else 'post.updated',
+                          {'id': instance.id, 'title': instance.title})
+
+
+@receiver(post_delete, sender=Post)
+def publish_post_removed(sender, instance, **kwargs):
+    publish_on_commit(POSTS_CHANNEL, 'post.removed', {'id': instance.id})
+
+
+@receiver(post_save, sender=HabitProgress)
+@receiver(post_delete, sender=HabitProgress)
+def habit_progress_changed(sender, instance, **kwargs):
+    invalidate_history_on_commit(instance.habit_id)
+
+
+@receiver(post_save, sender=Habit)
+@receiver(post_delete, sender=Habit)
+def habit_changed(sender, instance, **kwargs):
+    bump_on_commit(habits_stamp(instance.user_id))
+
+
+@receiver(post_save, sender=FamilyToDoItem)
+@receiver(post_delete, sender=FamilyToDoItem)
+def family_todo_changed(sender, instance, **kwargs):
+    bump_on_commit(TODOS)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def user_changed(sender, instance, **kwargs):
+    forget_user(instance.pk)
+    bump_on_commit(user_stamp(instance.pk))
+
+
+@receiver(post_save, sender=User)
+def user_saved_for_feed(sender, instance, created, update_fields=None, **kwargs):
+    # Post cards show the author's name; a login only saves last_login
+    if not created and (update_fields is None or 'username' in update_fields):
+        invalidate_author_on_commit(instance.pk)
+
+
+@receiver(post_save, sender=UserProfile)
+@receiver(post_delete, sender=UserProfile)
+def user_profile_changed(sender, instance, **kwargs):
+    forget_user(instance.user_id)
+    bump_on_commit(user_stamp(instance.user_id))
+
+
+@receiver(post_save, sender=PrivateMessage)
+def publish_message(sender, instance, created, **kwargs):
+    if created:
+        data = {
+            'conversation': instance.conversation_id,
+            'sender': instance.sender.username,
+            'preview': instance.content[:150],
+        }
+        publish_on_commit(user_channel(instance.recipient_id), 'message.created', data)
+        if instance.sender_id != instance.recipient_id:
+            # The sender's other tabs show the conversation too
+            publish_on_commit(user_channel(instance.sender_id), 'message.sent', data)
+
+
+@receiver(post_delete, sender=PrivateMessage)
+def private_message_deleted(sender, instance, **kwargs):
+    message_deleted(instance)
+    # The deleted message may have been the conversation's snapshot
+    conversation = Conversation.objects.filter(id=instance.conversation_id).first()
+    if conversation is not None:
+        conversation.refresh_last_message()
+
+
+@receiver(post_save, sender=Post)
+def post_saved_for_search(sender, instance, update_fields=None, **kwargs):
+    # Saves that only flag or approve a post leave its words alone
+    if update_fields is None or {'title', 'content'} & set(update_fields):
+        index_post(instance)
+
+
+@receiver(post_save, sender=PrivateMessage)
+def message_saved_for_search(sender, instance, update_fields=None, **kwargs):
+    if update_fields is None or 'content' in update_fields:
+        index_message(instance)
+
+
+@receiver(post_delete, sender=Post)
+def post_deleted_for_search(sender, instance, **kwargs):
+    unindex(SearchTerm.POST, instance.id)
+
+
+@receiver(post_delete, sender=PrivateMessage)
+def message_deleted_for_search(sender, instance, **kwargs):
+    unindex(SearchTerm.MESSAGE, instance.id)
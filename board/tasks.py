@@ -0,0 +1,70 @@
+"""Background jobs queued from the views with ``board.jobs.enqueue``."""
+from django.conf import settings
+from django.core.mail import send_mail
+
+from .jobs import PRIORITY_LOW, enqueue, job
+from .models import Post, PrivateMessage
+from .notifications import send_digest
+from .push import PushError, send_push
+from .utils import send_to_moderator
+
+
+@job
+def notify_moderator(post_id, reason=None):
+    post = Post.objects.filter(id=post_id).first()
+    if post is None:
+        return  # Rejected before the email went out
+    send_to_moderator(post, reason=reason)
+
+
+@job
+def send_post_notification(post_id, after_id=0):
+    """
+    Email one batch of users about a new post, then queue the next batch.
+
+    A crash only repeats the batch in flight, never the batches already sent.
+    """
+    post = Post.objects.select_related('author').filter(id=post_id).first()
+    if post is None:
+        return
+    last_id = post.send_creation_notification(after_id=after_id)
+    if last_id is not None:
+        enqueue(send_post_notification, post_id, after_id=last_id,
+                priority=PRIORITY_LOW)
+
+
+@job
+def send_message_email(message_id):
+    message = PrivateMessage.objects.select_related(
+        'sender', 'recipient').filter(id=message_id).first()
+    if message is None or not message.recipient.email_notifications:
+        return
+    send_mail(
+        subject='New Private Message',
+        message=f"You have a new private message from {message.sender.username}.",
+        from_email=settings.DEFAULT_FROM_EMAIL,
+        recipient_list=[message.recipient.email],
+        fail_silently=False,
+    )
+
+
+@job
+def send_message_push(message_id):
+    message = PrivateMessage.objects.select_related(
+        'sender', 'recipient').filter(id=message_id).first()
+    if message is None or not message.recipient.fcm_token:
+        return
+    result = send_push(
+        [message.recipient.fcm_token],
+        title='New Private Message',
+        body=f'You have a new message from {message.sender.username}',
+        data={'message': 'You have a new private message.'},
+    )
+    if result.unsent_tokens:
+        # Let the job queue try again later
+        raise PushError(f"FCM unavailable for message {message_id}")
+
+
+@job
+def send_notification_digest(kind, recipient_id=None):
+    send_digest(kind, recipient_id=recipient_id)
@@ -0,0 +1,1179 @@
+import itertools
+import os
+import re
+import tempfile
+import threading
+import time
+import uuid
+from datetime import timedelta
+from io import StringIO
+from http.server import ThreadingHTTPServer
+from smtplib import SMTPRecipientsRefused
+from unittest import mock, skipUnless
+
+from asgiref.sync import async_to_sync, sync_to_async
+from django.conf import settings
+from django.core import mail
+from django.core.mail.backends import locmem
+from django.core.management import call_command
+from django.core.cache import cache, caches
+from django.db import connection, transaction
+from django.http import QueryDict
+from django.test import RequestFactory, SimpleTestCase, TestCase, TransactionTestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from . import api, events, jobs, moderation, push, views
+from .feed_cache import get_feed_page
+from .habit_history import get_history
+from .habits import get_timezone
+from .insights import habit_insights
+from .jobs import claim_jobs, enqueue, heartbeat, release_stale_jobs, run_job
+from .management.commands.benchmark_push import FCMStubHandler
+from .models import (BannedWord, BannedWordVersion, ConversationMember, FamilyToDoItem, Habit,
+                     HabitProgress, Job, PendingNotification, Post, PrivateMessage, User,
+                     UserProfile)
+from .moderation import BannedWordMatcher, Match
+from .search import search_messages, search_posts
+from .sessions import SessionStore
+from .notifications import buffer_notification
+from .tasks import send_message_email, send_post_notification
+from .authentication import ApprovedUserBackend
+from .throttling import check_shared_cache, hit
+
+
+@jobs.job
+def succeeding_job(*args, **kwargs):
+    pass
+
+
+@jobs.job
+def failing_job():
+    raise RuntimeError('Broken')
+
+
+def not_a_job():
+    pass
+
+
+TASK = 'board.tests.succeeding_job'
+
+
+class EnqueueTests(TestCase):
+    def test_job_is_written_on_commit(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            with transaction.atomic():
+                enqueue(succeeding_job, 1, key='value', priority=5)
+                self.assertFalse(Job.objects.exists())
+
+        job = Job.objects.get()
+        self.assertEqual((job.task, job.args, job.kwargs, job.priority),
+                         (TASK, [1], {'key': 'value'}, 5))
+
+    def test_nothing_is_enqueued_on_rollback(self):
+        with self.captureOnCommitCallbacks(execute=True) as callbacks:
+            try:
+                with transaction.atomic():
+                    enqueue(succeeding_job)
+                    raise RuntimeError('Rolled back')
+            except RuntimeError:
+                pass
+
+        self.assertEqual(callbacks, [])
+        self.assertFalse(Job.objects.exists())
+
+
+class JobTests(TestCase):
+    def test_claim_marks_jobs_running_in_priority_order(self):
+        low = Job.objects.create(task=TASK, priority=-10)
+        high = Job.objects.create(task=TASK, priority=10)
+        Job.objects.create(task=TASK, run_at=timezone.now() + timedelta(hours=1))
+
+        claimed = claim_jobs(5)
+
+        self.assertEqual([job.id for job in claimed], [high.id, low.id])
+        for job in Job.objects.filter(id__in=[low.id, high.id]):
+            self.assertEqual((job.status, job.attempts), (Job.RUNNING, 1))
+            self.assertIsNotNone(job.locked_at)
+        # Running and future jobs can't be claimed
+        self.assertEqual(claim_jobs(5), [])
+
+    def test_success_deletes_the_job(self):
+        Job.objects.create(task=TASK)
+        [job] = claim_jobs(1)
+
+        self.assertTrue(run_job(job))
+        self.assertFalse(Job.objects.exists())
+
+    def test_failure_is_retried_with_backoff(self):
+        Job.objects.create(task='board.tests.failing_job', max_attempts=3)
+        with override_settings(JOB_RETRY_BACKOFF=30), self.assertLogs('board.jobs', 'WARNING'):
+            [job] = claim_jobs(1)
+            self.assertFalse(run_job(job))
+            job.refresh_from_db()
+            first_delay = job.run_at - timezone.now()
+
+            Job.objects.filter(id=job.id).update(run_at=timezone.now())
+            [job] = claim_jobs(1)
+            run_job(job)
+            job.refresh_from_db()
+            second_delay = job.run_at - timezone.now()
+
+        self.assertEqual((job.status, job.attempts), (Job.QUEUED, 2))
+        self.assertIsNone(job.locked_at)
+        self.assertEqual(job.last_error, 'RuntimeError: Broken')
+        self.assertGreater(first_delay, timedelta(seconds=25))
+        self.assertGreater(second_delay, timedelta(seconds=55))
+
+    def test_last_attempt_is_dead_lettered(self):
+        Job.objects.create(task='board.tests.failing_job', max_attempts=1)
+        [job] = claim_jobs(1)
+
+        with self.assertLogs('board.jobs', 'ERROR'):
+            self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertEqual(job.status, Job.DEAD)
+        self.assertEqual(claim_jobs(1), [])
+
+    def test_unregistered_functions_are_not_run(self):
+        Job.objects.create(task='board.tests.not_a_job', max_attempts=1)
+        [job] = claim_jobs(1)
+
+        with self.assertLogs('board.jobs', 'ERROR'):
+            self.assertFalse(run_job(job))
+        job.refresh_from_db()
+        self.assertIn('is not a registered job', job.last_error)
+
+    @override_settings(JOB_LOCK_TIMEOUT=60)
+    def test_stale_jobs_are_released_unless_kept_alive(self):
+        stale = Job.objects.create(task=TASK)
+        alive = Job.objects.create(task=TASK)
+        claim_jobs(2)
+        Job.objects.update(locked_at=timezone.now() - timedelta(seconds=120))
+
+        heartbeat([alive.id])
+
+        with self.assertLogs('board.jobs', 'WARNING'):
+            self.assertEqual(release_stale_jobs(), 1)
+        stale.refresh_from_db()
+        alive.refresh_from_db()
+        self.assertEqual((stale.status, stale.locked_at), (Job.QUEUED, None))
+        self.assertEqual(alive.status, Job.RUNNING)
+
+
+@skipUnless(connection.features.has_select_for_update_skip_locked,
+            'The database does not support SELECT ... SKIP LOCKED')
+class ConcurrentClaimTests(TransactionTestCase):
+    def test_rows_locked_by_another_worker_are_skipped(self):
+        locked = Job.objects.create(task=TASK, priority=10)
+        free = Job.objects.create(task=TASK)
+        holding = threading.Event()
+        done = threading.Event()
+
+        def other_worker():
+            with transaction.atomic():
+                Job.objects.select_for_update().get(id=locked.id)
+                holding.set()
+                done.wait(10)
+            connection.close()
+
+        thread = threading.Thread(target=other_worker)
+        thread.start()
+        try:
+            holding.wait(10)
+            claimed = claim_jobs(2)
+        finally:
+            done.set()
+            thread.join()
+
+        self.assertEqual([job.id for job in claimed], [free.id])
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend')
+class MessageEmailTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user(username='sender', email='sender@example.com')
+        self.recipient = User.objects.create_user(
+            username='recipient', email='recipient@example.com')
+
+    def test_email_is_sent_to_the_recipient(self):
+        message = PrivateMessage.objects.create(
+            sender=self.sender, recipient=self.recipient, content='Hello')
+
+        send_message_email(message.id)
+
+        [email] = mail.outbox
+        self.assertEqual(email.to, ['recipient@example.com'])
+        self.assertIn('sender', email.body)
+
+    def test_recipients_can_opt_out(self):
+        User.objects.filter(id=self.recipient.id).update(email_notifications=False)
+        message = PrivateMessage.objects.create(
+            sender=self.sender, recipient=self.recipient, content='Hello')
+
+        send_message_email(message.id)
+
+        self.assertEqual(mail.outbox, [])
+
+
+@override_settings(EMAIL_BACKEND='django.core.mail.backends.locmem.EmailBackend',
+                   NOTIFICATION_BATCH_SIZE=2)
+class PostNotificationTests(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username='author', email='author@example.com')
+        self.post = Post.objects.create(title='Title', content='Content', author=self.author)
+
+    def send_all_batches(self):
+        """Run ``send_post_notification`` and the batches it queues, returning how many ran."""
+        batches = 0
+        kwargs = {}
+        while True:
+            with self.captureOnCommitCallbacks(execute=True):
+                send_post_notification(self.post.id, **kwargs)
+            batches += 1
+            queued = Job.objects.first()
+            if queued is None:
+                return batches
+            kwargs = queued.kwargs
+            queued.delete()
+
+    def create_readers(self, count):
+        for i in range(count):
+            User.objects.create_user(username=f'reader{i}', email=f'reader{i}@example.com')
+
+    def test_short_last_batch_queues_nothing_more(self):
+        self.create_readers(3)
+
+        self.assertEqual(self.send_all_batches(), 2)
+        self.assertEqual(len(mail.outbox), 3)
+
+    def test_full_last_batch_checks_once_more(self):
+        self.create_readers(4)
+
+        self.assertEqual(self.send_all_batches(), 3)
+        self.assertEqual(len(mail.outbox), 4)
+
+    def test_refused_recipient_is_skipped(self):
+        self.create_readers(5)
+        send_messages = locmem.EmailBackend.send_messages
+
+        def refuse_reader1(backend, messages):
+            if messages[0].to == ['reader1@example.com']:
+                raise SMTPRecipientsRefused({'reader1@example.com': (550, b'No such user')})
+            return send_messages(backend, messages)
+
+        with mock.patch.object(locmem.EmailBackend, 'send_messages',
+                               autospec=True, side_effect=refuse_reader1):
+            with self.assertLogs('board.models', 'WARNING'):
+                self.assertEqual(self.send_all_batches(), 3)
+
+        self.assertEqual([message.to[0] for message in mail.outbox],
+                         ['reader0@example.com', 'reader2@example.com', 'reader3@example.com',
+                          'reader4@example.com'])
+
+
+class DigestSchedulingTests(TestCase):
+    def setUp(self):
+        self.recipient = User.objects.create_user(
+            username='recipient', email='recipient@example.com')
+
+    def buffer(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            buffer_notification(PendingNotification.MESSAGE, recipient=self.recipient,
+                                summary='From sender')
+
+    def test_one_digest_is_queued_per_recipient(self):
+        other = User.objects.create_user(username='other', email='other@example.com')
+        self.buffer()
+        self.buffer()
+        with self.captureOnCommitCallbacks(execute=True):
+            buffer_notification(PendingNotification.MESSAGE, recipient=other)
+
+        self.assertEqual(
+            sorted(job.kwargs['recipient_id'] for job in Job.objects.all()),
+            [self.recipient.id, other.id])
+
+    def test_dead_digest_does_not_strand_notifications(self):
+        self.buffer()
+        Job.objects.update(status=Job.DEAD)
+
+        self.buffer()
+
+        self.assertEqual(Job.objects.filter(status=Job.QUEUED).count(), 1)
+
+
+@override_settings(FEED_CACHE=True)
+class FeedCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.author = User.objects.create_user(username='author', email='author@example.com')
+        with self.captureOnCommitCallbacks(execute=True):
+            self.post = Post.objects.create(title='Before', content='Content', author=self.author)
+
+    def feed_html(self):
+        return ''.join(card['html'] for card in get_feed_page())
+
+    def test_edits_are_shown_once_committed(self):
+        self.assertIn('Before', self.feed_html())
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            self.post.title = 'After'
+            self.post.save()
+            # Caching the feed now must not outlive the commit
+            self.assertIn('Before', self.feed_html())
+        for callback in callbacks:
+            callback()
+
+        self.assertIn('After', self.feed_html())
+
+    def test_renaming_the_author_redraws_their_cards(self):
+        self.assertIn('Posted by author', self.feed_html())
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.username = 'renamed'
+            self.author.save()
+
+        self.assertIn('Posted by renamed', self.feed_html())
+
+    def test_logging_in_keeps_the_cards(self):
+        self.feed_html()
+
+        with self.captureOnCommitCallbacks(execute=True):
+            self.author.last_login = timezone.now()
+            self.author.save(update_fields=['last_login'])
+
+        with self.assertNumQueries(0):
+            self.feed_html()
+
+    @override_settings(FEED_CACHE=False)
+    def test_feed_is_read_afresh_without_a_shared_cache(self):
+        self.assertIn('Before', self.feed_html())
+
+        Post.objects.filter(id=self.post.id).update(title='After')
+
+        self.assertIn('After', self.feed_html())
+
+
+@override_settings(HABIT_HISTORY_CACHE=True)
+class HabitHistoryCacheTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        user = User.objects.create_user(username='walker', email='walker@example.com')
+        self.habit = Habit.objects.create(user=user, name='Walk', target_count=2)
+        self.today = timezone.localdate()
+
+    def total(self):
+        return get_history(self.habit, self.today, self.today)['summary']['total']
+
+    def test_progress_is_shown_once_committed(self):
+        self.assertEqual(self.total(), 0)
+
+        with self.captureOnCommitCallbacks() as callbacks:
+            HabitProgress.objects.create(habit=self.habit, count=1)
+            self.assertEqual(self.total(), 0)
+        for callback in callbacks:
+            callback()
+
+        self.assertEqual(self.total(), 1)
+
+    @override_settings(HABIT_HISTORY_CACHE=False)
+    def test_history_is_built_afresh_without_a_shared_cache(self):
+        self.assertEqual(self.total(), 0)
+
+        HabitProgress.objects.bulk_create([HabitProgress(habit=self.habit, count=1)])
+
+        self.assertEqual(self.total(), 1)
+
+
+class PushTests(TestCase):
+    @classmethod
+    def setUpClass(cls):
+        super().setUpClass()
+        cls.server = ThreadingHTTPServer(('127.0.0.1', 0), FCMStubHandler)
+        threading.Thread(target=cls.server.serve_forever, daemon=True).start()
+        cls.addClassCleanup(cls.server.server_close)
+        cls.addClassCleanup(cls.server.shutdown)
+
+    def setUp(self):
+        url = f'http://127.0.0.1:{self.server.server_address[1]}/fcm/send'
+        self.enterContext(override_settings(FCM_URL=url, FCM_SERVER_KEY='test'))
+        # Sessions carry the server key, so don't reuse one from another test
+        push._session = None
+        self.addCleanup(setattr, push, '_session', None)
+
+    def test_dead_tokens_are_removed(self):
+        User.objects.create(username='live', email='live@example.com', fcm_token='live-1')
+        dead = User.objects.create(username='dead', email='dead@example.com', fcm_token='dead-1')
+
+        result = push.send_push(['live-1', 'dead-1', 'live-1'], title='Title', body='Body')
+
+        self.assertEqual((result.sent, result.invalid_tokens), (1, ['dead-1']))
+        dead.refresh_from_db()
+        self.assertIsNone(dead.fcm_token)
+
+    def test_tokens_are_sent_in_batches(self):
+        tokens = [f'token-{i}' for i in range(push.MAX_TOKENS_PER_REQUEST + 1)]
+
+        result = push.send_push(tokens, title='Title', body='Body')
+
+        self.assertEqual((result.sent, result.failed), (len(tokens), 0))
+
+    def test_async_sends_close_their_client(self):
+        clients = []
+        make_client = push.async_client
+
+        def async_client():
+            clients.append(make_client())
+            return clients[-1]
+
+        tokens = [f'token-{i}' for i in range(push.MAX_TOKENS_PER_REQUEST + 1)]
+        with mock.patch.object(push, 'async_client', async_client):
+            # Each async_to_sync call runs in a new event loop, as in a job
+            for _ in range(2):
+                result = async_to_sync(push.asend_push)(tokens, title='Title', body='Body')
+                self.assertEqual(result.sent, len(tokens))
+
+        self.assertEqual(len(clients), 2)
+        self.assertTrue(all(client.is_closed for client in clients))
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Query plans are only checked on PostgreSQL')
+@override_settings(FEED_CACHE=False, CONDITIONAL_PAGES=False)
+class QueryPlanTests(TestCase):
+    """
+    EXPLAIN every query the busiest pages run and fail if one reads a whole
+    table. Sequential scans are turned off, as on tables this small the
+    planner would rightly prefer them; a query that still uses one has no
+    index it could use.
+    """
+    TABLES = {model._meta.db_table for model in (
+        Post, PrivateMessage, ConversationMember, Habit, HabitProgress, FamilyToDoItem)}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create(username='reader', email='reader@example.com',
+                                       is_staff=True)
+        other = User.objects.create_user(username='writer', email='writer@example.com')
+        Post.objects.bulk_create([
+            Post(title=f'Post {i}', content='Content', author=(cls.user, other)[i % 2],
+                 is_flagged=i % 4 == 0)
+            for i in range(20)
+        ])
+        for sender, recipient in [(other, cls.user), (cls.user, other), (other, cls.user)]:
+            cls.message = PrivateMessage.objects.create(
+                sender=sender, recipient=recipient, content='Hello')
+        habit = Habit.objects.create(user=cls.user, name='Walk')
+        HabitProgress.objects.create(habit=habit, count=1)
+        FamilyToDoItem.objects.create(
+            task_name='Dishes', due_date=timezone.localdate(), assigned_to=cls.user)
+        FamilyToDoItem.objects.create(task_name='Bins', due_date=timezone.localdate())
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        with connection.cursor() as cursor:
+            cursor.execute('SET LOCAL enable_seqscan = off')
+
+    def assert_uses_indexes(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        for query in queries:
+            if not query['sql'].startswith('SELECT'):
+                continue
+            with connection.cursor() as cursor:
+                cursor.execute(f"EXPLAIN {query['sql']}")
+                plan = '\n'.join(row[0] for row in cursor.fetchall())
+            scanned = set(re.findall(r'Seq Scan on (\w+)', plan)) & self.TABLES
+            self.assertFalse(scanned, f"{url} scans {', '.join(scanned)}:\n{query['sql']}\n{plan}")
+        return response
+
+    def test_message_board(self):
+        response = self.assert_uses_indexes(reverse('board:message_board'))
+        cursor = response.context['page_obj'].next_cursor
+        self.assert_uses_indexes(f"{reverse('board:message_board')}?cursor={cursor}")
+
+    def test_moderate_posts(self):
+        self.assert_uses_indexes(reverse('board:moderate_posts'))
+
+    def test_profile_sections(self):
+        for name in ('profile_posts', 'profile_messages', 'profile_habits'):
+            with self.subTest(name):
+                self.assert_uses_indexes(reverse(f'board:{name}', args=[self.user.username]))
+
+    def test_private_messages(self):
+        self.assert_uses_indexes(reverse('board:private_messages'))
+        self.assert_uses_indexes(
+            reverse('board:conversation', args=[self.message.conversation_id]))
+
+    def test_habits(self):
+        self.assert_uses_indexes(reverse('board:habit_tracker'))
+        self.assert_uses_indexes(reverse('board:habit_insights'))
+
+    def test_family_todo_list(self):
+        self.assert_uses_indexes(reverse('board:family_todo_list'))
+
+
+def seed_habits(user, count):
+    habits = Habit.objects.bulk_create([
+        Habit(user=user, name=f'Habit {i}', target_count=3,
+              reset_at=timezone.now() + timedelta(hours=1))
+        for i in range(count)
+    ])
+    HabitProgress.objects.bulk_create([
+        HabitProgress(habit=habit, count=n + 1)
+        for habit in habits for n in range(3)
+    ])
+
+
+def seed_profile(user, count):
+    User.objects.filter(id=user.id).update(is_staff=True)
+    sender = User.objects.create_user(
+        username=f'{user.username}-sender', email=f'sender-{user.email}')
+    Post.objects.bulk_create([
+        Post(title=f'Post {i}', content='Seed', author=user, is_flagged=i % 2 == 0)
+        for i in range(count)
+    ])
+    PrivateMessage.objects.bulk_create([
+        PrivateMessage(sender=sender, recipient=user, content='Seed')
+        for i in range(count)
+    ])
+    seed_habits(user, count)
+
+
+def own_profile(view):
+    return lambda request: view(request, request.user.username)
+
+
+def seed_conversations(user, count):
+    # Saved one by one, since bulk_create would skip filing them into
+    # conversations. The last conversation, which is the latest, gets
+    # ``count`` messages.
+    for i in range(count):
+        other = User.objects.create_user(
+            username=f'{user.username}-{i}', email=f'{i}-{user.email}')
+        for n in range(count if i == count - 1 else 1):
+            sender, recipient = (other, user) if n % 2 == 0 else (user, other)
+            PrivateMessage.objects.create(sender=sender, recipient=recipient, content='Seed')
+
+
+def latest_conversation(view):
+    def call(request):
+        member = ConversationMember.objects.filter(user=request.user).first()
+        return view(request, member.conversation_id)
+    return call
+
+
+def seed_search(user, count):
+    # Saved one by one so the signals index them
+    for i in range(count):
+        Post.objects.create(title=f'Seed {i}', content='Seeded post', author=user)
+    seed_conversations(user, count)
+
+
+def searching(view, **params):
+    def call(request):
+        request.GET = QueryDict(mutable=True)
+        request.GET.update(params)
+        return view(request)
+    return call
+
+
+def seed_todos(user, count):
+    FamilyToDoItem.objects.bulk_create([
+        FamilyToDoItem(task_name=f'Task {i}', due_date=timezone.localdate(),
+                       assigned_to=user if i % 2 else None)
+        for i in range(count)
+    ])
+
+
+class QueryCountTests(TestCase):
+    """Each view makes a fixed number of queries, however many rows it shows."""
+
+    def setUp(self):
+        self.user_numbers = itertools.count()
+
+    def request_as(self, user, **headers):
+        request = RequestFactory().get('/', headers=headers)
+        # As ApprovedUserBackend loads it for a real request
+        request.user = User.objects.select_related('userprofile').get(id=user.id)
+        return request
+
+    def assert_queries(self, budget, seed, view):
+        for size in (1, 20):
+            with self.subTest(size=size):
+                number = next(self.user_numbers)
+                user = User.objects.create_user(
+                    username=f'budget-{number}', email=f'budget-{number}@example.com')
+                seed(user, size)
+                request = self.request_as(user)
+                with self.assertNumQueries(budget):
+                    view(request)
+
+    def test_habit_tracker(self):
+        self.assert_queries(1, seed_habits, views.habit_tracker)
+
+    def test_habit_insights(self):
+        self.assert_queries(1, seed_habits, views.habit_insights)
+        self.assert_queries(1, seed_habits, views.habit_insights_json)
+
+    def test_profile(self):
+        self.assert_queries(2, seed_profile, own_profile(views.profile))
+
+    def test_profile_sections(self):
+        self.assert_queries(2, seed_profile, own_profile(views.profile_posts))
+        self.assert_queries(1, seed_profile, own_profile(views.profile_messages))
+        self.assert_queries(2, seed_profile, own_profile(views.profile_habits))
+        self.assert_queries(1, seed_profile, own_profile(views.profile_flagged_posts))
+
+    @override_settings(SESSION_ENGINE='board.sessions')
+    def test_user_and_profile_are_loaded_once(self):
+        user = User.objects.create_user(username='member', email='member@example.com')
+        self.client.force_login(user)
+        url = reverse('board:profile_settings', args=[user.username])
+
+        counts = []
+        for _ in range(2):
+            with CaptureQueriesContext(connection) as queries:
+                self.client.get(url)
+            counts.append(sum(1 for query in queries
+                              if re.search(r'FROM "board_user(profile)?"', query['sql'])))
+
+        # Joined in one query, then served from the per-process cache
+        self.assertEqual(counts, [1, 0])
+
+    def test_private_messages(self):
+        self.assert_queries(1, seed_conversations, views.PrivateMessageView.as_view())
+
+    def test_conversation(self):
+        # Finding the conversation costs one query of its own. Opening it
+        # marks the seeded messages read: one UPDATE for the messages and
+        # one per counter, in a transaction.
+        self.assert_queries(8, seed_conversations, latest_conversation(views.conversation_detail))
+
+    def test_search(self):
+        self.assert_queries(1, seed_search, searching(views.search, q='seed'))
+        self.assert_queries(1, seed_search,
+                            searching(views.search, q='seed', scope='messages'))
+
+    def test_api_lists(self):
+        for seed, view in [(seed_profile, api.posts), (seed_conversations, api.messages),
+                           (seed_habits, api.habits), (seed_todos, api.todos)]:
+            with self.subTest(view.__name__):
+                self.assert_queries(1, seed, view)
+
+    def test_api_revalidation_is_answered_with_304(self):
+        for seed, view in [(seed_profile, api.posts), (seed_conversations, api.messages),
+                           (seed_habits, api.habits), (seed_todos, api.todos)]:
+            with self.subTest(view.__name__):
+                user = User.objects.create_user(
+                    username=view.__name__, email=f'{view.__name__}@example.com')
+                seed(user, 20)
+                etag = view(self.request_as(user))['ETag']
+                request = self.request_as(user, if_none_match=etag)
+                with self.assertNumQueries(1):
+                    response = view(request)
+                self.assertEqual(response.status_code, 304)
+
+
+class HabitIncrementTests(TestCase):
+    def setUp(self):
+        user = User.objects.create_user(username='walker', email='walker@example.com')
+        self.habit = Habit.objects.create(user=user, name='Walk', target_count=2)
+
+    def test_clicks_past_the_target_are_not_counted(self):
+        self.assertEqual([self.habit.increment_count() for _ in range(3)],
+                         [True, True, False])
+        self.assertEqual(self.habit.current_count, 2)
+        self.assertTrue(self.habit.completed)
+
+    def test_a_retried_click_counts_once(self):
+        key = uuid.uuid4().hex
+
+        self.assertEqual([self.habit.increment_count(idempotency_key=key) for _ in range(2)],
+                         [True, False])
+        self.assertEqual(self.habit.progress.count(), 1)
+
+    def test_pages_leave_keys_to_the_browser(self):
+        self.client.force_login(self.habit.user)
+        html = self.client.get(reverse('board:habit_tracker')).content.decode()
+        self.assertIn('<input type="hidden" name="idempotency_key">', html)
+
+        # Without JavaScript the form posts an empty key, and every click counts
+        url = reverse('board:increment_habit', args=[self.habit.id])
+        for _ in range(2):
+            self.client.post(url, {'idempotency_key': ''})
+        self.habit.refresh_from_db()
+        self.assertEqual(self.habit.current_count, 2)
+
+
+# A day ahead of the user below, whatever the time
+@override_settings(TIME_ZONE='Pacific/Kiritimati')
+class HabitInsightTests(TestCase):
+    def test_days_start_in_the_users_time_zone(self):
+        user = User.objects.create_user(username='walker', email='walker@example.com')
+        user.userprofile.timezone = 'Etc/GMT+12'
+        user.userprofile.save()
+        habit = Habit.objects.create(user=user, name='Walk', target_count=2)
+        habit.increment_count()
+        today = timezone.localdate(timezone=get_timezone('Etc/GMT+12'))
+        self.assertEqual(habit.progress.get().date, today)
+
+        [insight] = habit_insights(user)
+
+        self.assertEqual(insight['daily_progress'], 1)
+        self.assertEqual(insight['daily_progress_percentage'], 50)
+
+
+@skipUnless(connection.features.has_select_for_update,
+            'Concurrent increments need a database with row locking')
+class ConcurrentHabitIncrementTests(TransactionTestCase):
+    THREADS = 8
+    CLICKS = 5
+
+    def setUp(self):
+        self.user = User.objects.create_user(username='walker', email='walker@example.com')
+
+    def hammer(self, habit, key=None):
+        start = threading.Barrier(self.THREADS)
+        errors = []
+
+        def click_away():
+            try:
+                own = Habit.objects.get(id=habit.id)
+                start.wait()
+                for _ in range(self.CLICKS):
+                    own.increment_count(idempotency_key=key)
+            except Exception as e:
+                errors.append(e)
+            finally:
+                connection.close()
+
+        workers = [threading.Thread(target=click_away) for _ in range(self.THREADS)]
+        for worker in workers:
+            worker.start()
+        for worker in workers:
+            worker.join()
+        self.assertEqual(errors, [])
+        habit.refresh_from_db()
+        return habit.current_count, habit.progress.count()
+
+    def test_no_click_is_lost(self):
+        clicks = self.THREADS * self.CLICKS
+        habit = Habit.objects.create(user=self.user, name='Walk', target_count=clicks + 1)
+        self.assertEqual(self.hammer(habit), (clicks, clicks))
+
+    def test_clicks_stop_at_the_target(self):
+        habit = Habit.objects.create(user=self.user, name='Walk', target_count=self.CLICKS)
+        self.assertEqual(self.hammer(habit), (self.CLICKS, self.CLICKS))
+
+    def test_one_key_counts_once(self):
+        habit = Habit.objects.create(user=self.user, name='Walk', target_count=100)
+        self.assertEqual(self.hammer(habit, key=uuid.uuid4().hex), (1, 1))
+
+
+# Sessions in cookies, as with a shared cache they cost no query either
+@override_settings(CONDITIONAL_PAGES=True,
+                   SESSION_ENGINE='django.contrib.sessions.backends.signed_cookies')
+class ConditionalPageTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username='member', email='member@example.com')
+
+    def change(self, action):
+        with self.captureOnCommitCallbacks(execute=True):
+            action()
+
+    def test_anonymous_welcome_is_shared(self):
+        url = reverse('board:welcome')
+        first = self.client.get(url)
+        reload = self.client.get(url, headers={'if-none-match': first['ETag']})
+
+        self.assertEqual(first.status_code, 200)
+        self.assertIn('public', first['Cache-Control'])
+        self.assertIn('Cookie', first['Vary'])
+        self.assertFalse(first.cookies)
+        self.assertEqual(reload.status_code, 304)
+
+    def test_unchanged_pages_are_not_rendered_again(self):
+        self.client.force_login(self.user)
+        # Sets the CSRF cookie, which a signed-in browser already has
+        self.client.get(reverse('board:welcome'))
+        pages = [
+            ('welcome', lambda: self.user.userprofile.save()),
+            ('message_board', lambda: Post.objects.create(
+                title='New', content='Post', author=self.user, is_moderated=True)),
+            ('family_todo_list', lambda: FamilyToDoItem.objects.create(
+                task_name='New', due_date=timezone.localdate(), assigned_to=self.user)),
+            ('habit_tracker', lambda: Habit.objects.create(user=self.user, name='New')),
+        ]
+        for name, action in pages:
+            with self.subTest(name):
+                url = reverse(f'board:{name}')
+                etag = self.client.get(url)['ETag']
+
+                # Answered before the view runs
+                with self.assertNumQueries(0):
+                    reload = self.client.get(url, headers={'if-none-match': etag})
+                self.assertEqual(reload.status_code, 304)
+                self.assertIn('private', reload['Cache-Control'])
+
+                self.change(action)
+                changed = self.client.get(url, headers={'if-none-match': etag})
+                self.assertEqual(changed.status_code, 200)
+
+
+class ThrottleCacheTests(TestCase):
+    @override_settings(DEBUG=False, THROTTLE_CACHE_ALIAS='default', CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}})
+    def test_per_process_cache_is_reported(self):
+        with self.assertLogs('board.throttling', 'ERROR'):
+            self.assertFalse(check_shared_cache())
+
+    @override_settings(DEBUG=False, THROTTLE_CACHE_ALIAS='default', CACHES={
+        'default': {'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+                    'LOCATION': 'redis://localhost:6379'}})
+    def test_shared_cache_passes(self):
+        self.assertTrue(check_shared_cache())
+
+
+@override_settings(THROTTLE_RATES={'login.ip': '10/m', 'login.username': '2/m'})
+class ThrottleTests(TestCase):
+    def setUp(self):
+        caches[settings.THROTTLE_CACHE_ALIAS].clear()
+        User.objects.create_user(username='member', email='member@example.com', password='secret')
+
+    def log_in(self, password='wrong'):
+        return self.client.post(reverse('board:login'),
+                                {'username': 'member', 'password': password})
+
+    def test_logins_over_the_limit_get_a_429(self):
+        self.assertEqual([self.log_in().status_code for _ in range(2)], [200, 200])
+
+        response = self.log_in()
+
+        self.assertEqual(response.status_code, 429)
+        self.assertIn(int(response['Retry-After']), range(1, 61))
+
+    def test_throttled_logins_are_not_checked(self):
+        for _ in range(2):
+            self.log_in()
+
+        with mock.patch.object(ApprovedUserBackend, 'authenticate', autospec=True) as authenticate:
+            # Even the right password is turned away without a password check
+            self.assertEqual(self.log_in('secret').status_code, 429)
+        authenticate.assert_not_called()
+
+    def test_window_slides(self):
+        start = 60 * 1000
+
+        def hits(at, count):
+            with mock.patch('board.throttling.time.time', return_value=start + at):
+                return [hit('login', 'username', 'member', '2/m') for _ in range(count)]
+
+        self.assertEqual(hits(0, 3), [0, 0, 60])
+        # Three quarters of the way into the next minute, a quarter of the
+        # three requests above still counts.
+        self.assertEqual(hits(105, 2), [0, 15])
+        # In the third minute only the second one's requests are weighed
+        self.assertEqual(hits(150, 1), [0])
+
+
+class ConversationReplyTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user(username='sender', email='sender@example.com')
+        recipient = User.objects.create_user(username='recipient', email='recipient@example.com')
+        self.message = PrivateMessage.objects.create(
+            sender=recipient, recipient=self.sender, content='Hello')
+        self.client.force_login(self.sender)
+
+    def url(self):
+        return reverse('board:conversation', args=[self.message.conversation_id])
+
+    def test_reply_is_filed_under_the_conversation(self):
+        response = self.client.post(self.url(), {'content': 'Hi back'})
+
+        self.assertRedirects(response, self.url())
+        reply = PrivateMessage.objects.latest('id')
+        self.assertEqual((reply.content, reply.conversation_id),
+                         ('Hi back', self.message.conversation_id))
+
+    def test_reply_is_not_saved_if_notifying_fails(self):
+        with mock.patch('board.views.notify_new_message', side_effect=RuntimeError), \
+                self.assertRaises(RuntimeError):
+            self.client.post(self.url(), {'content': 'Hi back'})
+
+        self.assertFalse(PrivateMessage.objects.filter(content='Hi back').exists())
+
+
+class UnreadCountTests(TestCase):
+    def setUp(self):
+        self.sender = User.objects.create_user(username='sender', email='sender@example.com')
+        self.recipient = User.objects.create_user(
+            username='recipient', email='recipient@example.com')
+
+    def send(self, count):
+        for _ in range(count):
+            message = PrivateMessage.objects.create(
+                sender=self.sender, recipient=self.recipient, content='Hello')
+        return message.conversation_id
+
+    def unread(self):
+        """The recipient's counter for the conversation and their total."""
+        member = ConversationMember.objects.get(user=self.recipient)
+        self.recipient.userprofile.refresh_from_db()
+        return member.unread_count, self.recipient.userprofile.unread_messages
+
+    def test_arriving_messages_are_counted(self):
+        self.send(2)
+        self.assertEqual(self.unread(), (2, 2))
+
+    def test_opening_the_conversation_resets_the_counter(self):
+        conversation_id = self.send(2)
+        self.client.force_login(self.recipient)
+
+        self.client.get(reverse('board:conversation', args=[conversation_id]))
+
+        self.assertEqual(self.unread(), (0, 0))
+        self.assertFalse(PrivateMessage.objects.filter(read_at__isnull=True).exists())
+
+    def test_reconcile_corrects_drifted_counters(self):
+        self.send(2)
+        ConversationMember.objects.filter(user=self.recipient).update(unread_count=5)
+        UserProfile.objects.filter(user=self.recipient).update(unread_messages=0)
+
+        with self.assertLogs('board.unread', 'WARNING'):
+            call_command('reconcile_unread', stdout=StringIO())
+
+        self.assertEqual(self.unread(), (2, 2))
+
+
+class BannedWordMatcherTests(SimpleTestCase):
+    def test_whole_words_only(self):
+        matcher = BannedWordMatcher(['ass'])
+        self.assertIsNone(matcher.search('a classy assessment'))
+        self.assertEqual(matcher.search('you ass!'), Match('ass', 4, 7))
+
+    def test_substrings_when_whole_words_is_off(self):
+        matcher = BannedWordMatcher(['ass'], whole_words=False)
+        self.assertEqual(matcher.find_all('a classy assessment'),
+                         [Match('ass', 4, 7), Match('ass', 9, 12)])
+
+    def test_offsets_point_into_the_original_text(self):
+        matcher = BannedWordMatcher(['shit', 'ass'])
+        # The "ﬁ" ligature folds to two characters, shifting everything after it.
+        text = 'Ｓhït, ﬁne ass'
+        self.assertEqual(matcher.find_all(text), [Match('shit', 0, 4), Match('ass', 10, 13)])
+        self.assertEqual(text[10:13], 'ass')
+
+    def test_leetspeak_and_confusables_in_the_text(self):
+        matcher = BannedWordMatcher(['ass', 'shit'])
+        self.assertEqual(matcher.find_all('a$$ 5h1t аss'),
+                         [Match('ass', 0, 3), Match('shit', 4, 8), Match('ass', 9, 12)])
+
+    def test_obfuscated_entries_are_matched_as_written(self):
+        matcher = BannedWordMatcher(['a54', 'he11'])
+        self.assertIsNone(matcher.search('Asa is here, what the heii'))
+        self.assertEqual(matcher.find_all('A54 and HE11'),
+                         [Match('a54', 0, 3), Match('he11', 8, 12)])
+
+    def test_plain_spelling_is_reported(self):
+        matcher = BannedWordMatcher(['a$$', 'ass'])
+        self.assertEqual(len(matcher), 1)
+        self.assertEqual(matcher.find_all('a$$'), [Match('ass', 0, 3)])
+
+
+class BannedWordVersionTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        moderation._matcher = None
+
+    def test_adding_a_word_rebuilds_the_matcher(self):
+        matcher = moderation.get_banned_word_matcher()
+        self.assertIs(moderation.get_banned_word_matcher(), matcher)
+        self.assertIsNone(matcher.search('zorgle off'))
+
+        version = moderation.current_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            BannedWord.objects.create(word='zorgle')
+        self.assertGreater(moderation.current_version(), version)
+        rebuilt = moderation.get_banned_word_matcher()
+        self.assertIsNot(rebuilt, matcher)
+        self.assertEqual(rebuilt.search('zorgle off'), Match('zorgle', 0, 6))
+
+    def test_removing_a_word_rebuilds_the_matcher(self):
+        # bulk_create sends no signals, so no bump is left waiting on the commit
+        word, = BannedWord.objects.bulk_create([BannedWord(word='zorgle')])
+        matcher = moderation.get_banned_word_matcher()
+        self.assertIsNotNone(matcher.search('zorgle off'))
+
+        version = moderation.current_version()
+        with self.captureOnCommitCallbacks(execute=True):
+            word.delete()
+        self.assertGreater(moderation.current_version(), version)
+        rebuilt = moderation.get_banned_word_matcher()
+        self.assertIsNot(rebuilt, matcher)
+        self.assertIsNone(rebuilt.search('zorgle off'))
+
+    def test_bulk_delete_bumps_once(self):
+        BannedWord.objects.bulk_create(BannedWord(word=word) for word in ['zorgle', 'blarg', 'fnord'])
+        versions = BannedWordVersion.objects.count()
+        with self.captureOnCommitCallbacks(execute=True):
+            BannedWord.objects.all().delete()
+        self.assertEqual(BannedWordVersion.objects.count(), versions + 1)
+
+
+class RemoderatePostsTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        moderation._matcher = None
+        BannedWord.objects.bulk_create([BannedWord(word='zorgle')])
+        self.posts = Post.objects.bulk_create(
+            Post(title=f'Post {number}', content='you zorgle' if number % 2 else 'hello')
+            for number in range(6))
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.checkpoint = os.path.join(directory.name, 'checkpoint')
+
+    def remoderate(self, **options):
+        stdout = StringIO()
+        call_command('remoderate_posts', workers=1, batch_size=2,
+                     checkpoint=self.checkpoint, stdout=stdout, **options)
+        return stdout.getvalue()
+
+    def flagged(self):
+        return list(Post.objects.filter(is_flagged=True).values_list('title', flat=True).order_by('id'))
+
+    def test_dry_run_writes_nothing(self):
+        output = self.remoderate(dry_run=True)
+        self.assertIn('Would flag 3.', output)
+        self.assertEqual(self.flagged(), [])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_flags_posts_and_records_the_checkpoint(self):
+        output = self.remoderate()
+        self.assertIn('Flagged 3.', output)
+        self.assertEqual(self.flagged(), ['Post 1', 'Post 3', 'Post 5'])
+        with open(self.checkpoint) as file:
+            self.assertEqual(int(file.read()), self.posts[-1].id)
+
+    def test_resumes_after_the_checkpoint(self):
+        with open(self.checkpoint, 'w') as file:
+            file.write(str(self.posts[3].id))
+
+        output = self.remoderate()
+        self.assertIn(f'Resuming after post {self.posts[3].id}', output)
+        self.assertIn('Scanned 2 posts', output)
+        self.assertEqual(self.flagged(), ['Post 5'])
+
+
+class SessionStoreTests(TestCase):
+    def setUp(self):
+        store = SessionStore()
+        store['colour'] = 'blue'
+        store.save()
+        self.session_key = store.session_key
+
+    def save_session(self, change=None):
+        """Load the session as a new request would, save it, and return the writes it made."""
+        store = SessionStore(self.session_key)
+        self.assertEqual(store['colour'], 'blue')
+        if change:
+            change(store)
+        with CaptureQueriesContext(connection) as queries:
+            store.save()
+        return [query['sql'] for query in queries
+                if re.match(r'(INSERT|UPDATE)\b', query['sql'])]
+
+    def test_unchanged_session_is_not_written(self):
+        self.assertEqual(self.save_session(), [])
+
+    def test_changed_session_is_written(self):
+        self.assertEqual(len(self.save_session(lambda store: store.update({'colour': 'red'}))), 1)
+        self.assertEqual(SessionStore(self.session_key)['colour'], 'red')
+
+    def test_unchanged_session_is_refreshed_after_the_interval(self):
+        later = time.time() + settings.SESSION_COOKIE_AGE * settings.SESSION_REFRESH_FRACTION
+        with mock.patch('board.sessions.time.time', return_value=later):
+            self.assertEqual(len(self.save_session()), 1)
+
+
+@override_settings(EVENTS_HEARTBEAT=0.05)
+class EventStreamTests(TestCase):
+    def setUp(self):
+        self.broker = events.InProcessBroker()
+        self.enterContext(mock.patch.object(events, '_broker', self.broker))
+
+    def read_after(self, channels, action):
+        """Subscribe to ``channels``, run ``action`` and return the stream's next event."""
+        async def read():
+            async with self.broker.subscribe(channels) as subscription:
+                chunks = events.stream(subscription)
+                self.assertEqual(await anext(chunks), 'retry: 3000\n\n')
+                await sync_to_async(action)()
+                return await anext(chunks)
+        return async_to_sync(read)()
+
+    def test_published_event_reaches_the_stream(self):
+        chunk = self.read_after(
+            [events.POSTS], lambda: events.publish(events.POSTS, 'post.created', {'id': 1}))
+        self.assertEqual(chunk, 'event: post.created\ndata: {"id": 1}\n\n')
+
+    def test_other_channels_are_not_streamed(self):
+        chunk = self.read_after(
+            [events.user_channel(1)],
+            lambda: events.publish(events.user_channel(2), 'message.created', {}))
+        self.assertEqual(chunk, ': keep-alive\n\n')
+
+    def test_new_posts_are_published_on_commit(self):
+        def create_post():
+            with self.captureOnCommitCallbacks(execute=True):
+                Post.objects.create(title='News', content='Content')
+
+        chunk = self.read_after([events.POSTS], create_post)
+        self.assertTrue(chunk.startswith('event: post.created\n'))
+        self.assertIn('"title": "News"', chunk)
+
+
+class SearchTests(TestCase):
+    def setUp(self):
+        self.alice = User.objects.create_user(username='alice', email='alice@example.com')
+        self.bob = User.objects.create_user(username='bob', email='bob@example.com')
+        self.carol = User.objects.create_user(username='carol', email='carol@example.com')
+        Post.objects.create(title='Weekend', content='I did some gardening', author=self.alice)
+        Post.objects.create(title='Gardening tips', content='Water early', author=self.bob)
+        Post.objects.create(title='Gardening offers', content='Buy now', author=self.bob,
+                            is_flagged=True)
+        Post.objects.create(title='Cooking', content='Pasta for dinner', author=self.carol)
+        PrivateMessage.objects.create(sender=self.alice, recipient=self.bob,
+                                      content='Secret garden plans')
+        PrivateMessage.objects.create(sender=self.carol, recipient=self.bob,
+                                      content='Dinner plans')
+
+    def titles(self, query):
+        return [post.title for post in search_posts(query)]
+
+    def test_title_matches_rank_first(self):
+        self.assertEqual(self.titles('gardening'), ['Gardening tips', 'Weekend'])
+
+    def test_words_match_as_prefixes(self):
+        self.assertEqual(self.titles('garden'), ['Gardening tips', 'Weekend'])
+        self.assertEqual(self.titles('past din'), ['Cooking'])
+        # Every word has to match
+        self.assertEqual(self.titles('garden pasta'), [])
+
+    def test_flagged_posts_are_not_found(self):
+        self.assertEqual(self.titles('offers'), [])
+
+    def test_messages_are_searched_only_in_the_users_conversations(self):
+        def contents(user):
+            return [message.content for message in search_messages(user, 'plans')]
+
+        self.assertEqual(contents(self.alice), ['Secret garden plans'])
+        self.assertEqual(contents(self.carol), ['Dinner plans'])
+        self.assertEqual(sorted(contents(self.bob)), ['Dinner plans', 'Secret garden plans'])
+
+        self.client.force_login(self.carol)
+        response = self.client.get(reverse('board:search'), {'q': 'plans', 'scope': 'messages'})
+        self.assertContains(response, 'Dinner')
+        self.assertNotContains(response, 'Secret')
@@ -0,0 +1,150 @@
+"""
+Rate limits for logins, posts and messages.
+
+Each limit is a sliding window per scope and key (client IP, the username
+being tried, or the logged-in user). The current and previous fixed windows
+are counted with atomic cache increments, and the previous one is weighted
+by how much of it still overlaps the sliding window. Counters live in the
+``THROTTLE_CACHE_ALIAS`` cache, which must be shared (Redis) for limits to
+hold across workers and dynos.
+
+Rates are set per ``'<scope>.<key>'`` in ``THROTTLE_RATES``, e.g.
+``'login.ip': '20/m'``.
+"""
+import asyncio
+import hashlib
+import logging
+import math
+import time
+from functools import wraps
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import caches
+from django.shortcuts import render
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+COUNTER_KEY = 'board:throttle:{scope}:{key}:{ident}:{window}'
+# Backends whose counters no other process can see
+UNSHARED_BACKENDS = {
+    'django.core.cache.backends.locmem.LocMemCache',
+    'django.core.cache.backends.dummy.DummyCache',
+}
+
+
+def check_shared_cache():
+    """
+    Log an error at startup if the limits can't hold across workers: with a
+    per-process cache each worker allows the full rate, and a dummy cache
+    allows everything. Development servers (DEBUG) are left alone.
+    """
+    backend = settings.CACHES[settings.THROTTLE_CACHE_ALIAS]['BACKEND']
+    if not settings.DEBUG and backend in UNSHARED_BACKENDS:
+        logger.error(
+            f"THROTTLE_CACHE_ALIAS {settings.THROTTLE_CACHE_ALIAS!r} uses {backend}, "
+            f"which is not shared between processes, so rate limits are not enforced "
+            f"across workers. Set REDIS_URL.")
+        return False
+    return True
+
+
+def parse_rate(rate):
+    """Turn ``'20/m'`` into ``(20, 60)``."""
+    count, period = rate.split('/')
+    return int(count), PERIODS[period[0]]
+
+
+def client_ip(request):
+    """
+    The client's address. Behind ``THROTTLE_PROXY_COUNT`` proxies (one for
+    the Heroku router) it is the entry they appended to X-Forwarded-For;
+    anything further left could be forged by the client.
+    """
+    proxies = settings.THROTTLE_PROXY_COUNT
+    forwarded = request.META.get('HTTP_X_FORWARDED_FOR')
+    if proxies and forwarded:
+        addresses = [address.strip() for address in forwarded.split(',')]
+        return addresses[-min(proxies, len(addresses))]
+    return request.META.get('REMOTE_ADDR', '')
+
+
+def request_ident(request, key):
+    if key == 'ip':
+        return client_ip(request)
+    if key == 'username':
+        return request.POST.get('username', '').casefold()
+    if key == 'user':
+        return str(request.user.pk) if request.user.is_authenticated else client_ip(request)
+    raise ValueError(f"Unknown throttle key {key!r}")
+
+
+def hit(scope, key, ident, rate):
+    """
+    Count one request and return how many seconds to wait before retrying,
+    or 0 if the request is within the limit.
+    """
+    limit, period = parse_rate(rate)
+    cache = caches[settings.THROTTLE_CACHE_ALIAS]
+    ident = hashlib.sha256(ident.encode()).hexdigest()[:32]
+    now = time.time()
+    window, into = divmod(now, period)
+
+    current_key = COUNTER_KEY.format(scope=scope, key=key, ident=ident, window=int(window))
+    previous_key = COUNTER_KEY.format(scope=scope, key=key, ident=ident, window=int(window) - 1)
+    # Rejected requests count too, so a client that keeps hammering stays blocked.
+    cache.add(current_key, 0, period * 2)
+    try:
+        current = cache.incr(current_key)
+    except ValueError:
+        # Expired between add() and incr()
+        cache.set(current_key, 1, period * 2)
+        current = 1
+    previous = cache.get(previous_key, 0)
+
+    if previous * (1 - into / period) + current <= limit:
+        return 0
+    return max(math.ceil(period - into), 1)
+
+
+def throttle(scope, key, methods=('POST',)):
+    """
+    Limit a view to ``THROTTLE_RATES['<scope>.<key>']`` requests per
+    ``key``: ``'ip'``, ``'username'`` (from the login form) or ``'user'``.
+
+    Only ``methods`` are counted, so showing a form is never throttled.
+    Requests over the limit get a 429 before the view runs. Works on sync
+    and async views.
+    """
+    def limit(request):
+        rate = settings.THROTTLE_RATES.get(f'{scope}.{key}')
+        if rate and request.method in methods:
+            retry_after = hit(scope, key, request_ident(request, key), rate)
+            if retry_after:
+                logger.warning(f"Throttled {scope} by {key} for {client_ip(request)}")
+                response = render(request, 'board/429.html',
+                                  {'retry_after': retry_after}, status=429)
+                response['Retry-After'] = str(retry_after)
+                return response
+        return None
+
+    def decorator(view_func):
+        if asyncio.iscoroutinefunction(view_func):
+            @wraps(view_func)
+            async def async_wrapper(request, *args, **kwargs):
+                # The cache and request.user are sync APIs
+                response = await sync_to_async(limit)(request)
+                if response is not None:
+                    return response
+                return await view_func(request, *args, **kwargs)
+            return async_wrapper
+
+        @wraps(view_func)
+        def wrapper(request, *args, **kwargs):
+            response = limit(request)
+            if response is not None:
+                return response
+            return view_func(request, *args, **kwargs)
+        return wrapper
+    return decorator
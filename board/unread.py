@@ -0,0 +1,95 @@
+"""
+Unread private message counts.
+
+Each ``ConversationMember`` counts the unread messages in its conversation
+and each ``UserProfile`` keeps the total, so the inbox badge comes from the
+profile that is already loaded with ``request.user``, with no COUNT(*) per
+page. The counters move with atomic F() updates as messages are sent, read
+and deleted. ``reconcile_unread_counts`` (the ``reconcile_unread`` command,
+run periodically) recounts them from the messages to correct any drift.
+"""
+import logging
+from functools import partial
+
+from django.db import transaction
+from django.db.models import Count, F, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce, Greatest
+from django.utils import timezone
+
+from .authentication import forget_user
+from .conditional import bump_on_commit, user_stamp
+from .models import ConversationMember, PrivateMessage, UserProfile
+
+logger = logging.getLogger(__name__)
+
+
+def adjust_unread(conversation_id, user_id, change):
+    """Add ``change`` (which may be negative) to a user's counters for one conversation."""
+    ConversationMember.objects.filter(conversation_id=conversation_id, user_id=user_id).update(
+        unread_count=Greatest(F('unread_count') + change, Value(0)))
+    UserProfile.objects.filter(user_id=user_id).update(
+        unread_messages=Greatest(F('unread_messages') + change, Value(0)))
+    # Show the new count on this process's next request rather than after
+    # the user cache times out
+    transaction.on_commit(partial(forget_user, user_id))
+    bump_on_commit(user_stamp(user_id))
+
+
+def message_sent(message):
+    if message.read_at is None:
+        adjust_unread(message.conversation_id, message.recipient_id, 1)
+
+
+def message_deleted(message):
+    if message.read_at is None and message.conversation_id:
+        adjust_unread(message.conversation_id, message.recipient_id, -1)
+
+
+def mark_conversation_read(member):
+    """
+    Mark every message ``member`` has received in the conversation as read,
+    with one UPDATE. Nothing is written when the counter says there are none.
+    """
+    if not member.unread_count:
+        return 0
+    now = timezone.now()
+    with transaction.atomic():
+        # Only rows this UPDATE flips are taken off the counters, so two
+        # tabs opening the conversation at once can't subtract twice.
+        marked = PrivateMessage.objects.filter(
+            conversation_id=member.conversation_id, recipient_id=member.user_id,
+            read_at__isnull=True,
+        ).update(read_at=now, updated_at=now)
+        if marked:
+            adjust_unread(member.conversation_id, member.user_id, -marked)
+    member.unread_count = 0
+    return marked
+
+
+def reconcile_unread_counts():
+    """
+    Recount every counter that disagrees with the messages. Returns how many
+    conversation and profile counters were corrected.
+    """
+    unread = PrivateMessage.objects.filter(read_at__isnull=True)
+    in_conversation = Coalesce(Subquery(
+        unread.filter(conversation=OuterRef('conversation'), recipient=OuterRef('user'))
+        .values('recipient').annotate(total=Count('id')).values('total')
+    ), Value(0))
+    for_user = Coalesce(Subquery(
+        unread.filter(recipient=OuterRef('user'))
+        .values('recipient').annotate(total=Count('id')).values('total')
+    ), Value(0))
+
+    with transaction.atomic():
+        members = ConversationMember.objects.exclude(unread_count=in_conversation).update(
+            unread_count=in_conversation)
+        drifted = list(UserProfile.objects.exclude(unread_messages=for_user)
+                       .values_list('user_id', flat=True))
+        profiles = UserProfile.objects.filter(user_id__in=drifted).update(
+            unread_messages=for_user)
+        bump_on_commit(*(user_stamp(user_id) for user_id in drifted))
+    if members or profiles:
+        logger.warning(f"Corrected {members} conversation and {profiles} "
+                       f"user unread counts.")
+    return members, profiles
@@ -5,7 +5,8 @@
 from django.contrib.auth import views as auth_views
 from django.urls import path
 
-from . import views
+from . import api, views
+from .events import event_stream
 from .views import ProfileSettingsView, UserLoginView, LogoutView, PrivateMessageView
 
 app_name = 'board'
@@ -27,7 +28,17 @@ urlpatterns = [
     path('increment_habit/<int:habit_id>/',
          views.increment_habit, name='increment_habit'),
     path('profile/<str:username>/', views.profile, name='profile'),
+    path('profile/<str:username>/posts/', views.profile_posts, name='profile_posts'),
+    path('profile/<str:username>/messages/', views.profile_messages,
+         name='profile_messages'),
+    path('profile/<str:username>/habits/', views.profile_habits, name='profile_habits'),
+    path('profile/<str:username>/flagged/', views.profile_flagged_posts,
+         name='profile_flagged_posts'),
     path('habit_insights/', views.habit_insights, name='habit_insights'),
+    path('habit_insights.json', views.habit_insights_json,
+         name='habit_insights_json'),
+    path('habit/<int:habit_id>/history.json', views.habit_history_json,
+         name='habit_history_json'),
 
 
 
@@ -42,6 +53,9 @@ urlpatterns = [
     path('logout/', LogoutView.as_view(), name='logout'),
     path('profile/<str:username>/', views.profile, name='profile'),
     path('messageboard/', views.message_board, name='message_board'),
+    path('search/', views.search, name='search'),
+    path('messageboard/cache_stats/', views.feed_cache_stats,
+         name='feed_cache_stats'),
     path('edit/<int:post_id>/', views.edit_post, name='edit_post'),
     path('delete/<int:post_id>/', views.delete_post, name='delete_post'),
     path('moderate/', views.moderate_posts, name='moderate_posts'),
@@ -60,6 +74,18 @@ urlpatterns = [
          views.delete_message, name='delete_message'),
     path('private_messages/', PrivateMessageView.as_view(),
          name='private_messages'),
+    path('events/', event_stream, name='events'),
+    path('conversation/<int:conversation_id>/',
+         views.conversation_detail, name='conversation'),
+    # JSON API for the PWA
+    path('api/posts/', api.posts, name='api_posts'),
+    path('api/posts/<int:post_id>/', api.post_detail, name='api_post'),
+    path('api/messages/', api.messages, name='api_messages'),
+    path('api/habits/', api.habits, name='api_habits'),
+    path('api/habits/<int:habit_id>/increment/', api.increment_habit,
+         name='api_increment_habit'),
+    path('api/todos/', api.todos, name='api_todos'),
+    path('api/todos/<int:todo_id>/', api.todo_detail, name='api_todo'),
     path('profile/<str:username>/settings/',
          ProfileSettingsView.as_view(), name='profile_settings'),
     path('password_reset/', auth_views.PasswordResetView.as_view(),
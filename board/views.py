@@ -1,31 +1,44 @@
-from datetime import datetime, timedelta
+import json
+from datetime import date, timedelta
+from asgiref.sync import sync_to_async
 from django.utils import timezone
-from django.db.models import Sum
 from django.db import transaction
 from django.shortcuts import get_object_or_404, redirect, render
 from django.db import IntegrityError
 from django.contrib.auth.decorators import login_required, user_passes_test
 from django.views import View
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.urls import reverse_lazy
 from django.contrib.auth.views import LoginView
 import logging
-import os
 from django.views.decorators.csrf import csrf_exempt
 from django.conf import settings
 from django.contrib import messages
 from django.contrib.auth import logout
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.core.mail import send_mail
-from django.core.paginator import Paginator
-from django.http import JsonResponse
+from django.http import HttpResponseForbidden, JsonResponse
 from django.urls import reverse
+from django.utils.http import urlencode
+from django.utils.decorators import method_decorator
 from django.views.generic.edit import UpdateView
-from .utils import send_fcm_notification
+from .authentication import forget_user
+from .conditional import POSTS, TODOS, conditional_page, habits_stamp
+from .feed_cache import get_feed_page, get_stats as get_feed_cache_stats
+from .habit_history import get_history as get_habit_history
+from .habits import PERIOD_STEP, reset_if_due, user_timezone
+from .insights import habit_insights as get_habit_insights, serialize_insight
+from .jobs import PRIORITY_LOW, enqueue
+from .moderation import get_banned_word_matcher
+from .notifications import notify_new_message
+from .pagination import CursorPaginator
+from .search import search_messages, search_posts
+from .tasks import send_post_notification
+from .throttling import throttle
+from .unread import mark_conversation_read
 
 from .models import (Post, PrivateMessage, UserProfile, Habit, FamilyToDoItem,
-                     SamsTodoItem, User, HabitProgress)
-from .forms import (CustomUserCreationForm, PostForm, PrivateMessageForm,
+                     SamsTodoItem, User, ConversationMember)
+from .forms import (CustomUserCreationForm, PostForm, PrivateMessageForm, ReplyForm,
                     UserProfileForm, SamsTodoForm, HabitForm, FamilyTodoForm)
 
 logger = logging.getLogger(__name__)
@@ -38,26 +51,9 @@ def custom_404(request, exception):
 def custom_500(request):
     return render(request, '500.html', status=500)
 
-def load_banned_words(file_path=None):
-    if not file_path:
-        file_path = os.path.join(settings.BASE_DIR, 'board', 'bad_words.txt')
-
-    try:
-        with open(file_path, "r") as file:
-            words = [word.strip().lower() for word in file.readlines()]
-            logger.info("Banned words loaded successfully.")
-            return words
-    except FileNotFoundError:
-        logger.error("Banned words file not found.")
-        return []
-
-
-BANNED_WORDS = load_banned_words()
-
-
 def contains_banned_words(content):
-    content_lower = content.lower()
-    return next((word for word in BANNED_WORDS if word in content_lower), None)
+    match = get_banned_word_matcher().search(content)
+    return match.word if match else None
 
 # Custom decorator to restrict actions to staff users
 
@@ -66,21 +62,43 @@ def staff_required(view_func):
     return user_passes_test(lambda u: u.is_staff, login_url='board:message_board')(view_func)
 
 
+# For async views, whose templates may touch the database
+arender = sync_to_async(render)
+
+
+async def aget_user(request):
+    """
+    Load request.user for an async view. The lazy user would query the
+    database on first use, which async code may not do directly.
+    """
+    request.user = await request.auser()
+    return request.user
+
+
 @csrf_exempt
 @login_required
-def subscribe(request):
+async def subscribe(request):
     if request.method != 'POST':
         return JsonResponse({'status': 'error', 'message': 'Invalid request method'}, status=400)
 
-    token = request.POST.get('token')
+    # base.html posts the token as JSON
+    if request.content_type == 'application/json':
+        try:
+            token = json.loads(request.body).get('token')
+        except (ValueError, AttributeError):
+            token = None
+    else:
+        token = request.POST.get('token')
     if not token:
         return JsonResponse({'status': 'error', 'message': 'Token missing'}, status=400)
 
+    user = await aget_user(request)
     try:
-        request.user.fcm_token = token  # Assuming 'fcm_token' is a field on the user model
-        request.user.save()
+        # Just the one column; a full save would rewrite the user and their profile
+        await User.objects.filter(id=user.id).aupdate(fcm_token=token)
     except IntegrityError:
         return JsonResponse({'status': 'error', 'message': 'Database update failed'}, status=500)
+    forget_user(user.id)
 
     return JsonResponse({'status': 'success'})
 
@@ -91,32 +109,45 @@ class LogoutView(LoginRequiredMixin, View):
         return redirect('board:welcome')
 
 
+def save_post(post):
+    # The notification job is only queued once the post is committed
+    with transaction.atomic():
+        post.save()
+        enqueue(send_post_notification, post.id, priority=PRIORITY_LOW)
+
+
+def publish_post(post):
+    """
+    Save a new post, or hold it for moderation if it contains a banned
+    word. Returns the banned word, or None once the post is published.
+    """
+    # Check if the author has a profile and is a trusted user
+    profile = getattr(post.author, 'userprofile', None)
+    post.is_moderated = bool(profile and profile.is_trusted_user)
+
+    if banned_word := contains_banned_words(post.content):
+        post.flag_for_moderation(banned_word)
+        return banned_word
+
+    save_post(post)
+    return None
+
+
 @login_required
-def create_post(request):
+@throttle('post', key='user')
+async def create_post(request):
+    user = await aget_user(request)
     if request.method == 'POST':
         form = PostForm(request.POST)
         if form.is_valid():
             post = form.save(commit=False)
-            post.author = request.user
+            post.author = user
 
-            # Check if the user has a profile and is a trusted user
-            if hasattr(request.user, 'userprofile') and request.user.userprofile.is_trusted_user:
-                post.is_moderated = True
-            else:
-                post.is_moderated = False
-
-            # Check if the content contains any banned words
-            if banned_word := contains_banned_words(post.content):
-                post.flag_for_moderation(banned_word)
+            if await sync_to_async(publish_post)(post):
                 messages.warning(
                     request, "Your post contains inappropriate content and has been flagged for moderation.")
                 return redirect('board:message_board')
 
-            # Use a transaction to ensure atomicity
-            with transaction.atomic():
-                post.save()
-                post.send_creation_notification()
-
             messages.success(
                 request, "Your post has been successfully published!")
             return redirect('board:message_board')
@@ -124,15 +155,14 @@ def create_post(request):
     else:
         form = PostForm()
 
-    return render(request, 'board/create_post.html', {'form': form})
+    return await arender(request, 'board/create_post.html', {'form': form})
 
 
 @staff_required
 def moderate_posts(request):
-    flagged_posts = Post.objects.filter(is_flagged=True, is_moderated=False)
-    paginator = Paginator(flagged_posts, 10)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    flagged_posts = Post.objects.filter(
+        is_flagged=True, is_moderated=False).select_related('author')
+    page_obj = CursorPaginator(flagged_posts, 10).get_page(request.GET.get('cursor'))
 
     return render(request, 'board/moderate_posts.html', {'page_obj': page_obj})
 
@@ -155,6 +185,7 @@ def reject_post(request, post_id):
     return redirect('board:moderate_posts')
 
 
+@conditional_page(anonymous_max_age=settings.WELCOME_CACHE_SECONDS)
 def welcome(request):
     context = {
         'firebase_config': settings.FIREBASE_CONFIG,
@@ -179,28 +210,14 @@ def register(request):
     return render(request, 'board/register.html', {'form': form})
 
 
-@login_required
-def profile(request, username):
-    user = get_object_or_404(User, username=username)
-    posts = Post.objects.filter(author=user)
-    private_messages = PrivateMessage.objects.filter(
-        recipient=user).order_by('-timestamp')
-    habits = Habit.objects.filter(user=user)
-
-    total_habits = habits.count()
-    completed_habits = habits.filter(completed=True).count()
-
-    # Calculate completion percentage
-    if total_habits > 0:
-        completion_rate = (completed_habits / total_habits) * 100
-    else:
-        completion_rate = 0
+PROFILE_SECTION_SIZE = 10
 
-    flagged_posts = []
 
-    if request.user.is_staff:
-        flagged_posts = Post.objects.filter(
-            is_flagged=True).order_by('-created_at')
+@login_required
+def profile(request, username):
+    # Only the header and habit summary are rendered here. Each section is a
+    # fragment below that the page fetches as it scrolls into view.
+    user = get_object_or_404(User.objects.select_related('userprofile'), username=username)
 
     if request.method == 'POST':
         form = UserProfileForm(request.POST, instance=user.userprofile)
@@ -211,31 +228,105 @@ def profile(request, username):
     else:
         form = UserProfileForm(instance=user.userprofile)
 
+    summary = Habit.objects.filter(user=user).aggregate(
+        total_habits=Count('id'),
+        completed_habits=Count('id', filter=Q(completed=True)),
+    )
+    if summary['total_habits'] > 0:
+        completion_rate = (summary['completed_habits'] / summary['total_habits']) * 100
+    else:
+        completion_rate = 0
+
     context = {
         'user_profile': user,
-        'posts': posts,
-        'private_messages': private_messages,
-        'habits': habits,
         'completion_rate': completion_rate,
-        'flagged_posts': flagged_posts,
         'is_staff': request.user.is_staff,
         'form': form,
+        **summary,
     }
 
     return render(request, 'board/profile.html', context)
 
 
+@login_required
+def profile_posts(request, username):
+    user = get_object_or_404(User, username=username)
+    posts = CursorPaginator(
+        Post.objects.filter(author=user), PROFILE_SECTION_SIZE
+    ).get_page(request.GET.get('cursor'))
+    return render(request, 'board/profile_posts.html', {'posts': posts})
+
+
+@login_required
+def profile_messages(request, username):
+    # A user's inbox is only shown to that user.
+    if username != request.user.username:
+        return HttpResponseForbidden()
+    private_messages = CursorPaginator(
+        PrivateMessage.objects.filter(recipient=request.user).select_related('sender'),
+        PROFILE_SECTION_SIZE, field='timestamp'
+    ).get_page(request.GET.get('cursor'))
+    return render(request, 'board/profile_messages.html',
+                  {'private_messages': private_messages})
+
+
+@login_required
+def profile_habits(request, username):
+    user = get_object_or_404(User, username=username)
+    habits = CursorPaginator(
+        Habit.objects.filter(user=user), PROFILE_SECTION_SIZE, field='start_date'
+    ).get_page(request.GET.get('cursor'))
+    return render(request, 'board/profile_habits.html', {
+        'habits': habits,
+        'is_owner': user.id == request.user.id,
+    })
+
+
+@staff_required
+def profile_flagged_posts(request, username):
+    flagged_posts = CursorPaginator(
+        Post.objects.filter(is_flagged=True).select_related('author'), PROFILE_SECTION_SIZE
+    ).get_page(request.GET.get('cursor'))
+    return render(request, 'board/profile_flagged_posts.html',
+                  {'flagged_posts': flagged_posts})
+
+
+SEARCH_PAGE_SIZE = 10
+
+
+@login_required
+def search(request):
+    query = request.GET.get('q', '').strip()
+    scope = 'messages' if request.GET.get('scope') == 'messages' else 'posts'
+    cursor = request.GET.get('cursor')
+    if scope == 'messages':
+        # Only the user's own conversations are searched
+        results = search_messages(request.user, query, cursor, SEARCH_PAGE_SIZE)
+    else:
+        results = search_posts(query, cursor, SEARCH_PAGE_SIZE)
+    return render(request, 'board/search.html', {
+        'query': query,
+        'scope': scope,
+        'results': results,
+        'pagination_query': urlencode({'q': query, 'scope': scope}),
+    })
+
 
 @login_required
+@conditional_page(POSTS)
 def message_board(request):
-    posts_list = Post.objects.filter(is_flagged=False).order_by('-created_at')
-    paginator = Paginator(posts_list, 5)
-    page_number = request.GET.get('page')
-    page_obj = paginator.get_page(page_number)
+    page_obj = get_feed_page(request.GET.get('cursor'))
 
     return render(request, 'board/message_board.html', {'page_obj': page_obj})
 
 
+@staff_required
+def feed_cache_stats(request):
+    return JsonResponse(get_feed_cache_stats())
+
+
+@method_decorator(throttle('login', key='ip'), name='post')
+@method_decorator(throttle('login', key='username'), name='post')
 class UserLoginView(LoginView):
     template_name = 'board/login.html'
     success_url = reverse_lazy('board:message_board')
@@ -279,30 +370,24 @@ def delete_post(request, post_id):
     return render(request, 'board/delete_post.html', {'post': post})
 
 
+def send_private_message(private_message):
+    with transaction.atomic():
+        private_message.save()
+        # Sent straight away or grouped into a digest, per the recipient's profile
+        notify_new_message(private_message)
+
+
 @login_required
-def create_message(request):
+@throttle('message', key='user')
+async def create_message(request):
+    user = await aget_user(request)
     if request.method == 'POST':
         form = PrivateMessageForm(request.POST)
-        if form.is_valid():
+        # Validating looks the recipient up
+        if await sync_to_async(form.is_valid)():
             private_message = form.save(commit=False)
-            private_message.sender = request.user
-            private_message.save()
-
-            recipient = private_message.recipient
-
-            if recipient.email_notifications:
-                send_mail(
-                    subject='New Private Message',
-                    message=f"You have a new private message from {
-                        private_message.sender.username}.",
-                    from_email=settings.DEFAULT_FROM_EMAIL,
-                    recipient_list=[recipient.email],
-                    fail_silently=False,
-                )
-
-            if recipient.fcm_token:
-                send_fcm_notification(
-                    recipient.fcm_token, private_message.sender.username)
+            private_message.sender = user
+            await sync_to_async(send_private_message)(private_message)
 
             messages.success(request, 'Your message has been sent!')
             return redirect('board:message_board')
@@ -312,7 +397,8 @@ def create_message(request):
     else:
         form = PrivateMessageForm()
 
-    return render(request, 'board/create_message.html', {'form': form})
+    # The recipient list is queried as the form renders
+    return await arender(request, 'board/create_message.html', {'form': form})
 
 
 @login_required
@@ -369,11 +455,11 @@ class ProfileSettingsView(LoginRequiredMixin, UpdateView):
 
 
 @login_required
+# Counts go back to zero as periods end, without anything being saved
+@conditional_page(habits_stamp, period=PERIOD_STEP)
 def habit_tracker(request):
-    habits = Habit.objects.filter(user=request.user)
-    
-    for habit in habits:
-        habit.reset_if_needed()
+    habits = list(Habit.objects.filter(user=request.user))
+    reset_if_due(request.user, habits)
 
     return render(request, 'board/habit_tracker.html', {'habits': habits})
 
@@ -407,12 +493,10 @@ def mark_habit_complete(request, habit_id):
 def increment_habit(request, habit_id):
     habit = get_object_or_404(Habit, id=habit_id, user=request.user)
 
-    # Increment the habit count
-    habit.increment_count()
-
-    # Log progress
-    HabitProgress.objects.create(
-        habit=habit, date=datetime.now().date(), count=habit.current_count)
+    # Clients that retry (the PWA on a flaky connection) send the same key
+    # again, so the click is only counted once.
+    key = request.headers.get('Idempotency-Key') or request.POST.get('idempotency_key')
+    habit.increment_count(idempotency_key=key[:64] if key else None)
 
     messages.success(request, f"You've completed {habit.name} {
                      habit.current_count}/{habit.target_count} times!")
@@ -422,49 +506,42 @@ def increment_habit(request, habit_id):
 
 
 @login_required
-def habit_insights(request):
-    habits = Habit.objects.filter(user=request.user)
-    today = timezone.now().date()
-
-    insights = []
-
-    for habit in habits:
-        daily_progress = HabitProgress.objects.filter(
-            habit=habit, date=today).aggregate(Sum('count'))['count__sum'] or 0
-        weekly_progress = HabitProgress.objects.filter(
-            habit=habit, date__gte=today - timedelta(weeks=1)).aggregate(Sum('count'))['count__sum'] or 0
-        monthly_progress = HabitProgress.objects.filter(
-            habit=habit, date__month=today.month, date__year=today.year).aggregate(Sum('count'))['count__sum'] or 0
-        annual_progress = HabitProgress.objects.filter(
-            habit=habit, date__year=today.year).aggregate(Sum('count'))['count__sum'] or 0
-
-        # Calculate progress percentage for the daily progress
-        if habit.target_count > 0:
-            daily_progress_percentage = (
-                daily_progress / habit.target_count) * 100
-        else:
-            daily_progress_percentage = 0
+def habit_history_json(request, habit_id):
+    habit = get_object_or_404(Habit, id=habit_id, user=request.user)
+
+    today = timezone.localtime(timezone.now(), user_timezone(request.user)).date()
+    try:
+        end = date.fromisoformat(request.GET['end']) if 'end' in request.GET else today
+        start = (date.fromisoformat(request.GET['start']) if 'start' in request.GET
+                 else end - timedelta(days=364))
+    except ValueError:
+        return JsonResponse({'status': 'error', 'message': 'Dates must be YYYY-MM-DD'}, status=400)
+    if not 0 <= (end - start).days < settings.HABIT_HISTORY_MAX_DAYS:
+        return JsonResponse({'status': 'error', 'message': 'Invalid date range'}, status=400)
+
+    return JsonResponse(get_habit_history(habit, start, end))
 
-        insights.append({
-            'habit': habit,
-            'daily_progress': daily_progress,
-            'weekly_progress': weekly_progress,
-            'monthly_progress': monthly_progress,
-            'annual_progress': annual_progress,
-            'daily_progress_percentage': daily_progress_percentage
-        })
 
+@login_required
+def habit_insights(request):
     context = {
-        'insights': insights
+        'insights': get_habit_insights(request.user)
     }
     return render(request, 'board/habit_insights.html', context)
 
 
+@login_required
+def habit_insights_json(request):
+    insights = get_habit_insights(request.user)
+    return JsonResponse({'habits': [serialize_insight(insight) for insight in insights]})
+
+
 def is_parent(user):
     return user.is_staff  # or any other condition that defines a parent
 
 
 @login_required
+@conditional_page(TODOS)
 def family_todo_list(request):
     todos = FamilyToDoItem.objects.filter(
         Q(assigned_to=request.user) | Q(assigned_to__isnull=True)
@@ -539,16 +616,67 @@ def complete_sams_todo(request, todo_id):
     return redirect('board:sams_todo_list')
 
 
+CONVERSATIONS_PER_PAGE = 10
+MESSAGES_PER_PAGE = 20
+
+
+def inbox_page(request):
+    """The user's conversations, most recently active first."""
+    conversations = ConversationMember.objects.filter(
+        user=request.user, last_message_at__isnull=False
+    ).select_related('other_user', 'conversation')
+    return CursorPaginator(conversations, CONVERSATIONS_PER_PAGE,
+                           field='last_message_at').get_page(request.GET.get('cursor'))
+
+
 class PrivateMessageView(LoginRequiredMixin, View):
     def get(self, request):
-        private_messages = PrivateMessage.objects.filter(
-            recipient=request.user).select_related('sender')
-        return render(request, 'board/private_messages.html', {'private_messages': private_messages})
+        page_obj = inbox_page(request)
+        return render(request, 'board/private_messages.html',
+                      {'conversations': page_obj, 'page_obj': page_obj})
+
+
+@login_required
+@throttle('message', key='user')
+def conversation_detail(request, conversation_id):
+    # Only members can open a conversation; anyone else gets a 404
+    member = get_object_or_404(
+        ConversationMember.objects.select_related('conversation', 'other_user'),
+        conversation_id=conversation_id, user=request.user)
+    conversation = member.conversation
+
+    if request.method == 'POST':
+        form = ReplyForm(request.POST)
+        if form.is_valid():
+            private_message = form.save(commit=False)
+            private_message.sender = request.user
+            private_message.recipient = member.other_user
+            private_message.conversation = conversation
+            send_private_message(private_message)
+            return redirect('board:conversation', conversation_id=conversation.id)
+    else:
+        form = ReplyForm()
+        mark_conversation_read(member)
+
+    history = CursorPaginator(
+        conversation.messages.select_related('sender'), MESSAGES_PER_PAGE, field='timestamp'
+    ).get_page(request.GET.get('cursor'))
+    return render(request, 'board/conversation.html', {
+        'conversation': conversation,
+        'other_user': member.other_user,
+        # Pages run newest first; show each one oldest first, like a chat
+        'history': reversed(history.object_list),
+        'page_obj': history,
+        'form': form,
+    })
+
 
 @login_required
-def view_message(request):
-    private_messages = PrivateMessage.objects.filter(recipient=request.user)
-    return render(request, 'board/private_messages.html', {'private_messages': private_messages})
+def view_message(request, message_id):
+    message = get_object_or_404(
+        PrivateMessage.objects.filter(Q(sender=request.user) | Q(recipient=request.user)),
+        id=message_id)
+    return redirect('board:conversation', conversation_id=message.conversation_id)
 
 
 @user_passes_test(lambda u: u.is_superuser)  # Only superusers can approve
@@ -567,6 +695,7 @@ def approve_users(request):
 
 
 @login_required
+@throttle('message', key='user')
 def reply_message(request, sender_id):
     sender = get_object_or_404(User, id=sender_id)
 
@@ -577,8 +706,8 @@ def reply_message(request, sender_id):
             private_message.sender = request.user
             private_message.recipient = sender
             private_message.save()
-            # Redirect back to the private messages page
-            return redirect('board:private_messages')
+            return redirect('board:conversation',
+                            conversation_id=private_message.conversation_id)
     else:
         form = PrivateMessageForm()
 
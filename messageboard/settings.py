@@ -66,6 +66,11 @@ if FIREBASE_PRIVATE_KEY := config('FIREBASE_PRIVATE_KEY', default=''):
 
 # FCM Server Key (also stored in the environment)
 FCM_SERVER_KEY = config('FCM_SERVER_KEY', default='')
+FCM_URL = config('FCM_URL', default='https://fcm.googleapis.com/fcm/send')
+FCM_TIMEOUT = 10  # seconds
+FCM_MAX_RETRIES = 3
+FCM_RETRY_BACKOFF = 0.5  # seconds before the first retry, doubled each time
+FCM_POOL_SIZE = 10  # kept-alive connections per worker process
 
 WSGI_APPLICATION = "messageboard.wsgi.application"
 
@@ -106,9 +111,69 @@ PWA_APP_SPLASH_SCREEN = [
 PWA_APP_DIR = 'ltr'
 PWA_APP_LANG = 'en-US'
 
+# Seconds rendered feed pages and post cards stay cached (see board/feed_cache.py)
+FEED_CACHE_TIMEOUT = 3600
+# Habit history charts (see board/habit_history.py)
+HABIT_HISTORY_CACHE_TIMEOUT = 24 * 3600
+HABIT_HISTORY_MAX_DAYS = 10 * 366
+
+# Caches. Set REDIS_URL to share one cache between workers; without it each
+# process has its own. Cached data is invalidated from transaction.on_commit,
+# since invalidating before the commit lets a concurrent request cache the old
+# rows again. A per-process cache would only be invalidated on the worker that
+# made the change, so the caches below that rely on it are off without Redis.
+REDIS_URL = config('REDIS_URL', default='')
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    # A per-process cache would serve stale sessions, so sessions only use
+    # the cache when it is shared.
+    'sessions': {
+        'BACKEND': 'django.core.cache.backends.dummy.DummyCache',
+    },
+}
+if REDIS_URL:
+    CACHES['default'] = CACHES['sessions'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': REDIS_URL,
+    }
+
+# Real-time events (board/events.py). The in-process broker only reaches
+# streams on the worker that published; Redis reaches every worker.
+EVENTS_BROKER = ('board.events.RedisBroker' if REDIS_URL
+                 else 'board.events.InProcessBroker')
+# Seconds between keep-alives, inside the Heroku router's 55 s idle timeout
+EVENTS_HEARTBEAT = 20
+# Streams close after this many seconds and the browser reconnects
+EVENTS_MAX_STREAM = 600
+# Events queued for a slow stream before it is closed
+EVENTS_QUEUE_SIZE = 100
+
+# PostgreSQL text search configuration for board/search.py
+SEARCH_CONFIG = 'english'
+
+# Cache the rendered feed (see board/feed_cache.py)
+FEED_CACHE = bool(REDIS_URL)
+# Likewise for habit history charts (see board/habit_history.py)
+HABIT_HISTORY_CACHE = bool(REDIS_URL)
+# Conditional GET for HTML pages (see board/conditional.py), with the version
+# stamps kept in the default cache
+CONDITIONAL_PAGES = bool(REDIS_URL)
+# Part of every page ETag, so a deploy re-renders pages browsers have cached.
+# Heroku sets it with runtime dyno metadata enabled.
+RELEASE_VERSION = config('HEROKU_RELEASE_VERSION', default='')
+# Seconds browsers and shared caches may reuse the welcome page for anonymous visitors
+WELCOME_CACHE_SECONDS = 300
+
 # Sessions
+SESSION_ENGINE = 'board.sessions'
+SESSION_CACHE_ALIAS = 'sessions'
 SESSION_COOKIE_AGE = 1200  # 20 minutes
 SESSION_SAVE_EVERY_REQUEST = True
+# An unchanged session is written back at most once per this fraction of
+# SESSION_COOKIE_AGE (see board/sessions.py)
+SESSION_REFRESH_FRACTION = 0.1
 # Load secret key from environment variables
 SECRET_KEY = config('SECRET_KEY')
 DEBUG = config('DEBUG', default=False, cast=bool)
@@ -144,12 +209,45 @@ EMAIL_HOST_USER = config(
 EMAIL_HOST_PASSWORD = config('EMAIL_HOST_PASSWORD')
 DEFAULT_FROM_EMAIL = 'noreplyaccactivate@thepinkbook.com.au'
 MODERATOR_EMAIL = 'moderator@thepinkbook.com.au'
+# New-post emails sent per job, all over one SMTP connection
+NOTIFICATION_BATCH_SIZE = 500
+# Seconds notifications are collected before a digest goes out
+NOTIFICATION_DIGEST_WINDOW = 600
+# Send moderators one digest of flagged posts per window instead of an email each
+MODERATOR_ALERT_DIGEST = True
+
+# Background jobs (see board/jobs.py and the run_worker command)
+JOB_MAX_ATTEMPTS = 5
+JOB_RETRY_BACKOFF = 30  # seconds before the first retry, doubled each time
+JOB_RETRY_BACKOFF_MAX = 3600
+JOB_LOCK_TIMEOUT = 600  # seconds before a running job is presumed lost
+
+# Banned word list
+# Seconds a worker trusts its cached list version before re-checking the
+# database. Changes show up immediately when CACHES is shared between workers.
+BANNED_WORDS_VERSION_TTL = 10
 
 # Authentication settings
 AUTHENTICATION_BACKENDS = [
     'board.authentication.ApprovedUserBackend',  # Add your custom backend
     'django.contrib.auth.backends.ModelBackend',  # Fallback to default
 ]
+# Seconds each process reuses a loaded request.user and profile. Saves in the
+# same process evict it immediately (see board/authentication.py).
+AUTH_USER_CACHE_TTL = 5
+
+# Rate limits per '<scope>.<key>' (see board/throttling.py). Counters are kept
+# in THROTTLE_CACHE_ALIAS, which needs REDIS_URL to be shared between workers;
+# without it an error is logged at startup unless DEBUG is on.
+THROTTLE_RATES = {
+    'login.ip': '20/m',
+    'login.username': '5/m',
+    'post.user': '5/m',
+    'message.user': '10/m',
+}
+THROTTLE_CACHE_ALIAS = 'default'
+# Proxies in front of the app that append to X-Forwarded-For (the Heroku router)
+THROTTLE_PROXY_COUNT = 1
 
 LOGIN_URL = '/login/'
 LOGIN_REDIRECT_URL = '/message_board/'